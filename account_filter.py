@@ -0,0 +1,254 @@
+"""
+Filtro de contas conhecidas: recusa sem ir ao banco as buscas de contas que não existem.
+
+Cada processo guarda um filtro de Bloom com as chaves (platform_canonical, email_norm)
+de `streaming_accounts` e um cache curto (ACCOUNT_MISS_TTL) das contas
+que o banco acabou de dizer que não existem. Tráfego de força bruta e de erro de
+digitação cai quase todo no filtro; só os falsos positivos (ACCOUNT_FILTER_FP_RATE)
+chegam ao SELECT da conta.
+
+Toda gravação em streaming_accounts soma 1 em `account_changes.generation` (na
+mesma transação). Uma thread por processo confere a geração a cada
+ACCOUNT_FILTER_CHECK_SECONDS; se mudou, o filtro é descartado (as buscas vão ao
+banco, como sem filtro) e reconstruído. Também é reconstruído a cada
+ACCOUNT_FILTER_REBUILD_SECONDS, para limpar contas removidas e pegar alterações
+feitas direto no banco (essas só valem depois da reconstrução).
+
+Recusar é só memória (nem o SELECT da geração). Conta criada por outro worker só chega
+a este na próxima conferência da thread: nesse intervalo (até ACCOUNT_FILTER_CHECK_SECONDS)
+ela ainda pode ser recusada; a criada no próprio processo vale na hora (`added`). Se a
+última conferência passar de ACCOUNT_FILTER_MAX_AGE_SECONDS (banco fora, thread atrasada),
+o filtro deixa de recusar e as buscas vão ao banco até a próxima conferência.
+
+Uso:
+    if not account_filter.may_exist(service, email):
+        return None  # não existe
+    generation = account_filter.generation()
+    ...  # SELECT; se não achou:
+    account_filter.remember_miss(service, email, generation)
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+import account_search
+import db
+
+ACCOUNT_FILTER = os.environ.get("ACCOUNT_FILTER", "1").lower() not in {"0", "false", "no", ""}
+ACCOUNT_FILTER_FP_RATE = float(os.environ.get("ACCOUNT_FILTER_FP_RATE", "0.001"))
+ACCOUNT_FILTER_CHECK_SECONDS = float(os.environ.get("ACCOUNT_FILTER_CHECK_SECONDS", "2"))
+ACCOUNT_FILTER_REBUILD_SECONDS = float(os.environ.get("ACCOUNT_FILTER_REBUILD_SECONDS", "600"))
+# Conferência da geração mais velha que isso: o filtro não recusa (as buscas vão ao banco)
+ACCOUNT_FILTER_MAX_AGE_SECONDS = float(os.environ.get("ACCOUNT_FILTER_MAX_AGE_SECONDS", "10"))
+# Cache de "conta não existe" (por processo)
+ACCOUNT_MISS_TTL = float(os.environ.get("ACCOUNT_MISS_TTL", "60"))
+ACCOUNT_MISS_MAX = int(os.environ.get("ACCOUNT_MISS_MAX", "10000"))
+
+# Folga para as contas criadas até a próxima reconstrução
+_HEADROOM = 1.25
+_MIN_CAPACITY = 1024
+
+class BloomFilter:
+    """Filtro de Bloom em bytearray; k posições por hashing duplo de um blake2b de 128 bits."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(1, capacity)
+        self.m = max(64, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / self.capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def fp_rate(self) -> float:
+        """Taxa de falsos positivos esperada com as chaves já inseridas."""
+        return (1.0 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+def _key(service: str, email: str) -> str:
+    return "|".join(account_search.account_key(service, email))
+
+_lock = threading.Lock()
+_bloom: Optional[BloomFilter] = None
+_generation: Optional[int] = None
+_built_at = 0.0
+_checked_at = 0.0
+_build_seconds = 0.0
+_misses: "OrderedDict[str, float]" = OrderedDict()
+_thread_pid: Optional[int] = None
+_stats = {"rejected": 0, "negative_hits": 0, "passed": 0, "bypassed": 0, "false_positives": 0,
+          "stale": 0, "rebuilds": 0, "failed": 0}
+
+# -----------------------------------------------------------------------------
+# Consulta (só memória: pode ser chamada do loop asyncio)
+# -----------------------------------------------------------------------------
+def _ensure_thread() -> None:
+    global _thread_pid
+    if _thread_pid != os.getpid():
+        with _lock:
+            # Depois de um fork o processo filho precisa da própria thread
+            if _thread_pid != os.getpid():
+                threading.Thread(target=_refresh_loop, name="account-filter", daemon=True).start()
+                _thread_pid = os.getpid()
+
+def may_exist(service: str, email: str) -> bool:
+    """False só quando a conta com certeza não existe (filtro ou cache de ausentes)."""
+    if not ACCOUNT_FILTER:
+        return True
+    _ensure_thread()
+    key = _key(service, email)
+    with _lock:
+        if _bloom is None:
+            # Ainda construindo (ou geração nova): quem responde é o banco
+            _stats["bypassed"] += 1
+            return True
+        if time.monotonic() - _checked_at > ACCOUNT_FILTER_MAX_AGE_SECONDS:
+            # Geração não conferida há muito: podem faltar contas gravadas por outros workers
+            _stats["stale"] += 1
+            return True
+        expires = _misses.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                _stats["negative_hits"] += 1
+                return False
+            del _misses[key]
+        if key not in _bloom:
+            _stats["rejected"] += 1
+            return False
+        _stats["passed"] += 1
+        return True
+
+def generation() -> Optional[int]:
+    """Geração do filtro atual; vai no remember_miss() da mesma busca."""
+    return _generation
+
+def remember_miss(service: str, email: str, generation: Optional[int]) -> None:
+    """Guarda que a conta não existe (se nenhuma gravação mudou a geração desde a consulta)."""
+    if not ACCOUNT_FILTER or ACCOUNT_MISS_TTL <= 0:
+        return
+    key = _key(service, email)
+    with _lock:
+        if _bloom is not None and key in _bloom:
+            _stats["false_positives"] += 1
+        if generation is None or generation != _generation:
+            return
+        _misses[key] = time.monotonic() + ACCOUNT_MISS_TTL
+        _misses.move_to_end(key)
+        while len(_misses) > ACCOUNT_MISS_MAX:
+            _misses.popitem(last=False)
+
+# -----------------------------------------------------------------------------
+# Gravações (rotas do admin, importação)
+# -----------------------------------------------------------------------------
+def changed(conn) -> None:
+    """Soma 1 na geração das contas; chame na transação que grava em streaming_accounts."""
+    conn.execute(
+        text("UPDATE account_changes SET generation = generation + 1, changed_at = :now WHERE id = 1"),
+        {"now": datetime.utcnow()},
+    )
+
+def added(service: str, email: str) -> None:
+    """
+    Conta criada/editada neste processo: vale na hora, sem esperar a reconstrução.
+    Remoção não precisa: o filtro de Bloom não tira chaves (a reconstrução limpa).
+    """
+    key = _key(service, email)
+    with _lock:
+        _misses.pop(key, None)
+        if _bloom is not None:
+            _bloom.add(key)
+
+# -----------------------------------------------------------------------------
+# Reconstrução (thread por processo)
+# -----------------------------------------------------------------------------
+def _current_generation() -> int:
+    with db.get_engine().connect() as conn:
+        return conn.execute(text("SELECT generation FROM account_changes WHERE id = 1")).scalar() or 0
+
+def _build() -> BloomFilter:
+    engine = db.get_engine()
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT count(*) FROM streaming_accounts")).scalar() or 0
+        bloom = BloomFilter(max(_MIN_CAPACITY, int(total * _HEADROOM)), ACCOUNT_FILTER_FP_RATE)
+        rows = conn.execution_options(stream_results=True, yield_per=2000).execute(
+            text("SELECT platform_canonical, email_norm FROM streaming_accounts")
+        )
+        for platform, email_norm in rows:
+            bloom.add(f"{platform}|{email_norm}")
+    return bloom
+
+def _refresh() -> None:
+    global _bloom, _generation, _built_at, _build_seconds, _checked_at
+    current = _current_generation()
+    with _lock:
+        _checked_at = time.monotonic()
+        stale = current != _generation
+        if stale:
+            # Outra gravação: o filtro e os ausentes podem estar errados até reconstruir
+            _bloom = None
+            _misses.clear()
+        due = (stale or _bloom is None or time.monotonic() - _built_at >= ACCOUNT_FILTER_REBUILD_SECONDS
+               or _bloom.count > _bloom.capacity)
+    if not due:
+        return
+    # A geração é lida antes da varredura: gravação no meio muda a geração e refaz na volta seguinte
+    started = time.monotonic()
+    bloom = _build()
+    with _lock:
+        _bloom, _generation = bloom, current
+        _built_at = time.monotonic()
+        _build_seconds = _built_at - started
+        _stats["rebuilds"] += 1
+
+def _refresh_loop() -> None:
+    while True:
+        try:
+            _refresh()
+        except Exception as e:
+            print("ERRO NO FILTRO DE CONTAS:", repr(e))
+            with _lock:
+                _stats["failed"] += 1
+        time.sleep(ACCOUNT_FILTER_CHECK_SECONDS)
+
+def stats() -> dict:
+    """Contadores deste processo, memória do filtro e taxa de falsos positivos (esperada e medida)."""
+    with _lock:
+        out = dict(_stats)
+        out["enabled"] = ACCOUNT_FILTER
+        out["ready"] = _bloom is not None
+        out["generation"] = _generation
+        out["negative_cache_size"] = len(_misses)
+        out["checked_seconds_ago"] = round(time.monotonic() - _checked_at, 1) if _checked_at else None
+        if _bloom is not None:
+            out.update({
+                "keys": _bloom.count,
+                "capacity": _bloom.capacity,
+                "bits": _bloom.m,
+                "hashes": _bloom.k,
+                "memory_bytes": len(_bloom.bits),
+                "expected_fp_rate": round(_bloom.fp_rate(), 6),
+                "age_seconds": round(time.monotonic() - _built_at, 1),
+                "build_seconds": round(_build_seconds, 3),
+            })
+    # Medida: entre as buscas de contas que não existem, quantas o filtro deixou passar
+    absent = out["rejected"] + out["false_positives"]
+    out["observed_fp_rate"] = round(out["false_positives"] / absent, 6) if absent else None
+    return out
@@ -0,0 +1,193 @@
+"""
+Importação e exportação em lote de contas (CSV / JSONL) para o admin.
+
+Importação: lê o arquivo em streaming, canonicaliza a plataforma como o
+accounts_create, cifra as senhas no próprio processo (sem fork do servidor, que tem
+threads) e grava em lotes com INSERT ... ON CONFLICT (platform_canonical, email_norm)
+DO UPDATE. Erros são informados por linha, sem interromper o restante.
+
+Exportação: percorre a tabela com cursor do lado do servidor (stream_results) e
+gera o arquivo aos poucos; a senha decifrada só sai se for pedida.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Callable, IO, Iterator
+
+from cryptography.fernet import Fernet
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+import account_filter
+import account_search
+import services
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+# Quantos erros de linha são devolvidos no relatório (o total é sempre contado)
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "100"))
+EXPORT_FETCH_SIZE = 1000
+
+# -----------------------------------------------------------------------------
+# Importação
+# -----------------------------------------------------------------------------
+class _RawReader(io.RawIOBase):
+    """Stream que só tem read(n) (ex.: wsgi.input do gunicorn) visto como io.RawIOBase."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def _buffered(stream) -> IO[bytes]:
+    """
+    Stream binário com buffer, como o TextIOWrapper espera: arquivos e BytesIO passam
+    direto; streams crus (LimitedStream do Werkzeug, wsgi.input) ganham um BufferedReader.
+    """
+    if hasattr(stream, "read1") and hasattr(stream, "readable") and stream.readable():
+        return stream
+    if not isinstance(stream, io.RawIOBase):
+        stream = _RawReader(stream)
+    return io.BufferedReader(stream)
+
+def _read_records(stream: IO[bytes], fmt: str) -> Iterator[tuple[int, dict]]:
+    """(nº da linha, registro) sem carregar o arquivo inteiro; registro inválido vem com "_error"."""
+    textio = io.TextIOWrapper(_buffered(stream), encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(textio)
+        for record in reader:
+            yield reader.line_num, {k.strip().lower(): (v or "") for k, v in record.items() if k}
+        return
+    for line_no, line in enumerate(textio, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, {"_error": f"JSON inválido: {e}"}
+            continue
+        if not isinstance(record, dict):
+            yield line_no, {"_error": "cada linha deve ser um objeto JSON"}
+            continue
+        yield line_no, {k.lower(): ("" if v is None else str(v)) for k, v in record.items()}
+
+def _validate(record: dict) -> tuple[dict, str]:
+    if "_error" in record:
+        return {}, record["_error"]
+    email = (record.get("email") or "").strip()
+    platform, email_norm = account_search.account_key(record.get("platform", ""), email)
+    password = (record.get("password") or "").strip()
+    if platform not in services.SERVICES:
+        return {}, f"plataforma inválida: {record.get('platform', '')!r}"
+    if "@" not in email:
+        return {}, f"e-mail inválido: {email!r}"
+    if not password:
+        return {}, "senha vazia"
+    return {"p": platform, "e": email, "en": email_norm, "pw": password, "n": (record.get("notes") or "").strip()}, ""
+
+def _write_batch(engine: Engine, rows: list[dict]) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO streaming_accounts
+                    (platform, platform_canonical, email, email_norm, password_enc, password_verifier, notes, created_at)
+                VALUES (:p, :p, :e, :en, :enc, :pv, :n, :ts)
+                ON CONFLICT (platform_canonical, email_norm) DO UPDATE SET
+                    password_enc = excluded.password_enc,
+                    password_verifier = excluded.password_verifier,
+                    notes = excluded.notes
+            """),
+            rows,
+        )
+        account_filter.changed(conn)
+
+def import_accounts(
+    engine: Engine,
+    stream: IO[bytes],
+    fmt: str,
+    fernet_key: str,
+    verifier: Callable[[str, str, str], str],
+) -> dict:
+    """
+    Importa contas de `stream` (csv ou jsonl, colunas platform,email,password,notes).
+    Retorna {"written": n, "error_count": n, "errors": [(linha, mensagem), ...]}.
+    """
+    report = {"written": 0, "error_count": 0, "errors": []}
+
+    def error(line_no: int, msg: str) -> None:
+        report["error_count"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append((line_no, msg))
+
+    def batches() -> Iterator[list[dict]]:
+        batch: dict[tuple[str, str], dict] = {}
+        for line_no, record in _read_records(stream, fmt):
+            row, msg = _validate(record)
+            if msg:
+                error(line_no, msg)
+                continue
+            # Repetida no mesmo lote: vale a última (um único upsert por chave)
+            batch[(row["p"], row["en"])] = row
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                yield list(batch.values())
+                batch = {}
+        if batch:
+            yield list(batch.values())
+
+    cipher = Fernet(fernet_key)
+    for rows in batches():
+        now = datetime.utcnow()
+        for row in rows:
+            password = row.pop("pw")
+            row.update(enc=cipher.encrypt(password.encode()).decode(), pv=verifier(row["p"], row["en"], password), ts=now)
+        _write_batch(engine, rows)
+        report["written"] += len(rows)
+    return report
+
+# -----------------------------------------------------------------------------
+# Exportação
+# -----------------------------------------------------------------------------
+def export_accounts(engine: Engine, fmt: str, decrypt: Callable[[str], str] = None) -> Iterator[str]:
+    """
+    Gera o arquivo (csv ou jsonl) em pedaços. Com `decrypt`, inclui a coluna
+    "password" com a senha decifrada.
+    """
+    columns = ["id", "platform", "email"] + (["password"] if decrypt else []) + ["notes", "created_at"]
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore")
+    if fmt == "csv":
+        writer.writeheader()
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_FETCH_SIZE).execute(
+            text("""
+                SELECT id, platform, email, password_enc, notes, created_at
+                FROM streaming_accounts
+                ORDER BY id
+            """)
+        ).mappings()
+        for part in result.partitions():
+            for r in part:
+                item = {
+                    "id": r["id"],
+                    "platform": r["platform"],
+                    "email": r["email"],
+                    "notes": r["notes"] or "",
+                    "created_at": str(r["created_at"]),
+                }
+                if decrypt:
+                    item["password"] = decrypt(r["password_enc"])
+                if fmt == "csv":
+                    writer.writerow(item)
+                else:
+                    buf.write(json.dumps({c: item[c] for c in columns}, ensure_ascii=False) + "\n")
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
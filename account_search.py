@@ -0,0 +1,288 @@
+"""
+Busca de contas do admin (/accounts) com índice, em Postgres e SQLite.
+
+- `email_norm` = lower(trim(email)), com índice próprio (igualdade / prefixo);
+- Postgres: índices GIN de trigramas (pg_trgm) em email_norm e lower(notes), que
+  atendem LIKE '%trecho%';
+- SQLite: tabela FTS5 com tokenizer trigram (mantida por triggers), que também
+  atende LIKE '%trecho%'.
+
+O app usa só `search_filter(...)`, que devolve o mesmo WHERE (com parâmetros) para a
+listagem e para a contagem, qualquer que seja o banco. A listagem pagina por
+cursor sobre (created_at, id) e o total sem filtro é estimado (`count`).
+"""
+import base64
+import json
+import os
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+import services
+
+# Com filtro, o total exibido é contado só até aqui (o restante aparece como "mais de")
+ACCOUNTS_COUNT_CAP = int(os.environ.get("ACCOUNTS_COUNT_CAP", "1000"))
+
+_FTS_TABLE = "streaming_accounts_fts"
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+def canonical_platform(platform: str) -> str:
+    """`platform_canonical`: nome canônico do serviço (aliases incluídos); fora do registro, em minúsculas."""
+    name = (platform or "").strip().lower()
+    return services.canonical(name) or name
+
+def account_key(platform: str, email: str) -> tuple[str, str]:
+    """(platform_canonical, email_norm): chave única da conta, usada na gravação e na busca pública."""
+    return canonical_platform(platform), normalize_email(email)
+
+def _like_pattern(term: str) -> str:
+    term = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{term}%"
+
+# -----------------------------------------------------------------------------
+# Schema (chamado pelo ensure_schema do app)
+# -----------------------------------------------------------------------------
+def ensure_schema(conn: Connection) -> None:
+    if "email_norm" not in {c["name"] for c in inspect(conn).get_columns("streaming_accounts")}:
+        conn.execute(text("ALTER TABLE streaming_accounts ADD COLUMN email_norm TEXT"))
+    conn.execute(text(
+        "UPDATE streaming_accounts SET email_norm = lower(trim(email)) WHERE email_norm IS NULL"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_streaming_accounts_email_norm ON streaming_accounts (email_norm)"
+    ))
+    # Paginação por cursor: ORDER BY created_at DESC, id DESC
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_streaming_accounts_created ON streaming_accounts (created_at, id)"
+    ))
+    if conn.dialect.name == "sqlite":
+        _ensure_sqlite_fts(conn)
+        _ensure_sqlite_counter(conn)
+    elif conn.dialect.name == "postgresql":
+        _ensure_pg_trgm(conn)
+
+def _ensure_pg_trgm(conn: Connection) -> None:
+    try:
+        # Savepoint: sem permissão para a extensão, segue só com o índice btree
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        print("AVISO: pg_trgm indisponível, busca sem índice de trigramas:", repr(e))
+        return
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_streaming_accounts_email_trgm "
+        "ON streaming_accounts USING gin (email_norm gin_trgm_ops)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_streaming_accounts_notes_trgm "
+        "ON streaming_accounts USING gin (lower(notes) gin_trgm_ops)"
+    ))
+
+def _ensure_sqlite_fts(conn: Connection) -> None:
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": _FTS_TABLE}
+    ).first()
+    if exists:
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(text(f"""
+                CREATE VIRTUAL TABLE {_FTS_TABLE} USING fts5(
+                    email_norm, notes,
+                    content='streaming_accounts', content_rowid='id', tokenize='trigram'
+                )
+            """))
+    except Exception as e:
+        # SQLite < 3.34 (sem tokenizer trigram)
+        print("AVISO: FTS5 trigram indisponível, busca sem índice de texto:", repr(e))
+        return
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS streaming_accounts_fts_ai AFTER INSERT ON streaming_accounts BEGIN
+            INSERT INTO {_FTS_TABLE} (rowid, email_norm, notes) VALUES (new.id, new.email_norm, new.notes);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS streaming_accounts_fts_ad AFTER DELETE ON streaming_accounts BEGIN
+            INSERT INTO {_FTS_TABLE} ({_FTS_TABLE}, rowid, email_norm, notes)
+            VALUES ('delete', old.id, old.email_norm, old.notes);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS streaming_accounts_fts_au AFTER UPDATE ON streaming_accounts BEGIN
+            INSERT INTO {_FTS_TABLE} ({_FTS_TABLE}, rowid, email_norm, notes)
+            VALUES ('delete', old.id, old.email_norm, old.notes);
+            INSERT INTO {_FTS_TABLE} (rowid, email_norm, notes) VALUES (new.id, new.email_norm, new.notes);
+        END
+    """))
+    # Indexa as linhas que já existiam
+    conn.execute(text(f"INSERT INTO {_FTS_TABLE} ({_FTS_TABLE}) VALUES ('rebuild')"))
+
+def _ensure_sqlite_counter(conn: Connection) -> None:
+    """Contador de linhas mantido por trigger (o SQLite não tem estatística barata de COUNT)."""
+    conn.execute(text("CREATE TABLE IF NOT EXISTS table_counts (name TEXT PRIMARY KEY, n INTEGER NOT NULL)"))
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'streaming_accounts_count_ai'")
+    ).first()
+    if exists:
+        return
+    conn.execute(text("""
+        CREATE TRIGGER streaming_accounts_count_ai AFTER INSERT ON streaming_accounts BEGIN
+            UPDATE table_counts SET n = n + 1 WHERE name = 'streaming_accounts';
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER streaming_accounts_count_ad AFTER DELETE ON streaming_accounts BEGIN
+            UPDATE table_counts SET n = n - 1 WHERE name = 'streaming_accounts';
+        END
+    """))
+    conn.execute(text("""
+        INSERT OR REPLACE INTO table_counts (name, n)
+        SELECT 'streaming_accounts', COUNT(1) FROM streaming_accounts
+    """))
+
+_fts_cache: dict[str, bool] = {}
+
+def _has_fts(conn: Connection) -> bool:
+    url = str(conn.engine.url)
+    if url not in _fts_cache:
+        _fts_cache[url] = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": _FTS_TABLE}
+        ).first() is not None
+    return _fts_cache[url]
+
+# -----------------------------------------------------------------------------
+# Consulta
+# -----------------------------------------------------------------------------
+def search_filter(
+    conn: Connection,
+    q: str = "",
+    platform: str = "",
+    notes: str = "",
+) -> tuple[str, dict]:
+    """
+    ("WHERE ..." ou "", parâmetros) para filtrar streaming_accounts por trecho do
+    e-mail, plataforma (com aliases) e trecho das observações.
+    """
+    clauses, params = [], {}
+    use_fts = conn.dialect.name == "sqlite" and _has_fts(conn)
+
+    q = normalize_email(q)
+    if q:
+        params["q"] = _like_pattern(q)
+        clauses.append("email_norm LIKE :q ESCAPE '\\'")
+        if use_fts and len(q) >= 3:
+            # O FTS5 não aceita ESCAPE: pré-filtra pelo índice (superconjunto) e o LIKE acima confirma
+            params["q_fts"] = f"%{q}%"
+            clauses.append(f"id IN (SELECT rowid FROM {_FTS_TABLE} WHERE email_norm LIKE :q_fts)")
+
+    platform = canonical_platform(platform)
+    if platform:
+        params["p"] = platform
+        clauses.append("platform_canonical = :p")
+
+    notes = (notes or "").strip().lower()
+    if notes:
+        params["n"] = _like_pattern(notes)
+        clauses.append("lower(notes) LIKE :n ESCAPE '\\'")
+        if use_fts and len(notes) >= 3:
+            params["n_fts"] = f"%{notes}%"
+            clauses.append(f"id IN (SELECT rowid FROM {_FTS_TABLE} WHERE notes LIKE :n_fts)")
+
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+# -----------------------------------------------------------------------------
+# Paginação por cursor (keyset) e totais estimados
+# -----------------------------------------------------------------------------
+def encode_cursor(row) -> str:
+    """Cursor opaco com a posição (created_at, id) de uma linha da listagem."""
+    raw = json.dumps([str(row["created_at"]), int(row["id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[tuple[str, int]]:
+    try:
+        created_at, acc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(acc_id)
+    except (ValueError, TypeError):
+        return None
+
+def list_page(
+    conn: Connection,
+    where: str,
+    params: dict,
+    per_page: int,
+    after: str = "",
+    before: str = "",
+    page: int = 1,
+) -> tuple[list, Optional[str], Optional[str]]:
+    """
+    Uma página da listagem (created_at DESC, id DESC) e os cursores da próxima /
+    anterior (None se não houver). Com `after`/`before` a consulta vai direto ao
+    ponto pelo índice; sem cursor e com page > 1 (links antigos) usa OFFSET.
+    """
+    cols = "id, platform, email, notes, created_at"
+    params = dict(params, limit=per_page + 1)
+    joiner = " AND " if where else "WHERE "
+    position = decode_cursor(after or before) if (after or before) else None
+
+    if position and before:
+        # Página anterior: anda "para trás" no índice e inverte
+        params.update(c_at=position[0], c_id=position[1])
+        rows = conn.execute(text(f"""
+            SELECT {cols} FROM streaming_accounts
+            {where}{joiner}(created_at, id) > (:c_at, :c_id)
+            ORDER BY created_at ASC, id ASC
+            LIMIT :limit
+        """), params).mappings().all()
+        has_prev = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if position:
+            params.update(c_at=position[0], c_id=position[1])
+            sql = f"{where}{joiner}(created_at, id) < (:c_at, :c_id) ORDER BY created_at DESC, id DESC LIMIT :limit"
+        else:
+            params["offset"] = (max(page, 1) - 1) * per_page
+            sql = f"{where} ORDER BY created_at DESC, id DESC LIMIT :limit OFFSET :offset"
+        rows = conn.execute(text(f"SELECT {cols} FROM streaming_accounts {sql}"), params).mappings().all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = bool(position) or page > 1
+
+    next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+def count(conn: Connection, where: str, params: dict, exact: bool = False) -> tuple[int, bool]:
+    """
+    (total, exato?). Sem `exact`: a tabela inteira vem da estatística do Postgres
+    (pg_class.reltuples) ou do contador mantido por trigger no SQLite; com filtro,
+    conta no máximo ACCOUNTS_COUNT_CAP linhas.
+    """
+    if not exact:
+        if not where:
+            estimate = _table_estimate(conn)
+            if estimate is not None:
+                return estimate, False
+        else:
+            n = conn.execute(
+                text(f"SELECT COUNT(1) FROM (SELECT 1 FROM streaming_accounts {where} LIMIT :cap) AS t"),
+                dict(params, cap=ACCOUNTS_COUNT_CAP + 1),
+            ).scalar()
+            return min(int(n), ACCOUNTS_COUNT_CAP), n <= ACCOUNTS_COUNT_CAP
+    n = conn.execute(text(f"SELECT COUNT(1) FROM streaming_accounts {where}"), params).scalar()
+    return int(n), True
+
+def _table_estimate(conn: Connection) -> Optional[int]:
+    if conn.dialect.name == "postgresql":
+        n = conn.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'streaming_accounts'::regclass"
+        )).scalar()
+        # -1: tabela nunca analisada (ANALYZE/autovacuum)
+        return int(n) if n is not None and n >= 0 else None
+    if conn.dialect.name == "sqlite":
+        n = conn.execute(text("SELECT n FROM table_counts WHERE name = 'streaming_accounts'")).scalar()
+        return int(n) if n is not None else None
+    return None
@@ -0,0 +1,279 @@
+"""
+Controle de admissão das buscas que vão ao IMAP.
+
+Duas camadas, ambas com resposta imediata ("tente de novo em instantes") quando
+não há capacidade, em vez de empilhar conexões IMAP até o provedor bloquear a conta:
+
+- limites de taxa (token bucket) por IP do cliente e por (serviço, e-mail), em
+  memória no worker, com descarte LRU das chaves mais antigas;
+- vagas de busca IMAP simultânea no host inteiro (todos os workers, via SQLite
+  local): um teto global e um por conta IMAP, com uma fila de espera limitada.
+  Vagas de um worker que morreu expiram sozinhas (ADMISSION_LEASE_SECONDS).
+
+Uso:
+    wait = admission.allow_ip(ip)            # 0.0 = pode seguir; senão, segundos até liberar
+    with admission.imap_slot(service, email):  # levanta Busy se não houver vaga
+        ...
+    async with admission.imap_slot_async(service, email):  # o mesmo, em asyncio
+        ...
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+import leitor
+import localstore
+import metrics
+import services
+
+# Buscas IMAP simultâneas no host (todos os workers) e por conta IMAP
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_PER_ACCOUNT = int(os.environ.get("ADMISSION_MAX_PER_ACCOUNT", "3"))
+# Pedidos que podem esperar por uma vaga; além disso, recusa na hora
+ADMISSION_QUEUE = int(os.environ.get("ADMISSION_QUEUE", "16"))
+ADMISSION_WAIT_SECONDS = float(os.environ.get("ADMISSION_WAIT_SECONDS", "5"))
+# Prazo de uma vaga (libera as de processos que morreram no meio da busca)
+ADMISSION_LEASE_SECONDS = float(os.environ.get("ADMISSION_LEASE_SECONDS", "120"))
+
+# Token buckets (0 desliga): reposição por minuto e rajada máxima
+RATE_IP_PER_MINUTE = float(os.environ.get("RATE_IP_PER_MINUTE", "20"))
+RATE_IP_BURST = float(os.environ.get("RATE_IP_BURST", "10"))
+RATE_ACCOUNT_PER_MINUTE = float(os.environ.get("RATE_ACCOUNT_PER_MINUTE", "6"))
+RATE_ACCOUNT_BURST = float(os.environ.get("RATE_ACCOUNT_BURST", "4"))
+# Chaves guardadas por limite (as usadas há mais tempo saem primeiro)
+RATE_MAX_KEYS = int(os.environ.get("RATE_MAX_KEYS", "10000"))
+
+_POLL_SECONDS = 0.05
+_GLOBAL = "*"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    owner TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (owner, scope)
+);
+CREATE INDEX IF NOT EXISTS ix_slots_scope ON slots (scope);
+CREATE TABLE IF NOT EXISTS waiters (
+    owner TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+class Busy(Exception):
+    """Sem vaga para a busca IMAP (fila cheia ou espera esgotada)."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"sem vaga para busca IMAP; tente em {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def _db() -> sqlite3.Connection:
+    return localstore.connect("admission", _SCHEMA)
+
+def _count(name: str) -> None:
+    try:
+        _db().execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+    except sqlite3.Error as e:
+        print("ERRO NO CONTROLE DE ADMISSÃO:", repr(e))
+
+def stats() -> dict:
+    """Contadores acumulados (todos os workers): admitted, queued, busy, rate_limited_ip, rate_limited_account."""
+    rows = dict(_db().execute("SELECT name, value FROM counters").fetchall())
+    return {name: int(rows.get(name, 0))
+            for name in ("admitted", "queued", "busy", "rate_limited_ip", "rate_limited_account")}
+
+# -----------------------------------------------------------------------------
+# Limites de taxa (token bucket, em memória por worker)
+# -----------------------------------------------------------------------------
+class _Buckets:
+    """Um token bucket por chave; guarda no máximo RATE_MAX_KEYS chaves (LRU)."""
+
+    def __init__(self, per_minute: float, burst: float):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+        self._state: "OrderedDict[str, list[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Consome um token; devolve 0.0 ou os segundos até haver um token livre."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = self._state[key] = [self.burst, now]
+                while len(self._state) > RATE_MAX_KEYS:
+                    self._state.popitem(last=False)
+            else:
+                self._state.move_to_end(key)
+                state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+                state[1] = now
+            if state[0] >= 1.0:
+                state[0] -= 1.0
+                return 0.0
+            return (1.0 - state[0]) / self.rate
+
+_ip_buckets = _Buckets(RATE_IP_PER_MINUTE, RATE_IP_BURST)
+_account_buckets = _Buckets(RATE_ACCOUNT_PER_MINUTE, RATE_ACCOUNT_BURST)
+
+def allow_ip(ip: str) -> float:
+    """0.0 se o IP pode fazer mais uma busca; senão, segundos até poder."""
+    wait = _ip_buckets.take(ip or "?")
+    if wait:
+        _count("rate_limited_ip")
+    return wait
+
+def allow_account(service: str, email: str) -> float:
+    """Como allow_ip, por (serviço canônico, e-mail da conta)."""
+    wait = _account_buckets.take(f"{services.canonical(service) or service}|{(email or '').strip().lower()}")
+    if wait:
+        _count("rate_limited_account")
+    return wait
+
+# -----------------------------------------------------------------------------
+# Vagas de busca IMAP (host inteiro, SQLite local)
+# -----------------------------------------------------------------------------
+def _scopes(service: str, email: str) -> list[tuple[str, int]]:
+    """Vaga global + uma por conta IMAP que a busca vai usar (rotas de IMAP_ROUTES incluídas)."""
+    accounts = sorted({f"{m.user}@{m.host}:{m.port}" for m in leitor.mailboxes_for(service, email)})
+    return [(_GLOBAL, ADMISSION_MAX_CONCURRENT)] + [(a, ADMISSION_MAX_PER_ACCOUNT) for a in accounts]
+
+def _try_acquire(db: sqlite3.Connection, owner: str, scopes: list[tuple[str, int]]) -> bool:
+    """Pega todas as vagas de uma vez (ou nenhuma)."""
+    now = time.time()
+    with localstore.transaction(db):
+        db.execute("DELETE FROM slots WHERE expires_at <= ?", (now,))
+        for scope, limit in scopes:
+            (taken,) = db.execute("SELECT count(*) FROM slots WHERE scope = ?", (scope,)).fetchone()
+            if taken >= limit:
+                return False
+        db.executemany(
+            "INSERT OR REPLACE INTO slots (owner, scope, expires_at) VALUES (?, ?, ?)",
+            [(owner, scope, now + ADMISSION_LEASE_SECONDS) for scope, _ in scopes],
+        )
+    return True
+
+def _enqueue(db: sqlite3.Connection, owner: str) -> bool:
+    """Entra na fila de espera (False se ela está cheia)."""
+    now = time.time()
+    with localstore.transaction(db):
+        db.execute("DELETE FROM waiters WHERE expires_at <= ?", (now,))
+        (waiting,) = db.execute("SELECT count(*) FROM waiters").fetchone()
+        if waiting >= ADMISSION_QUEUE:
+            return False
+        db.execute(
+            "INSERT INTO waiters (owner, expires_at) VALUES (?, ?)",
+            (owner, now + ADMISSION_WAIT_SECONDS + 1),
+        )
+    return True
+
+def _release(db: sqlite3.Connection, owner: str) -> None:
+    db.execute("DELETE FROM slots WHERE owner = ?", (owner,))
+
+def _leave_queue(db: sqlite3.Connection, owner: str) -> None:
+    db.execute("DELETE FROM waiters WHERE owner = ?", (owner,))
+
+def _acquire(db: sqlite3.Connection, owner: str, scopes: list[tuple[str, int]]) -> None:
+    if _try_acquire(db, owner, scopes):
+        return
+    if ADMISSION_WAIT_SECONDS <= 0 or not _enqueue(db, owner):
+        raise Busy(ADMISSION_WAIT_SECONDS or 1)
+    _count("queued")
+    deadline = time.monotonic() + ADMISSION_WAIT_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_SECONDS)
+            if _try_acquire(db, owner, scopes):
+                return
+    finally:
+        _leave_queue(db, owner)
+    raise Busy(ADMISSION_WAIT_SECONDS)
+
+@contextmanager
+def imap_slot(service: str, email: str):
+    """
+    Reserva a vaga global e as das contas IMAP da busca enquanto o bloco roda.
+    Espera até ADMISSION_WAIT_SECONDS numa fila de até ADMISSION_QUEUE pedidos;
+    fila cheia ou espera esgotada levantam Busy. Se o SQLite local falhar, a busca
+    segue sem controle (melhor responder que travar o site).
+    """
+    owner = f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex}"
+    db = None
+    try:
+        db = _db()
+        with metrics.timer("admission_wait"):
+            _acquire(db, owner, _scopes(service, email))
+    except Busy:
+        _count("busy")
+        raise
+    except sqlite3.Error as e:
+        print("ERRO NO CONTROLE DE ADMISSÃO:", repr(e))
+        db = None
+    else:
+        _count("admitted")
+    try:
+        yield
+    finally:
+        if db is not None:
+            try:
+                _release(db, owner)
+            except sqlite3.Error as e:
+                print("ERRO NO CONTROLE DE ADMISSÃO:", repr(e))
+
+def _in_thread(step, *args):
+    # Conexões do localstore são por thread: cada passo usa a da thread que o executa
+    return asyncio.to_thread(lambda: step(_db(), *args))
+
+async def _acquire_async(owner: str, scopes: list[tuple[str, int]]) -> None:
+    if await _in_thread(_try_acquire, owner, scopes):
+        return
+    if ADMISSION_WAIT_SECONDS <= 0 or not await _in_thread(_enqueue, owner):
+        raise Busy(ADMISSION_WAIT_SECONDS or 1)
+    await asyncio.to_thread(_count, "queued")
+    deadline = time.monotonic() + ADMISSION_WAIT_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_POLL_SECONDS)
+            if await _in_thread(_try_acquire, owner, scopes):
+                return
+    finally:
+        await _in_thread(_leave_queue, owner)
+    raise Busy(ADMISSION_WAIT_SECONDS)
+
+@asynccontextmanager
+async def imap_slot_async(service: str, email: str):
+    """imap_slot para asyncio (a espera na fila não prende o loop)."""
+    owner = f"{os.getpid()}:async:{uuid.uuid4().hex}"
+    held = True
+    try:
+        with metrics.timer("admission_wait"):
+            await _acquire_async(owner, _scopes(service, email))
+    except Busy:
+        await asyncio.to_thread(_count, "busy")
+        raise
+    except sqlite3.Error as e:
+        print("ERRO NO CONTROLE DE ADMISSÃO:", repr(e))
+        held = False
+    else:
+        await asyncio.to_thread(_count, "admitted")
+    try:
+        yield
+    finally:
+        if held:
+            try:
+                await _in_thread(_release, owner)
+            except sqlite3.Error as e:
+                print("ERRO NO CONTROLE DE ADMISSÃO:", repr(e))
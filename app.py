@@ -1,81 +1,195 @@
 import os
+import hashlib
+import hmac
+import time
 from datetime import datetime
 from typing import Optional, Dict
 from functools import wraps
 
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash, session, make_response
+    Flask, Response, g, render_template, request, redirect, url_for, flash, session, make_response, jsonify
 )
 from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session
-from cryptography.fernet import Fernet, InvalidToken
-from dotenv import load_dotenv, find_dotenv
+from sqlalchemy.exc import IntegrityError
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+import click
 from werkzeug.security import check_password_hash
 
 # Carrega variáveis do .env (funciona mesmo se rodar de outra pasta)
-load_dotenv(find_dotenv(), override=False)
+import env
+env.load_env()
 
+import db  # noqa: E402
+from db import get_engine  # noqa: E402
+import migrations  # noqa: E402
 # Importa o leitor de e-mails
-from leitor import fetch_login_code_email_html  # noqa: E402
+from leitor import fetch_login_code  # noqa: E402
+import indexer  # noqa: E402
+import lookup_cache  # noqa: E402
+import jobs  # noqa: E402
+import services  # noqa: E402
+import account_search  # noqa: E402
+import account_io  # noqa: E402
+import metrics  # noqa: E402
+import admission  # noqa: E402
+import compress  # noqa: E402
+import slim  # noqa: E402
+import keyrotation  # noqa: E402
+import audit  # noqa: E402
+import account_filter  # noqa: E402
 
 # -----------------------------------------------------------------------------
 # App
 # -----------------------------------------------------------------------------
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev_fallback_change_me")
+# Respostas HTML/JSON comprimidas (brotli/gzip) conforme o Accept-Encoding
+app.after_request(compress.compress_response)
 
 # -----------------------------------------------------------------------------
 # Banco (SQLite local / Postgres Heroku com psycopg3)
 # -----------------------------------------------------------------------------
-DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///local.db")
-
-# Ajuste de dialect para psycopg3 quando for Postgres
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+psycopg://", 1)
-elif DATABASE_URL.startswith("postgresql://") and "+psycopg" not in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
-
-engine = create_engine(DATABASE_URL, future=True)
-
-def ensure_schema():
-    """Cria a tabela se não existir."""
-    is_sqlite = DATABASE_URL.startswith("sqlite")
-    id_col = "INTEGER PRIMARY KEY AUTOINCREMENT" if is_sqlite else "BIGSERIAL PRIMARY KEY"
-    with engine.begin() as conn:
-        conn.execute(text(f"""
-        CREATE TABLE IF NOT EXISTS streaming_accounts (
-            id {id_col},
-            platform TEXT NOT NULL,
-            email TEXT NOT NULL,
-            password_enc TEXT NOT NULL,
-            notes TEXT,
-            created_at TIMESTAMP NOT NULL,
-            CONSTRAINT uq_platform_email UNIQUE (platform, email)
-        )
-        """))
-ensure_schema()
+# O engine é criado no primeiro uso (db.get_engine()); o schema é aplicado pelas
+# migrações versionadas (migrations.py), não mais no import.
+@app.cli.command("migrate")
+def migrate_command():
+    """Aplica as migrações pendentes do schema."""
+    applied = migrations.migrate(create_engine(db.DATABASE_URL, future=True), log=click.echo)
+    click.echo(f"Schema na versão {migrations.LATEST}" + ("" if applied else " (nada a aplicar)"))
+
+@app.cli.command("merge-duplicate-accounts")
+@click.option("--apply", is_flag=True, help="Junta de fato (sem ele, só lista o que seria removido).")
+def merge_duplicate_accounts_command(apply):
+    """Junta as contas com a mesma (platform_canonical, email_norm), que travam a migração 9."""
+    engine = create_engine(db.DATABASE_URL, future=True)
+    if migrations.current_version(engine) < 8:
+        raise click.ClickException("schema anterior à migração 8; rode `flask --app app migrate` antes")
+    # Uma linha JSON por conta removida (com a senha cifrada): redirecione para um arquivo
+    dropped = migrations.merge_duplicate_accounts(engine, log=click.echo, apply=apply)
+    if apply:
+        click.echo(f"{dropped} conta(s) removida(s); rode `flask --app app migrate`", err=True)
+    else:
+        click.echo(f"{dropped} conta(s) seriam removidas; confira e rode de novo com --apply", err=True)
+
+# Indexador na própria thread do processo (alternativa ao processo "indexer" do Procfile)
+if os.environ.get("INDEXER_IN_PROCESS", "").lower() in {"1", "true", "yes"}:
+    indexer.start_in_background(get_engine())
 
 # -----------------------------------------------------------------------------
 # Criptografia de senha (Fernet)
 # -----------------------------------------------------------------------------
-FERNET_KEY = os.environ.get("FERNET_KEY")
+# FERNET_KEYS="nova,antiga,..." durante uma rotação: lê com todas, grava com a primeira
+FERNET_KEYS = [k.strip() for k in os.environ.get("FERNET_KEYS", "").split(",") if k.strip()]
+FERNET_KEY = FERNET_KEYS[0] if FERNET_KEYS else os.environ.get("FERNET_KEY")
 if not FERNET_KEY:
     # OBS: Em produção, defina FERNET_KEY fixa em config vars para não perder a chave.
     FERNET_KEY = Fernet.generate_key().decode()
+if not FERNET_KEYS:
+    FERNET_KEYS = [FERNET_KEY]
 
-cipher = Fernet(FERNET_KEY)
+_cipher: Optional[MultiFernet] = None
+
+def cipher() -> MultiFernet:
+    global _cipher
+    if _cipher is None:
+        _cipher = MultiFernet([Fernet(k) for k in FERNET_KEYS])
+    return _cipher
 
 def enc(p: str) -> str:
-    return cipher.encrypt((p or "").encode()).decode()
+    return cipher().encrypt((p or "").encode()).decode()
 
 def dec(p_enc: Optional[str]) -> str:
     if not p_enc:
         return ""
     try:
-        return cipher.decrypt(p_enc.encode()).decode()
+        with metrics.timer("decrypt"):
+            return cipher().decrypt(p_enc.encode()).decode()
     except (InvalidToken, Exception):
         return "***erro-de-chave***"
 
+# -----------------------------------------------------------------------------
+# Verificação de senha do cliente (HMAC-SHA256, sem decifrar password_enc)
+# -----------------------------------------------------------------------------
+# Chave obrigatória e fixa (não derivada da FERNET_KEY, que pode ser aleatória ou
+# trocada). Formato gravado: "v2$<id da chave>$<hex>"; o HMAC leva a chave da conta
+# (serviço canônico + e-mail normalizado) como sal, então senhas iguais em contas
+# diferentes não dão o mesmo verificador. Trocar a chave só invalida os verificadores
+# antigos, que voltam a ser conferidos pela senha cifrada até o backfill regravá-los.
+PASSWORD_VERIFIER_KEY = os.environ.get("PASSWORD_VERIFIER_KEY", "").encode()
+if not PASSWORD_VERIFIER_KEY:
+    raise RuntimeError("Defina PASSWORD_VERIFIER_KEY (chave fixa do verificador de senha; veja ENV.md).")
+_VERIFIER_PREFIX = "v2$" + hashlib.sha256(PASSWORD_VERIFIER_KEY).hexdigest()[:8] + "$"
+
+def password_verifier(platform: str, email: str, p: str) -> str:
+    """Verificador da senha `p` da conta (platform, email)."""
+    platform, email_norm = account_search.account_key(platform, email)
+    salted = f"{platform}\0{email_norm}\0{p or ''}".encode()
+    return _VERIFIER_PREFIX + hmac.new(PASSWORD_VERIFIER_KEY, salted, hashlib.sha256).hexdigest()
+
+def check_password(account, senha: str) -> bool:
+    """Confere a senha informada com a da conta (comparação em tempo constante)."""
+    verifier = account.get("password_verifier") or ""
+    if verifier.startswith(_VERIFIER_PREFIX):
+        return hmac.compare_digest(verifier, password_verifier(account["platform"], account["email"], senha))
+
+    # Conta ainda sem verificador (ou de outra chave): confere pela senha cifrada e grava o verificador
+    plain = dec(account["password_enc"])
+    if plain == "***erro-de-chave***":
+        return False
+    ok = hmac.compare_digest(plain.encode(), (senha or "").encode())
+    if ok:
+        try:
+            with get_engine().begin() as conn:
+                conn.execute(
+                    text("UPDATE streaming_accounts SET password_verifier = :v WHERE id = :i"),
+                    {"v": password_verifier(account["platform"], account["email"], plain), "i": account["id"]},
+                )
+        except Exception as e:
+            print("ERRO AO GRAVAR VERIFICADOR:", repr(e))
+    return ok
+
+@app.cli.command("backfill-verifiers")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_verifiers(batch_size: int):
+    """Grava password_verifier das contas sem verificador (ou de outra chave), em lotes."""
+    last_id, done = 0, 0
+    while True:
+        with get_engine().begin() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT id, platform_canonical, email_norm, password_enc FROM streaming_accounts
+                    WHERE id > :last AND (password_verifier IS NULL OR password_verifier NOT LIKE :prefix)
+                    ORDER BY id
+                    LIMIT :n
+                """),
+                {"last": last_id, "prefix": _VERIFIER_PREFIX + "%", "n": batch_size},
+            ).mappings().all()
+            if not rows:
+                break
+            updates = []
+            for r in rows:
+                plain = dec(r["password_enc"])
+                if plain != "***erro-de-chave***":
+                    updates.append({"v": password_verifier(r["platform_canonical"], r["email_norm"], plain), "i": r["id"]})
+            if updates:
+                conn.execute(text("UPDATE streaming_accounts SET password_verifier = :v WHERE id = :i"), updates)
+        last_id = rows[-1]["id"]
+        done += len(updates)
+        click.echo(f"{done} verificadores gravados (até id {last_id})")
+    click.echo(f"Concluído: {done} contas atualizadas.")
+
+@app.cli.command("rotate-keys")
+@click.option("--batch-size", default=keyrotation.KEY_ROTATION_BATCH, show_default=True)
+@click.option("--rate", default=keyrotation.KEY_ROTATION_RATE, show_default=True, help="Linhas por segundo (0 = sem limite).")
+@click.option("--restart", is_flag=True, help="Recomeça do primeiro id em vez de continuar do checkpoint.")
+def rotate_keys(batch_size: int, rate: float, restart: bool):
+    """Recifra password_enc com a primeira chave de FERNET_KEYS, em lotes (retomável)."""
+    if len(FERNET_KEYS) < 2 and not restart:
+        click.echo("Aviso: FERNET_KEYS tem uma chave só; nada a recifrar além de verificadores.")
+    result = keyrotation.rotate(get_engine(), FERNET_KEYS, password_verifier, _VERIFIER_PREFIX,
+                                batch_size=batch_size, rate=rate, restart=restart, log=click.echo)
+    click.echo(f"Concluído: {result['rotated']} recifradas, {result['unchanged']} já em dia, {result['failed']} sem chave.")
+
 # -----------------------------------------------------------------------------
 # i18n – textos usados no template
 # -----------------------------------------------------------------------------
@@ -95,6 +209,13 @@ T: Dict[str, Dict[str, str]] = {
         "searching": "Buscando…",
         "incorrect_password": "Contraseña incorrecta.",
         "result": "Resultado",
+        "code": "Tu código",
+        "open_link": "Iniciar sesión",
+        "view_full_email": "Ver correo completo",
+        "received": "Recibido",
+        "no_code": "No se encontró un código en el correo.",
+        "email_expired": "El correo ya no está disponible. Busca de nuevo.",
+        "try_again": "Hay muchas búsquedas en este momento. Inténtalo de nuevo en unos segundos.",
         "not_found": "Cuenta no encontrada para",
         "help_text": "¿Necesitas ayuda?",
         "click_here": "Haz clic aquí",
@@ -118,6 +239,13 @@ T: Dict[str, Dict[str, str]] = {
         "searching": "Searching…",
         "incorrect_password": "Incorrect password.",
         "result": "Result",
+        "code": "Your code",
+        "open_link": "Sign in",
+        "view_full_email": "View full email",
+        "received": "Received",
+        "no_code": "No code found in the email.",
+        "email_expired": "This email is no longer available. Search again.",
+        "try_again": "Too many searches right now. Please try again in a few seconds.",
         "not_found": "Account not found for",
         "help_text": "Need help?",
         "click_here": "Click here",
@@ -141,6 +269,13 @@ T: Dict[str, Dict[str, str]] = {
         "searching": "Buscando…",
         "incorrect_password": "Senha incorreta.",
         "result": "Resultado",
+        "code": "Seu código",
+        "open_link": "Entrar",
+        "view_full_email": "Ver e-mail completo",
+        "received": "Recebido",
+        "no_code": "Não encontrei um código no e-mail.",
+        "email_expired": "O e-mail não está mais disponível. Busque de novo.",
+        "try_again": "Muitas buscas neste momento. Tente de novo em alguns segundos.",
         "not_found": "Conta não encontrada para",
         "help_text": "Precisou de ajuda?",
         "click_here": "Clique aqui",
@@ -155,6 +290,11 @@ def get_lang() -> str:
     lang = request.cookies.get("lang") or "es"
     return lang if lang in T else "es"
 
+@app.context_processor
+def _service_options():
+    # <select> de serviço das páginas, gerado a partir do registro
+    return {"service_options": services.options()}
+
 @app.get("/set_lang/<lang_code>")
 def set_lang(lang_code: str):
     # valida idioma e salva em cookie
@@ -218,136 +358,433 @@ def admin_logout():
     flash("Sessão encerrada.", "info")
     return redirect(url_for("admin_login"))
 
+@app.get("/admin/lookup-cache")
+@admin_required
+def admin_lookup_cache():
+    """Contadores do cache de buscas (hits / misses / coalesced), somando todos os workers."""
+    return jsonify(lookup_cache.stats())
+
+@app.get("/admin/account-filter")
+@admin_required
+def admin_account_filter():
+    """Filtro de contas deste worker: memória, falsos positivos (esperado e medido) e recusas."""
+    return jsonify(account_filter.stats())
+
+@app.get("/admin/key-rotation")
+@admin_required
+def admin_key_rotation():
+    """Progresso da rotação da chave Fernet (flask rotate-keys) para a chave atual."""
+    status = keyrotation.status(get_engine(), FERNET_KEY)
+    status["keys"] = [keyrotation.key_id(k) for k in FERNET_KEYS]
+    return jsonify(status)
+
+@app.get("/admin/lookups")
+@admin_required
+def admin_lookups():
+    """Buscas públicas por serviço/resultado (totais por hora) e histórico de uma conta."""
+    email = (request.args.get("email") or "").strip()
+    with get_engine().connect() as conn:
+        day = audit.summary(conn, 24)
+        week = audit.summary(conn, 24 * 7)
+        hours = audit.hourly(conn, 24)
+        recent = audit.recent_for(conn, email) if email else []
+    return render_template("lookups.html", day=day, week=week, hours=hours,
+                           email=email, recent=recent, writer=audit.stats())
+
+# Token para o Prometheus (Authorization: Bearer ...); sem ele, só com a sessão de admin
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+@app.get("/metrics")
+def metrics_page():
+    """Histogramas por etapa / resultado da busca (formato Prometheus), somando todos os workers."""
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode())
+    if not token_ok and not session.get("is_admin"):
+        return Response("unauthorized\n", status=401, mimetype="text/plain",
+                        headers={"WWW-Authenticate": "Bearer"})
+    cache = {f'event="{k}"': v for k, v in lookup_cache.stats().items()}
+    gate = {f'event="{k}"': v for k, v in admission.stats().items()}
+    body = metrics.render({
+        "allcodes_lookup_cache_total": ("Cache de buscas: hits / misses / coalesced.", cache),
+        "allcodes_admission_total": ("Controle de admissão: admitidas, em fila, recusadas e limitadas.", gate),
+    })
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+# -----------------------------------------------------------------------------
+# Busca de conta e do e-mail de código (usada pela página e pela API)
+# -----------------------------------------------------------------------------
+# Serviços, aliases e filtros ficam em services.py. Um "service" fora do registro é
+# rejeitado antes da busca (sem filtro, a busca poderia exibir o e-mail mais recente da caixa).
+
+IMAP_ERROR_HTML = """
+<div style="color:#b00020">
+  <strong>Não foi possível buscar o e-mail agora.</strong><br>
+  Verifique as configurações do servidor de e-mail (IMAP) e tente novamente.
+</div>
+"""
+
+def _account_query(service: str, email: str) -> tuple[str, dict]:
+    """SQL + parâmetros da conta do cliente (também usado pela busca assíncrona do asgi.py)."""
+    # Uma consulta pelo índice único (platform_canonical, email_norm): aliases antigos de
+    # plataforma e maiúsculas no e-mail já foram normalizados na gravação (migração 9).
+    platform, email_norm = account_search.account_key(service, email)
+    return """SELECT id, platform, email, password_enc, password_verifier, notes, created_at
+              FROM streaming_accounts
+              WHERE platform_canonical = :p AND email_norm = :e""", {"p": platform, "e": email_norm}
+
+def _find_account(service: str, email: str):
+    # Conta que com certeza não existe (filtro de contas / ausente há pouco) nem vai ao banco
+    if not account_filter.may_exist(service, email):
+        return None
+    generation = account_filter.generation()
+    sql, params = _account_query(service, email)
+    with metrics.timer("db_account"), get_engine().connect() as conn:
+        found = conn.execute(text(sql), params).mappings().first()
+    if found is None:
+        account_filter.remember_miss(service, email, generation)
+    return found
+
+def _compact(result: Optional[dict]) -> Optional[dict]:
+    """Tira o HTML completo do resultado e o guarda à parte, emagrecido (link "ver e-mail completo")."""
+    if not result:
+        return None
+    result = dict(result)
+    with metrics.timer("email_slim"):
+        email_html = slim.slim_html(result.pop("email_html"))
+    result["email_token"] = lookup_cache.keep_email(email_html)
+    return result
+
+def _indexed_code(service: str, email: str) -> tuple[bool, Optional[dict]]:
+    """(índice em dia?, resultado compacto) do índice mantido pelo indexador (IMAP IDLE)."""
+    try:
+        indexed, result = indexer.lookup(get_engine(), service, email, lookback_days=7)
+    except Exception as e:
+        print("ERRO AO CONSULTAR ÍNDICE:", repr(e))
+        return False, None
+    return indexed, _compact(result) if indexed else None
+
+def _lookup_code(service: str, email: str) -> Optional[dict]:
+    """Código / link do e-mail mais recente (None se não houver). Erros de IMAP sobem."""
+    # ----- Índice mantido pelo indexador; busca ao vivo se estiver desatualizado -----
+    indexed, result = _indexed_code(service, email)
+    if indexed:
+        return result
+
+    # Cache curto + single-flight entre workers para pedidos iguais simultâneos
+    # (só quem vai mesmo ao IMAP disputa vaga no controle de admissão; Busy sobe)
+    def scan():
+        with admission.imap_slot(service, email), audit.imap_timer():
+            result = fetch_login_code(service=service, target_email=email, lookback_days=7, max_scan=200)
+        return _compact(result)
+
+    return lookup_cache.get_or_compute(service, email, scan)
+
+def _no_email_html(found) -> str:
+    safe_notes = (found.get("notes") or "")
+    return f"""
+        <div>
+            <p><strong>E-mail:</strong> {found['email']}</p>
+            <p><strong>Serviço:</strong> {found['platform'].capitalize()}</p>
+            <p><strong>Status:</strong> ✅ Login válido</p>
+            {"<p><em>" + safe_notes + "</em></p>" if safe_notes else ""}
+            <p style='color:#666'><em>Não localizei um e-mail recente com código para exibir.</em></p>
+        </div>
+        """
+
+# -----------------------------------------------------------------------------
+# Estáticos com hash do conteúdo (cache longo) e página inicial pré-renderizada
+# -----------------------------------------------------------------------------
+# Validade do cache dos estáticos pedidos com o hash atual (?v=...)
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", str(60 * 60 * 24 * 365)))
+
+_static_hashes: Dict[str, tuple] = {}
+
+def _static_hash(filename: str) -> Optional[str]:
+    """Hash curto do conteúdo de static/<filename> (recalculado só se o arquivo mudar)."""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _static_hashes[filename] = ((st.st_mtime_ns, st.st_size), digest)
+    return digest
+
+@app.url_defaults
+def _static_version(endpoint: str, values: dict) -> None:
+    # url_for('static', filename=...) ganha ?v=<hash>: a URL muda quando o arquivo muda
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = _static_hash(values["filename"])
+        if digest:
+            values["v"] = digest
+
+@app.before_request
+def _audit_start() -> None:
+    g.audit_token = audit.start()
+
+@app.teardown_request
+def _audit_end(exc) -> None:
+    token = g.pop("audit_token", None)
+    if token is not None:
+        audit.end(token)
+
+@app.after_request
+def _static_cache_control(resp):
+    # Só a URL com o hash atual é imutável; as demais (sem ?v ou de versão antiga) revalidam
+    if request.endpoint == "static" and resp.status_code in (200, 304):
+        filename = (request.view_args or {}).get("filename", "")
+        if request.args.get("v") and request.args.get("v") == _static_hash(filename):
+            resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return resp
+
+# (idioma, prefixo da app) -> {codificação ou "": (ETag, corpo)}
+_index_pages: Dict[tuple, Dict[str, tuple]] = {}
+
+def _index_variants(lang: str) -> Dict[str, tuple]:
+    """GET / só depende do idioma: renderiza e comprime uma vez por processo."""
+    key = (lang, request.script_root)
+    variants = None if app.debug else _index_pages.get(key)
+    if variants is None:
+        page = _render_index(lang=lang, t=T[lang], mensagem=None, email="", service="disney").encode("utf-8")
+        etag = hashlib.sha256(page).hexdigest()[:32]
+        variants = {"": (etag, page)}
+        for coding in compress.CODINGS:
+            variants[coding] = (f"{etag}-{coding}", compress.encode(page, coding))
+        _index_pages[key] = variants
+    return variants
+
 # -----------------------------------------------------------------------------
 # Rotas públicas
 # -----------------------------------------------------------------------------
 @app.get("/")
 def index():
+    variants = _index_variants(get_lang())
+    coding = compress.choose(request.headers.get("Accept-Encoding", ""))
+    etag, body = variants[coding or ""]
+    resp = Response(body, mimetype="text/html")
+    if coding:
+        resp.headers["Content-Encoding"] = coding
+    resp.set_etag(etag)
+    # Revalida sempre (If-None-Match -> 304); o idioma vem do cookie
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.update(("Accept-Encoding", "Cookie"))
+    return resp.make_conditional(request)
+
+def _lookup_done(service: str, started: float, result: str, email: str, ip: str) -> None:
+    """Registra a duração total da busca com o resultado (hit / no_email / wrong_password / ...)."""
+    seconds = time.perf_counter() - started
+    canonical = services.canonical(service)
+    metrics.observe("allcodes_lookup_seconds", seconds, service=canonical or "invalid", result=result)
+    audit.record(canonical or service, email, result, seconds, ip)
+
+def _render_index(**context) -> str:
+    with metrics.timer("render"):
+        return render_template("index.html", **context)
+
+# Proxies na frente do app (Railway/Heroku: 1) – o IP do cliente é o que o último deles viu
+RATE_PROXY_HOPS = int(os.environ.get("RATE_PROXY_HOPS", "1"))
+
+def _client_ip() -> str:
+    route = request.access_route if RATE_PROXY_HOPS > 0 else []
+    if len(route) >= RATE_PROXY_HOPS > 0:
+        return route[-RATE_PROXY_HOPS]
+    return request.remote_addr or ""
+
+def _rate_limited(service: str, email: str) -> float:
+    """Segundos até o cliente poder buscar de novo (0.0 = liberado), por IP e por (serviço, e-mail)."""
+    wait = admission.allow_ip(_client_ip())
+    if not wait:
+        wait = admission.allow_account(service, email)
+    return wait
+
+def _try_again(resp, retry_after: float):
+    resp.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return resp
+
+def _lookup_form(data) -> tuple[str, str, str]:
+    """(serviço, e-mail, senha) do formulário / JSON da busca."""
+    return (
+        (data.get("service") or "").strip().lower(),
+        (data.get("email") or "").strip(),
+        (data.get("senha") or "").strip(),
+    )
+
+_INDEX_MESSAGES = {
+    "invalid_service": "invalid_service",
+    "wrong_password": "incorrect_password",
+    "rate_limited": "try_again",
+    "busy": "try_again",
+}
+_INDEX_STATUS = {"rate_limited": 429, "busy": 503}
+
+def _index_page(outcome: str, started: float, service: str, email: str,
+                found=None, resultado: Optional[dict] = None, retry_after: float = 0.0):
+    """Página do POST / para cada desfecho da busca (rota Flask e rota asyncio do asgi.py)."""
     lang = get_lang()
     t = T[lang]
-    return render_template("index.html", lang=lang, t=t, mensagem=None, email="", service="disney")
+    if outcome in _INDEX_MESSAGES:
+        mensagem = t[_INDEX_MESSAGES[outcome]]
+    elif outcome == "error":
+        mensagem = IMAP_ERROR_HTML
+    elif outcome == "no_email":
+        mensagem = _no_email_html(found)
+    else:
+        mensagem = None
+    page = _render_index(lang=lang, t=t, mensagem=mensagem, resultado=resultado, email=email, service=service)
+    _lookup_done(service, started, outcome, email, _client_ip())
+    resp = make_response(page, _INDEX_STATUS.get(outcome, 200))
+    return _try_again(resp, retry_after) if retry_after else resp
 
 @app.post("/")
 def index_post():
-    lang = get_lang()
-    t = T[lang]
+    started = time.perf_counter()
+    service, email, senha = _lookup_form(request.form)
 
-    service = (request.form.get("service") or "").strip().lower()
-    email = (request.form.get("email") or "").strip()
-    senha = (request.form.get("senha") or "").strip()
-
-    # Evita buscas IMAP sem filtro em caso de "service" inválido.
-    # (Sem isso, um service desconhecido poderia acabar exibindo o e-mail mais recente da caixa.)
-    # Mantém alguns aliases por compatibilidade.
-    # NOTE: Mantemos alguns aliases por compatibilidade.
-    # "max" é o nome atual do serviço (antigo HBO Max) em vários mercados.
-    allowed_services = {
-        "disney",
-        "netflix",
-        "prime",
-        "amazon",
-        "amazon prime",
-        "crunchyroll",
-        "max",
-        "hbomax",
-        "hbo max",
-    }
-    if service not in allowed_services:
-        return render_template(
-            "index.html",
-            lang=lang,
-            t=t,
-            mensagem=t["invalid_service"],
-            email=email,
-            service=service,
-        )
+    if services.canonical(service) is None:
+        return _index_page("invalid_service", started, service, email)
 
-    # Para compatibilidade com bases já existentes, tentamos achar a conta
-    # considerando alguns aliases de plataforma.
-    platform_candidates = [service]
-    if service in {"prime", "amazon", "amazon prime"}:
-        platform_candidates = ["prime", "amazon"]
-    elif service in {"max", "hbomax", "hbo max"}:
-        platform_candidates = ["max", "hbomax", "hbo max"]
-
-    where_platform = " OR ".join([f"platform = :p{i}" for i in range(len(platform_candidates))])
-    params = {"e": email}
-    for i, p in enumerate(platform_candidates):
-        params[f"p{i}"] = p
-
-    with Session(engine) as s:
-        found = s.execute(
-            text(f"""SELECT id, platform, email, password_enc, notes, created_at
-                    FROM streaming_accounts
-                    WHERE ({where_platform}) AND email = :e
-                    LIMIT 1"""),
-            params,
-        ).mappings().first()
+    wait = _rate_limited(service, email)
+    if wait:
+        return _index_page("rate_limited", started, service, email, retry_after=wait)
 
+    found = _find_account(service, email)
     if not found:
-        return render_template("index.html", lang=lang, t=t, mensagem=None, email=email, service=service)
-
-    if dec(found["password_enc"]) != senha:
-        return render_template("index.html", lang=lang, t=t,
-                               mensagem=t["incorrect_password"], email=email, service=service)
-
-    # ----- Filtros de assunto/remetente por serviço -----
-    subject_filter = None
-    subject_keywords = None
-    from_filters = None
-    forbidden_subject = None
-
-    if service == "disney":
-        subject_keywords = ["Your one-time passcode for Disney+", "Tu código de acceso único para Disney+"]
+        return _index_page("no_account", started, service, email)
 
-    elif service == "netflix":
-        subject_filter = "Netflix: Your sign-in code"
-
-    elif service in {"prime", "amazon", "amazon prime"}:
-        subject_keywords = ["Tentativa de login"]
-
-    elif service == "crunchyroll":
-        subject_keywords = ["Confirma tu nuevo inicio"]
-
-    elif service in {"max", "hbomax", "hbo max"}:
-        subject_keywords = ["Urgente: Tu código de un solo uso"]
+    if not check_password(found, senha):
+        return _index_page("wrong_password", started, service, email)
 
     # Busca o e-mail com tratamento de erro para evitar 500
     try:
-        email_html = fetch_login_code_email_html(
-            service=service,
-            target_email=email,
-            lookback_days=7,
-            max_scan=200,
-            required_subject_substr=subject_filter,
-            required_subject_keywords=subject_keywords,
-            required_from_contains=from_filters,
-            forbidden_subject_keywords=forbidden_subject,
-        )
+        resultado = _lookup_code(service, email)
+    except admission.Busy as e:
+        return _index_page("busy", started, service, email, retry_after=e.retry_after)
     except Exception as e:
         print("ERRO AO BUSCAR EMAIL:", repr(e))
-        email_html = """
-        <div style="color:#b00020">
-          <strong>Não foi possível buscar o e-mail agora.</strong><br>
-          Verifique as configurações do servidor de e-mail (IMAP) e tente novamente.
-        </div>
-        """
-    # -----------------------------------------
+        return _index_page("error", started, service, email)
+    return _index_page("hit" if resultado else "no_email", started, service, email, found=found, resultado=resultado)
+
+@app.get("/email/<token>")
+def email_full(token: str):
+    """E-mail completo, só sob demanda (o resultado da busca mostra apenas código/link)."""
+    email_html = lookup_cache.kept_email(token)
+    if email_html is None:
+        return Response(T[get_lang()]["email_expired"], status=404, mimetype="text/plain")
+    resp = Response(
+        f'<!DOCTYPE html><html><head><meta charset="UTF-8"><meta name="robots" content="noindex"></head>'
+        f"<body>{email_html}</body></html>",
+        mimetype="text/html",
+    )
+    resp.headers["Cache-Control"] = "private, no-store"
+    # O HTML vem de terceiros: sem scripts
+    resp.headers["Content-Security-Policy"] = "script-src 'none'"
+    return resp
 
-    if not email_html:
-        safe_notes = (found.get("notes") or "")
-        email_html = f"""
-        <div>
-            <p><strong>E-mail:</strong> {found['email']}</p>
-            <p><strong>Serviço:</strong> {found['platform'].capitalize()}</p>
-            <p><strong>Status:</strong> ✅ Login válido</p>
-            {"<p><em>" + safe_notes + "</em></p>" if safe_notes else ""}
-            <p style='color:#666'><em>Não localizei um e-mail recente com código para exibir.</em></p>
-        </div>
-        """
+# -----------------------------------------------------------------------------
+# API assíncrona de busca (job + long-poll / SSE)
+# -----------------------------------------------------------------------------
+_API_ERRORS = {
+    "invalid_service": ("invalid_service", 400),
+    "rate_limited": ("try_again", 429),
+    "no_account": ("not_found", 404),
+    "wrong_password": ("incorrect_password", 403),
+}
+
+def _lookup_deadline(data) -> float:
+    try:
+        return float(data.get("deadline") or jobs.JOBS_DEFAULT_DEADLINE)
+    except (TypeError, ValueError):
+        return jobs.JOBS_DEFAULT_DEADLINE
+
+def _api_refusal(outcome: str, started: float, service: str, email: str, retry_after: float = 0.0):
+    """Resposta de erro do POST /api/lookup (rota Flask e rota asyncio do asgi.py)."""
+    t = T[get_lang()]
+    key, status = _API_ERRORS[outcome]
+    message = f"{t['not_found']} {email}" if outcome == "no_account" else t[key]
+    _lookup_done(service, started, outcome, email, _client_ip())
+    resp = make_response(jsonify(error=message), status)
+    return _try_again(resp, retry_after) if retry_after else resp
+
+def _job_fallbacks(found) -> dict:
+    """Resultados do job quando o prazo acaba sem e-mail (not_found) ou com erro de IMAP."""
+    return {"not_found": {"html": _no_email_html(found)}, "error": {"html": IMAP_ERROR_HTML}}
+
+def _job_key(service: str, email: str) -> tuple:
+    """Chave da conta: jobs iguais dividem a mesma tentativa de busca."""
+    return services.canonical(service), (email or "").strip().lower()
+
+def _job_finished(service: str, started: float, email: str, ip: str):
+    """on_finish do job: só o desfecho final (código ou erro) entra na métrica."""
+    def finished(status: str) -> None:
+        if status != "not_found":
+            _lookup_done(service, started, "hit" if status == "done" else "error", email, ip)
+    return finished
+
+def _api_job_created(job_id: str):
+    return jsonify(
+        job_id=job_id,
+        status="pending",
+        poll_url=url_for("api_lookup_poll", job_id=job_id),
+        events_url=url_for("api_lookup_events", job_id=job_id),
+    ), 202
+
+@app.post("/api/lookup")
+def api_lookup_create():
+    """Valida a conta como o index_post e enfileira a busca; responde na hora com o id do job."""
+    data = request.get_json(silent=True) or request.form
+    service, email, senha = _lookup_form(data)
+    deadline = _lookup_deadline(data)
+
+    started = time.perf_counter()
+    if services.canonical(service) is None:
+        return _api_refusal("invalid_service", started, service, email)
+
+    wait = _rate_limited(service, email)
+    if wait:
+        return _api_refusal("rate_limited", started, service, email, retry_after=wait)
+
+    found = _find_account(service, email)
+    if not found:
+        return _api_refusal("no_account", started, service, email)
+
+    if not check_password(found, senha):
+        return _api_refusal("wrong_password", started, service, email)
+
+    ip = _client_ip()
+    job_id = jobs.submit(
+        lambda: _lookup_code(service, email), deadline_seconds=deadline,
+        key=_job_key(service, email), on_finish=_job_finished(service, started, email, ip),
+        **_job_fallbacks(found),
+    )
+    # O job pode acabar sem e-mail: o pedido aceito já fica registrado
+    audit.record(services.canonical(service), email, "accepted", time.perf_counter() - started, ip)
+    return _api_job_created(job_id)
 
-    return render_template("index.html", lang=lang, t=t,
-                           mensagem=email_html, email=email, service=service)
+@app.get("/api/lookup/<job_id>")
+def api_lookup_poll(job_id: str):
+    """Long-poll: segura a resposta até o job terminar ou `wait` segundos passarem."""
+    try:
+        wait = float(request.args.get("wait") or 25)
+    except ValueError:
+        wait = 25
+    job = jobs.wait(job_id, timeout=max(0.0, min(wait, jobs.JOBS_MAX_WAIT)))
+    if job is None:
+        return jsonify(error="job not found"), 404
+    return jsonify(job)
+
+@app.get("/api/lookup/<job_id>/events")
+def api_lookup_events(job_id: str):
+    """Server-Sent Events: envia o resultado assim que o e-mail chegar."""
+    if jobs.get(job_id) is None:
+        return jsonify(error="job not found"), 404
+    resp = Response(jobs.events(job_id), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 # -----------------------------------------------------------------------------
 # Rotas protegidas (admin)
@@ -359,6 +796,8 @@ def accounts_page():
 
     # Filtros / paginação
     q = (request.args.get("q") or "").strip()
+    platform = (request.args.get("platform") or "").strip().lower()
+    notes = (request.args.get("notes") or "").strip()
     try:
         per_page = int(request.args.get("per_page") or 20)
     except ValueError:
@@ -371,32 +810,22 @@ def accounts_page():
         page = 1
     page = max(page, 1)
 
-    where = ""
-    params = {}
-    if q:
-        where = "WHERE lower(email) LIKE :q"
-        params["q"] = f"%{q.lower()}%"
+    # Cursor (após / antes de uma linha) dos links Próxima/Anterior; total exato só se pedido
+    after = request.args.get("after") or ""
+    before = request.args.get("before") or ""
+    exact = request.args.get("exact") == "1"
 
-    with Session(engine) as s:
-        total = s.execute(
-            text(f"SELECT COUNT(1) AS c FROM streaming_accounts {where}"),
-            params,
-        ).mappings().first()["c"]
+    with get_engine().connect() as conn:
+        where, params = account_search.search_filter(conn, q=q, platform=platform, notes=notes)
+        total, total_exact = account_search.count(conn, where, params, exact=exact)
 
         total_pages = max(1, (int(total) + per_page - 1) // per_page)
-        page = min(page, total_pages)
-        offset = (page - 1) * per_page
+        if total_exact and not (after or before):
+            page = min(page, total_pages)
 
-        rows = s.execute(
-            text(f"""
-                SELECT id, platform, email, password_enc, notes, created_at
-                FROM streaming_accounts
-                {where}
-                ORDER BY created_at DESC
-                LIMIT :limit OFFSET :offset
-            """),
-            {**params, "limit": per_page, "offset": offset},
-        ).mappings().all()
+        rows, next_cursor, prev_cursor = account_search.list_page(
+            conn, where, params, per_page, after=after, before=before, page=page,
+        )
 
     return render_template(
         "accounts.html",
@@ -404,10 +833,15 @@ def accounts_page():
         t=T[lang],
         accounts=rows,
         q=q,
+        platform=platform,
+        notes=notes,
         page=page,
         per_page=per_page,
         total=total,
+        total_exact=total_exact,
         total_pages=total_pages,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
     )
 
 @app.post("/accounts")
@@ -418,34 +852,76 @@ def accounts_create():
     password = (request.form.get("password") or "").strip()
     notes = (request.form.get("notes") or "").strip()
 
-    # Canonicaliza alguns aliases na inserção
-    if platform in {"hbomax", "hbo max"}:
-        platform = "max"
-    if platform == "amazon prime":
-        platform = "prime"
+    # Canonicaliza aliases na inserção
+    platform, email_norm = account_search.account_key(platform, email)
 
-    if platform not in {"disney", "netflix", "prime", "amazon", "crunchyroll", "max"} or not email or not password:
+    if platform not in services.SERVICES or not email or not password:
         flash("Preencha corretamente plataforma, e-mail e senha.", "error")
         return redirect(url_for("accounts_page"))
 
-    with Session(engine) as s:
-        s.execute(text("""
-            INSERT INTO streaming_accounts (platform, email, password_enc, notes, created_at)
-            VALUES (:p, :e, :pw, :n, :ts)
-        """), {"p": platform, "e": email, "pw": enc(password), "n": notes, "ts": datetime.utcnow()})
-        s.commit()
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text("""
+                INSERT INTO streaming_accounts
+                    (platform, platform_canonical, email, email_norm, password_enc, password_verifier, notes, created_at)
+                VALUES (:p, :p, :e, :en, :pw, :pv, :n, :ts)
+            """), {"p": platform, "e": email, "en": email_norm, "pw": enc(password),
+                   "pv": password_verifier(platform, email_norm, password), "n": notes, "ts": datetime.utcnow()})
+            account_filter.changed(conn)
+    except IntegrityError:
+        flash("Já existe uma conta com essa plataforma e e-mail.", "error")
+        return redirect(url_for("accounts_page"))
+    account_filter.added(platform, email)
     flash("Conta adicionada.", "success")
     return redirect(url_for("accounts_page"))
 
 @app.post("/accounts/<int:acc_id>/delete")
 @admin_required
 def accounts_delete(acc_id: int):
-    with Session(engine) as s:
-        s.execute(text("DELETE FROM streaming_accounts WHERE id=:i"), {"i": acc_id})
-        s.commit()
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM streaming_accounts WHERE id=:i"), {"i": acc_id})
+        account_filter.changed(conn)
     flash("Conta removida.", "info")
     return redirect(url_for("accounts_page"))
 
+@app.post("/accounts/import")
+@admin_required
+def accounts_import():
+    """Importa contas em lote (CSV ou JSONL): upload do formulário ou corpo cru da requisição."""
+    upload = request.files.get("file")
+    if upload is not None and upload.filename:
+        stream, name = upload.stream, upload.filename.lower()
+    else:
+        stream, name = request.stream, ""
+    fmt = (request.form.get("format") or request.args.get("format") or "").lower()
+    if fmt not in {"csv", "jsonl"}:
+        fmt = "jsonl" if name.endswith((".jsonl", ".ndjson")) or "json" in (request.mimetype or "") else "csv"
+
+    report = account_io.import_accounts(get_engine(), stream, fmt, FERNET_KEY, password_verifier)
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report)
+    flash(f"Importação: {report['written']} conta(s) gravada(s), {report['error_count']} linha(s) com erro.",
+          "success" if not report["error_count"] else "error")
+    for line_no, msg in report["errors"][:20]:
+        flash(f"Linha {line_no}: {msg}", "error")
+    return redirect(url_for("accounts_page"))
+
+@app.get("/accounts/export")
+@admin_required
+def accounts_export():
+    """Exporta todas as contas em CSV ou JSONL (senhas decifradas só com ?passwords=1)."""
+    fmt = "jsonl" if request.args.get("format") == "jsonl" else "csv"
+    with_passwords = request.args.get("passwords") == "1"
+    resp = Response(
+        account_io.export_accounts(get_engine(), fmt, decrypt=dec if with_passwords else None),
+        mimetype="application/x-ndjson" if fmt == "jsonl" else "text/csv",
+    )
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    resp.headers["Content-Disposition"] = f'attachment; filename="accounts-{stamp}.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
 
 @app.get("/accounts/<int:acc_id>/edit")
 @admin_required
@@ -454,8 +930,8 @@ def accounts_edit_page(acc_id: int):
     lang = get_lang()
     next_url = request.args.get("next") or url_for("accounts_page")
 
-    with Session(engine) as s:
-        row = s.execute(
+    with get_engine().connect() as conn:
+        row = conn.execute(
             text(
                 """
                 SELECT id, platform, email, notes, created_at
@@ -494,30 +970,43 @@ def accounts_edit_save(acc_id: int):
         flash("Informe um e-mail válido.", "error")
         return redirect(url_for("accounts_edit_page", acc_id=acc_id, next=next_url))
 
-    with Session(engine) as s:
-        if password:
-            s.execute(
-                text(
-                    """
-                    UPDATE streaming_accounts
-                    SET email=:e, notes=:n, password_enc=:pw
-                    WHERE id=:i
-                    """
-                ),
-                {"e": email, "n": notes, "pw": enc(password), "i": acc_id},
-            )
-        else:
-            s.execute(
-                text(
-                    """
-                    UPDATE streaming_accounts
-                    SET email=:e, notes=:n
-                    WHERE id=:i
-                    """
-                ),
-                {"e": email, "n": notes, "i": acc_id},
-            )
-        s.commit()
+    email_norm = account_search.normalize_email(email)
+    try:
+        with get_engine().begin() as conn:
+            platform = conn.execute(
+                text("SELECT platform_canonical FROM streaming_accounts WHERE id=:i"), {"i": acc_id}
+            ).scalar()
+            if password and platform:
+                conn.execute(
+                    text(
+                        """
+                        UPDATE streaming_accounts
+                        SET email=:e, email_norm=:en, notes=:n, password_enc=:pw, password_verifier=:pv
+                        WHERE id=:i
+                        """
+                    ),
+                    {"e": email, "en": email_norm, "n": notes, "pw": enc(password),
+                     "pv": password_verifier(platform, email_norm, password), "i": acc_id},
+                )
+            elif platform:
+                # O e-mail é o sal do verificador: se mudou, o próximo login correto regrava
+                conn.execute(
+                    text(
+                        """
+                        UPDATE streaming_accounts
+                        SET email=:e, email_norm=:en, notes=:n,
+                            password_verifier = CASE WHEN email_norm = :en THEN password_verifier END
+                        WHERE id=:i
+                        """
+                    ),
+                    {"e": email, "en": email_norm, "n": notes, "i": acc_id},
+                )
+            account_filter.changed(conn)
+    except IntegrityError:
+        flash("Já existe uma conta com essa plataforma e e-mail.", "error")
+        return redirect(url_for("accounts_edit_page", acc_id=acc_id, next=next_url))
+    if platform:
+        account_filter.added(platform, email)
 
     flash("Conta atualizada.", "success")
     return redirect(next_url)
@@ -0,0 +1,267 @@
+"""
+Entrada ASGI (uvicorn): a busca pública roda em asyncio, o resto continua no Flask.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 2
+
+Rotas assíncronas (mesmas URLs, respostas e templates do app.py):
+- POST /                          – busca pela página (sem JavaScript)
+- POST /api/lookup                – cria o job; a busca é uma task do loop
+- GET  /api/lookup/<id>           – long-poll
+- GET  /api/lookup/<id>/events    – Server-Sent Events
+
+Nelas, a espera pelo IMAP (leitor_async), pelo banco (engine asyncio no Postgres) e
+pelas filas de cache/admissão não ocupa thread: um processo mantém centenas de
+buscas em andamento. As demais rotas (admin, GET /, estáticos, /metrics, ...) vão
+para o Flask pelo a2wsgi (WSGIMiddleware, num pool de threads), que entrega o corpo do
+pedido ao Flask em streaming (importação de contas) e a resposta em partes. O
+`gunicorn app:app` continua funcionando como antes.
+"""
+import asyncio
+import io
+import os
+import re
+import time
+from typing import AsyncIterator, Optional
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import jsonify, request
+from sqlalchemy import text
+
+import app as web
+import account_filter
+import admission
+import audit
+import db
+import jobs
+import leitor_async
+import lookup_cache
+import metrics
+import services
+
+# Threads para as rotas Flask repassadas (admin, páginas, estáticos)
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+
+# Corpo máximo das rotas assíncronas (formulário / JSON da busca, lido inteiro)
+_NATIVE_BODY_MAX = 64 << 10
+
+flask_app = web.app
+
+# -----------------------------------------------------------------------------
+# Busca assíncrona (as mesmas etapas de app._lookup_code / app._find_account)
+# -----------------------------------------------------------------------------
+async def _find_account(service: str, email: str):
+    if not account_filter.may_exist(service, email):
+        return None
+    engine = await asyncio.to_thread(db.get_async_engine)
+    if engine is None:
+        # SQLite: sem driver assíncrono, a consulta vai para uma thread
+        return await asyncio.to_thread(web._find_account, service, email)
+    generation = account_filter.generation()
+    sql, params = web._account_query(service, email)
+    with metrics.timer("db_account"):
+        async with engine.connect() as conn:
+            found = (await conn.execute(text(sql), params)).mappings().first()
+    if found is None:
+        account_filter.remember_miss(service, email, generation)
+    return found
+
+async def _lookup_code(service: str, email: str) -> Optional[dict]:
+    indexed, result = await asyncio.to_thread(web._indexed_code, service, email)
+    if indexed:
+        return result
+
+    async def scan():
+        async with admission.imap_slot_async(service, email):
+            with audit.imap_timer():
+                result = await leitor_async.fetch_login_code(service=service, target_email=email, lookback_days=7, max_scan=200)
+        return await asyncio.to_thread(web._compact, result)
+
+    return await lookup_cache.get_or_compute_async(service, email, scan)
+
+# -----------------------------------------------------------------------------
+# Rotas assíncronas
+# -----------------------------------------------------------------------------
+class _Stream:
+    """Resposta em fluxo (SSE): cabeçalhos de `response` + corpo vindo de `chunks`."""
+
+    def __init__(self, chunks: AsyncIterator[str], response):
+        self.chunks = chunks
+        self.response = response
+
+async def index_post():
+    started = time.perf_counter()
+    service, email, senha = web._lookup_form(request.form)
+
+    if services.canonical(service) is None:
+        return web._index_page("invalid_service", started, service, email)
+
+    wait = web._rate_limited(service, email)
+    if wait:
+        return web._index_page("rate_limited", started, service, email, retry_after=wait)
+
+    found = await _find_account(service, email)
+    if not found:
+        return web._index_page("no_account", started, service, email)
+
+    if not await asyncio.to_thread(web.check_password, found, senha):
+        return web._index_page("wrong_password", started, service, email)
+
+    try:
+        resultado = await _lookup_code(service, email)
+    except admission.Busy as e:
+        return web._index_page("busy", started, service, email, retry_after=e.retry_after)
+    except Exception as e:
+        print("ERRO AO BUSCAR EMAIL:", repr(e))
+        return web._index_page("error", started, service, email)
+    return web._index_page("hit" if resultado else "no_email", started, service, email, found=found, resultado=resultado)
+
+async def api_lookup_create():
+    data = request.get_json(silent=True) or request.form
+    service, email, senha = web._lookup_form(data)
+    deadline = web._lookup_deadline(data)
+
+    started = time.perf_counter()
+    if services.canonical(service) is None:
+        return web._api_refusal("invalid_service", started, service, email)
+
+    wait = web._rate_limited(service, email)
+    if wait:
+        return web._api_refusal("rate_limited", started, service, email, retry_after=wait)
+
+    found = await _find_account(service, email)
+    if not found:
+        return web._api_refusal("no_account", started, service, email)
+
+    if not await asyncio.to_thread(web.check_password, found, senha):
+        return web._api_refusal("wrong_password", started, service, email)
+
+    ip = web._client_ip()
+    job_id = await jobs.submit_async(
+        lambda: _lookup_code(service, email), deadline_seconds=deadline,
+        key=web._job_key(service, email), on_finish=web._job_finished(service, started, email, ip),
+        **web._job_fallbacks(found),
+    )
+    audit.record(services.canonical(service), email, "accepted", time.perf_counter() - started, ip)
+    return web._api_job_created(job_id)
+
+async def api_lookup_poll(job_id: str):
+    try:
+        wait = float(request.args.get("wait") or 25)
+    except ValueError:
+        wait = 25
+    job = await jobs.wait_async(job_id, timeout=max(0.0, min(wait, jobs.JOBS_MAX_WAIT)))
+    if job is None:
+        return jsonify(error="job not found"), 404
+    return jsonify(job)
+
+async def api_lookup_events(job_id: str):
+    if await asyncio.to_thread(jobs.get, job_id) is None:
+        return jsonify(error="job not found"), 404
+    resp = flask_app.response_class(mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return _Stream(jobs.events_async(job_id), resp)
+
+_ROUTES = [
+    ("POST", re.compile(r"/"), index_post),
+    ("POST", re.compile(r"/api/lookup"), api_lookup_create),
+    ("GET", re.compile(r"/api/lookup/(?P<job_id>[^/]+)"), api_lookup_poll),
+    ("GET", re.compile(r"/api/lookup/(?P<job_id>[^/]+)/events"), api_lookup_events),
+]
+
+def _route(method: str, path: str):
+    for route_method, pattern, view in _ROUTES:
+        m = pattern.fullmatch(path)
+        if m and route_method == method:
+            return view, m.groupdict()
+    return None
+
+# -----------------------------------------------------------------------------
+# ASGI <-> Flask
+# -----------------------------------------------------------------------------
+async def _read_body(receive) -> Optional[bytes]:
+    """Corpo de um pedido das rotas assíncronas; None se passar de _NATIVE_BODY_MAX."""
+    body = bytearray()
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if len(body) > _NATIVE_BODY_MAX:
+            return None
+        more = message.get("more_body", False)
+    return bytes(body)
+
+def _headers(pairs) -> list[tuple[bytes, bytes]]:
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in pairs]
+
+async def _native(view, kwargs: dict, environ: dict, send) -> None:
+    """Executa uma rota assíncrona dentro do contexto de pedido do Flask (como o full_dispatch_request)."""
+    ctx = flask_app.request_context(environ)
+    error = None
+    stream = None
+    ctx.push()
+    try:
+        try:
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view(**kwargs)
+                if isinstance(rv, _Stream):
+                    stream, rv = rv, rv.response
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            resp = flask_app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            resp = flask_app.handle_exception(e)
+
+        await send({"type": "http.response.start", "status": resp.status_code, "headers": _headers(resp.headers.items())})
+        if stream is not None and error is None:
+            async for chunk in stream.chunks:
+                await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            await send({"type": "http.response.body", "body": resp.get_data()})
+    finally:
+        ctx.pop(error)
+
+def _flask_wsgi(environ: dict, start_response):
+    # O corpo do a2wsgi termina com a última mensagem ASGI: sem Content-Length
+    # (upload chunked), o Werkzeug pode ler até o fim em vez de ver um corpo vazio
+    environ["wsgi.input_terminated"] = True
+    return flask_app(environ, start_response)
+
+_flask = WSGIMiddleware(_flask_wsgi, workers=ASGI_WSGI_THREADS)
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await leitor_async.close_pools()
+            await asyncio.to_thread(metrics.flush)
+            await asyncio.to_thread(audit.flush)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    path, root_path = scope["path"], scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    route = _route(scope["method"], path)
+    if route is None:
+        return await _flask(scope, receive, send)
+    body = await _read_body(receive)
+    if body is None:
+        await send({"type": "http.response.start", "status": 413, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Request Entity Too Large"})
+        return
+    await _native(route[0], route[1], build_environ(scope, io.BytesIO(body)), send)
@@ -0,0 +1,271 @@
+"""
+Registro das buscas públicas (quem buscou qual conta, quando e com que resultado).
+
+A busca não espera o banco: record() só põe o evento numa fila em memória
+(AUDIT_QUEUE_SIZE) e uma thread por processo grava em lotes — um INSERT de várias
+linhas a cada AUDIT_BATCH_SIZE eventos ou AUDIT_FLUSH_SECONDS, e o que sobrar na
+saída do processo. Com a fila cheia o evento é descartado e contado (nunca bloqueia).
+
+Cada lote também soma os totais por hora em `lookup_rollup` (serviço, resultado,
+duração, tempo de IMAP, descartes); o painel do admin lê só essa tabela.
+
+Uso:
+    token = audit.start()  # início do pedido (o Flask faz isso em before_request)
+    with audit.imap_timer():
+        ...  # busca no IMAP (o tempo vai no próximo record() deste contexto)
+    audit.record("netflix", "cliente@x.com", "hit", seconds=0.8, ip="203.0.113.7")
+    audit.end(token)  # fim do pedido (teardown_request)
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+import db
+
+AUDIT_ENABLED = os.environ.get("AUDIT_ENABLED", "1").lower() not in {"0", "false", "no", ""}
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "5000"))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", "2"))
+
+_STOP = object()
+_ROWS_PER_INSERT = 500
+
+# Tempo de IMAP da busca em andamento (lido e zerado pelo record() seguinte). Threads
+# reaproveitadas (gunicorn, pools) mantêm o contexto: start()/end() delimitam cada pedido.
+_imap_seconds: ContextVar[Optional[float]] = ContextVar("audit_imap_seconds", default=None)
+
+_queue: Optional[queue.Queue] = None
+_writer: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_lock = threading.Lock()
+# Contadores deste processo; os descartes ainda não gravados vão no próximo lote
+_stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+_drops_pending = 0
+
+def start() -> Token:
+    """Zera o tempo de IMAP no início de um pedido; passe o token para end() no fim."""
+    return _imap_seconds.set(None)
+
+def end(token: Token) -> None:
+    """Volta o contexto ao estado de antes do start() (o tempo não vaza para o próximo pedido)."""
+    try:
+        _imap_seconds.reset(token)
+    except ValueError:
+        # Token de outro contexto (não deveria acontecer): pelo menos zera
+        _imap_seconds.set(None)
+
+@contextmanager
+def imap_timer():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _imap_seconds.set(time.perf_counter() - started)
+
+def _ensure_writer() -> queue.Queue:
+    global _queue, _writer, _writer_pid
+    if _writer_pid != os.getpid():
+        with _lock:
+            # Depois de um fork (gunicorn --preload) o processo filho precisa da própria thread
+            if _writer_pid != os.getpid():
+                _queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+                _writer = threading.Thread(target=_write_loop, args=(_queue,), name="audit-writer", daemon=True)
+                _writer.start()
+                _writer_pid = os.getpid()
+    return _queue
+
+def record(service: str, email: str, outcome: str, seconds: float, ip: str = "") -> None:
+    """Enfileira um evento de busca (não bloqueia; com a fila cheia, descarta e conta)."""
+    global _drops_pending
+    imap = _imap_seconds.get()
+    _imap_seconds.set(None)
+    if not AUDIT_ENABLED:
+        return
+    event = (
+        datetime.utcnow(),
+        (service or "")[:64],
+        (email or "").strip().lower()[:320],
+        outcome,
+        int(seconds * 1000),
+        None if imap is None else int(imap * 1000),
+        (ip or "")[:64],
+    )
+    try:
+        _ensure_writer().put_nowait(event)
+    except queue.Full:
+        with _lock:
+            _stats["dropped"] += 1
+            _drops_pending += 1
+        return
+    with _lock:
+        _stats["queued"] += 1
+
+def stats() -> dict:
+    """Contadores deste processo: queued, written, dropped, failed (+ backlog atual da fila)."""
+    with _lock:
+        out = dict(_stats)
+    out["backlog"] = _queue.qsize() if _queue is not None and _writer_pid == os.getpid() else 0
+    return out
+
+# -----------------------------------------------------------------------------
+# Gravação em lotes
+# -----------------------------------------------------------------------------
+def _rollups(batch: list[tuple], drops: int) -> list[dict]:
+    totals: dict[tuple, list[int]] = {}
+    for at, service, _, outcome, total_ms, imap_ms, _ in batch:
+        key = (at.replace(minute=0, second=0, microsecond=0), service, outcome)
+        t = totals.setdefault(key, [0, 0, 0, 0])
+        t[0] += 1
+        t[1] += total_ms
+        if imap_ms is not None:
+            t[2] += imap_ms
+            t[3] += 1
+    if drops:
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        totals.setdefault((hour, "*", "dropped"), [0, 0, 0, 0])[0] += drops
+    return [
+        {"b": b, "s": s, "o": o, "n": n, "t": t, "im": im, "imn": imn}
+        for (b, s, o), (n, t, im, imn) in totals.items()
+    ]
+
+def _insert_events(conn, batch: list[tuple]) -> None:
+    # INSERT de várias linhas; no máximo _ROWS_PER_INSERT por comando (limite de parâmetros do SQLite)
+    for start in range(0, len(batch), _ROWS_PER_INSERT):
+        params, values = {}, []
+        for i, event in enumerate(batch[start:start + _ROWS_PER_INSERT]):
+            values.append(f"(:at{i}, :s{i}, :e{i}, :o{i}, :t{i}, :im{i}, :ip{i})")
+            for name, value in zip(("at", "s", "e", "o", "t", "im", "ip"), event):
+                params[f"{name}{i}"] = value
+        conn.execute(
+            text(f"""
+                INSERT INTO lookup_events (at, service, email, outcome, total_ms, imap_ms, client_ip)
+                VALUES {", ".join(values)}
+            """),
+            params,
+        )
+
+def _write(batch: list[tuple]) -> None:
+    global _drops_pending
+    with _lock:
+        drops, _drops_pending = _drops_pending, 0
+    rollups = _rollups(batch, drops)
+    try:
+        with db.get_engine().begin() as conn:
+            _insert_events(conn, batch)
+            if rollups:
+                conn.execute(
+                    text("""
+                        INSERT INTO lookup_rollup (bucket, service, outcome, n, total_ms, imap_ms, imap_n)
+                        VALUES (:b, :s, :o, :n, :t, :im, :imn)
+                        ON CONFLICT (bucket, service, outcome) DO UPDATE SET
+                            n = lookup_rollup.n + excluded.n,
+                            total_ms = lookup_rollup.total_ms + excluded.total_ms,
+                            imap_ms = lookup_rollup.imap_ms + excluded.imap_ms,
+                            imap_n = lookup_rollup.imap_n + excluded.imap_n
+                    """),
+                    rollups,
+                )
+    except Exception as e:
+        print("ERRO AO GRAVAR AUDITORIA:", repr(e))
+        with _lock:
+            _stats["failed"] += len(batch)
+            _drops_pending += drops
+        return
+    with _lock:
+        _stats["written"] += len(batch)
+
+def _write_loop(q: queue.Queue) -> None:
+    while True:
+        item = q.get()
+        batch, stop = [], item is _STOP
+        if not stop:
+            batch.append(item)
+        deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+        while not stop and len(batch) < AUDIT_BATCH_SIZE:
+            try:
+                item = q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+        if batch or (stop and _drops_pending):
+            _write(batch)
+        if stop:
+            return
+
+def flush(timeout: float = 5.0) -> None:
+    """Grava o que está na fila e encerra a thread deste processo (saída do worker)."""
+    global _writer_pid
+    with _lock:
+        if _writer_pid != os.getpid() or _writer is None:
+            return
+        q, writer, _writer_pid = _queue, _writer, None
+    try:
+        q.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+
+atexit.register(flush)
+
+# -----------------------------------------------------------------------------
+# Painel (só lookup_rollup e o índice por e-mail)
+# -----------------------------------------------------------------------------
+def summary(conn, hours: int) -> list[dict]:
+    """Totais por serviço e resultado nas últimas `hours` horas."""
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    rows = conn.execute(
+        text("""
+            SELECT service, outcome, SUM(n) AS n, SUM(total_ms) AS total_ms,
+                   SUM(imap_ms) AS imap_ms, SUM(imap_n) AS imap_n
+            FROM lookup_rollup WHERE bucket >= :since
+            GROUP BY service, outcome ORDER BY service, outcome
+        """),
+        {"since": since},
+    ).mappings().all()
+    return [
+        {
+            "service": r["service"],
+            "outcome": r["outcome"],
+            "n": int(r["n"]),
+            "avg_ms": round(r["total_ms"] / r["n"]) if r["n"] else None,
+            "avg_imap_ms": round(r["imap_ms"] / r["imap_n"]) if r["imap_n"] else None,
+        }
+        for r in rows
+    ]
+
+def hourly(conn, hours: int) -> list[dict]:
+    """Buscas por hora (todas as origens), para as últimas `hours` horas."""
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    rows = conn.execute(
+        text("""
+            SELECT bucket, SUM(CASE WHEN outcome = 'dropped' THEN 0 ELSE n END) AS n,
+                   SUM(CASE WHEN outcome = 'hit' THEN n ELSE 0 END) AS hits,
+                   SUM(CASE WHEN outcome = 'dropped' THEN n ELSE 0 END) AS dropped
+            FROM lookup_rollup WHERE bucket >= :since
+            GROUP BY bucket ORDER BY bucket DESC
+        """),
+        {"since": since},
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+def recent_for(conn, email: str, limit: int = 50) -> list[dict]:
+    """Últimas buscas de uma conta (índice por e-mail)."""
+    rows = conn.execute(
+        text("""
+            SELECT at, service, outcome, total_ms, imap_ms, client_ip FROM lookup_events
+            WHERE email = :e ORDER BY at DESC LIMIT :n
+        """),
+        {"e": (email or "").strip().lower(), "n": limit},
+    ).mappings().all()
+    return [dict(r) for r in rows]
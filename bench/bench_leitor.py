@@ -0,0 +1,158 @@
+"""
+Benchmark do leitor (fetch_login_code_email_html) contra o servidor IMAP falso.
+
+Para cada combinação de tamanho da caixa, posição do e-mail alvo, max_scan,
+lookback_days e cache local (LEITOR_CACHE) mede:
+- cold: primeira busca (conexão nova, cache vazio);
+- warm: buscas seguintes (sessão do pool, cache preenchido);
+com percentis de latência, round trips (comandos IMAP) e bytes trafegados por busca.
+
+    python bench/bench_leitor.py --quick
+    python bench/bench_leitor.py --sizes 1000,5000 --latency 0.005 --json antes.json
+    python bench/bench_leitor.py --json depois.json --compare antes.json
+
+Posição "none" = a caixa não tem o e-mail alvo (pior caso: varre até max_scan).
+O e-mail alvo tem `--age` dias (padrão 2), então lookback_days=1 também não o encontra.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Antes de importar o leitor: caixa falsa sem TLS e cache local descartável
+os.environ.update(
+    EMAIL_HOST="127.0.0.1", EMAIL_PORT="0", EMAIL_USERNAME="bench", EMAIL_PASSWORD="bench",
+    EMAIL_FOLDER="INBOX", EMAIL_SSL="0", IMAP_ROUTES="",
+    LOCAL_STORE_DIR=tempfile.mkdtemp(prefix="allcodes-bench-"),
+)
+
+import leitor  # noqa: E402
+from fake_imap import FakeImapServer  # noqa: E402
+from mailgen import TARGET_EMAIL, build_mailbox  # noqa: E402
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def _ints(arg: str) -> list:
+    return [None if v.strip().lower() == "none" else int(v) for v in arg.split(",")]
+
+def _lookup(srv: FakeImapServer, service: str, max_scan: int, lookback: int) -> dict:
+    before = (srv.stats.commands, srv.stats.bytes_out, srv.stats.bytes_in)
+    started = time.perf_counter()
+    html = leitor.fetch_login_code_email_html(service, TARGET_EMAIL, lookback_days=lookback, max_scan=max_scan)
+    elapsed = time.perf_counter() - started
+    return {
+        "ms": elapsed * 1000,
+        "round_trips": srv.stats.commands - before[0],
+        "bytes_out": srv.stats.bytes_out - before[1],
+        "bytes_in": srv.stats.bytes_in - before[2],
+        "found": html is not None,
+    }
+
+def _summary(samples: list[dict]) -> dict:
+    ms = [s["ms"] for s in samples]
+    return {
+        "n": len(samples),
+        "found": all(s["found"] for s in samples),
+        "p50_ms": statistics.median(ms),
+        "p90_ms": _pct(ms, 90),
+        "p99_ms": _pct(ms, 99),
+        "round_trips": statistics.median(s["round_trips"] for s in samples),
+        "kb_out": statistics.median(s["bytes_out"] for s in samples) / 1024,
+        "kb_in": statistics.median(s["bytes_in"] for s in samples) / 1024,
+    }
+
+def run(args) -> list[dict]:
+    rows = []
+    for size, position in itertools.product(args.sizes, args.positions):
+        box, _ = build_mailbox(size, service=args.service, position=position, age_days=args.age, seed=args.seed)
+        srv = FakeImapServer({"INBOX": box}, latency=args.latency).start()
+        os.environ["EMAIL_PORT"] = str(srv.port)
+        leitor._IMAP_CONFIG = leitor._IMAP_ROUTES = None
+        try:
+            for max_scan, lookback, cache in itertools.product(args.max_scan, args.lookback, args.cache):
+                leitor.LEITOR_CACHE = cache
+                cold, warm = [], []
+                for _ in range(args.cold):
+                    # Sessão nova e cache invalidado (o leitor descarta o cache quando o UIDVALIDITY muda)
+                    leitor._close_pools()
+                    box.uidvalidity += 1
+                    cold.append(_lookup(srv, args.service, max_scan, lookback))
+                for _ in range(args.repeat):
+                    warm.append(_lookup(srv, args.service, max_scan, lookback))
+                for mode, samples in (("cold", cold), ("warm", warm)):
+                    if not samples:
+                        continue
+                    row = {
+                        "size": size, "position": position, "max_scan": max_scan,
+                        "lookback": lookback, "cache": cache, "mode": mode,
+                    }
+                    row.update(_summary(samples))
+                    rows.append(row)
+                    _print_row(row)
+        finally:
+            leitor._close_pools()
+            srv.stop()
+    return rows
+
+_KEY = ("size", "position", "max_scan", "lookback", "cache", "mode")
+_HEADER = (f"{'size':>6} {'pos':>5} {'scan':>5} {'days':>4} {'cache':>5} {'mode':>4} {'found':>5} "
+           f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'rt':>5} {'KB out':>8} {'KB in':>7}")
+
+def _print_row(row: dict, base: dict = None) -> None:
+    line = (f"{row['size']:>6} {str(row['position']):>5} {row['max_scan']:>5} {row['lookback']:>4} "
+            f"{'on' if row['cache'] else 'off':>5} {row['mode']:>4} {'yes' if row['found'] else 'no':>5} "
+            f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['round_trips']:>5g} "
+            f"{row['kb_out']:>8.1f} {row['kb_in']:>7.1f}")
+    if base:
+        line += (f"   | antes p50 {base['p50_ms']:.1f} ms ({row['p50_ms'] / max(base['p50_ms'], 1e-9):.2f}x), "
+                 f"rt {base['round_trips']:g}, KB out {base['kb_out']:.1f}")
+    print(line, flush=True)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=_ints, default=[2000], help="e-mails na caixa (lista separada por vírgula)")
+    ap.add_argument("--positions", type=_ints, default=[0, 100, 1000, None],
+                    help="e-mails depois do alvo (0 = mais recente; none = ausente)")
+    ap.add_argument("--max-scan", type=_ints, default=[50, 200, 1000])
+    ap.add_argument("--lookback", type=_ints, default=[1, 7])
+    ap.add_argument("--cache", choices=["on", "off", "both"], default="both", help="LEITOR_CACHE")
+    ap.add_argument("--service", default="netflix")
+    ap.add_argument("--age", type=float, default=2.0, help="idade do e-mail alvo, em dias")
+    ap.add_argument("--latency", type=float, default=0.0, help="latência por comando IMAP, em segundos")
+    ap.add_argument("--cold", type=int, default=3, help="buscas frias por cenário")
+    ap.add_argument("--repeat", type=int, default=10, help="buscas quentes por cenário")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--quick", action="store_true", help="matriz pequena (1000 e-mails, poucas repetições)")
+    ap.add_argument("--json", help="grava os resultados neste arquivo")
+    ap.add_argument("--compare", help="resultados anteriores (--json) para comparar lado a lado")
+    args = ap.parse_args()
+    args.cache = {"on": [True], "off": [False], "both": [True, False]}[args.cache]
+    if args.quick:
+        args.sizes, args.positions, args.max_scan, args.lookback = [1000], [0, 100, None], [200], [7]
+        args.cold, args.repeat = 2, 5
+
+    print(_HEADER)
+    rows = run(args)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {tuple(r[k] for k in _KEY): r for r in json.load(f)["rows"]}
+        print("\nComparação com", args.compare)
+        print(_HEADER)
+        for row in rows:
+            _print_row(row, baseline.get(tuple(row[k] for k in _KEY)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in {"json", "compare"}}, "rows": rows}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Mede o cold start: tempo de `import app` e do primeiro pedido, cada rodada num
+processo novo (como um worker do gunicorn ou uma function da Netlify "fria").
+
+    python bench/coldstart.py                 # 10 rodadas, GET /
+    python bench/coldstart.py -n 20 --path /admin/login
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+resp = app.app.test_client().get(sys.argv[1])
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_ms": (t2 - t1) * 1000, "status": resp.status_code}))
+"""
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=10, help="rodadas (processos novos)")
+    ap.add_argument("--path", default="/", help="rota do primeiro pedido")
+    args = ap.parse_args()
+
+    runs = []
+    for _ in range(args.n):
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, args.path],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{args.n} rodadas, primeiro pedido GET {args.path} -> {runs[0]['status']}")
+    for key, label in (("import_ms", "import app"), ("first_ms", "1º pedido")):
+        values = [r[key] for r in runs]
+        print(f"  {label:<11} p50 {statistics.median(values):7.1f} ms   p90 {_pct(values, 90):7.1f} ms   "
+              f"min {min(values):7.1f} ms")
+
+if __name__ == "__main__":
+    main()
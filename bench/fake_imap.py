@@ -0,0 +1,435 @@
+"""
+Servidor IMAP falso, em processo, para os benchmarks do leitor.
+
+Implementa o suficiente do IMAP4rev1 para o leitor e o indexador: LOGIN, SELECT /
+EXAMINE, (UID) SEARCH com os critérios que o leitor gera, (UID) FETCH de
+cabeçalhos e corpo, NOOP e IDLE. Conta comandos (round trips) e bytes trafegados
+e pode acrescentar uma latência fixa por comando.
+
+    srv = FakeImapServer({"INBOX": box}, latency=0.005).start()
+    ... EMAIL_HOST=127.0.0.1 EMAIL_PORT=srv.port EMAIL_SSL=0 ...
+"""
+import email
+import re
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from email.header import decode_header, make_header
+from email.message import Message
+from typing import Optional
+
+def _decoded(msg: Message, name: str) -> str:
+    raw = msg.get(name, "") or ""
+    try:
+        # UTF-8 cru no cabeçalho (RFC 6532) vem como "unknown-8bit"
+        parts = [(c.decode("utf-8", "replace"), "utf-8") if cs == "unknown-8bit" else (c, cs)
+                 for c, cs in decode_header(raw)]
+        return str(make_header(parts))
+    except Exception:
+        return str(raw)
+
+class FakeMessage:
+    """Um e-mail da caixa: bytes crus + campos já decodificados para o SEARCH."""
+
+    def __init__(self, uid: int, raw: bytes, internal_date: datetime):
+        self.uid = uid
+        self.raw = raw
+        self.internal_date = internal_date
+        self.msg = email.message_from_bytes(raw)
+        self.flags: set[str] = set()
+        self.subject = _decoded(self.msg, "Subject").lower()
+        self.from_ = " ".join(_decoded(self.msg, h) for h in ("From", "Sender")).lower()
+        self.to = " ".join(_decoded(self.msg, h) for h in ("To", "Cc")).lower()
+
+    def header_fields(self, names: list[str]) -> bytes:
+        wanted = {n.lower() for n in names}
+        head = self.raw.split(b"\r\n\r\n", 1)[0]
+        out = []
+        current: list[bytes] = []
+        keep = False
+        for line in head.split(b"\r\n"):
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    current.append(line)
+                continue
+            if keep and current:
+                out.extend(current)
+            current = [line]
+            keep = line.split(b":", 1)[0].strip().decode("ascii", "replace").lower() in wanted
+        if keep and current:
+            out.extend(current)
+        return b"\r\n".join(out) + b"\r\n\r\n"
+
+class Mailbox:
+    """Uma pasta. `append` avisa as sessões em IDLE."""
+
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages: list[FakeMessage] = []
+        self.next_uid = 1
+        self.lock = threading.Lock()
+        self.listeners: list = []
+
+    def append(self, raw: bytes, internal_date: Optional[datetime] = None) -> int:
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append(FakeMessage(uid, raw, internal_date or datetime.now(tz=timezone.utc)))
+            listeners = list(self.listeners)
+        for cb in listeners:
+            cb()
+        return uid
+
+class Stats:
+    """Comandos recebidos (por tipo), bytes em cada sentido e conexões abertas."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.commands = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.connections = 0
+        self.by_command: dict[str, int] = {}
+
+    def add(self, cmd: str, bytes_in: int):
+        with self.lock:
+            self.commands += 1
+            self.bytes_in += bytes_in
+            self.by_command[cmd] = self.by_command.get(cmd, 0) + 1
+
+    def sent(self, n: int):
+        with self.lock:
+            self.bytes_out += n
+
+_TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+
+def _tokens(data: bytes) -> list:
+    out = []
+    for m in _TOKEN_RE.finditer(data):
+        tok = m.group(0)
+        if tok.startswith(b'"'):
+            out.append(("str", re.sub(rb'\\(.)', rb'\1', tok[1:-1]).decode("utf-8", "replace")))
+        elif tok in (b"(", b")"):
+            out.append(("sym", tok.decode()))
+        else:
+            out.append(("atom", tok.decode("utf-8", "replace")))
+    return out
+
+def _parse_set(spec: str, maximum: int) -> set[int]:
+    out: set[int] = set()
+    for part in spec.split(","):
+        if ":" in part:
+            a, b = part.split(":", 1)
+            lo = maximum if a == "*" else int(a)
+            hi = maximum if b == "*" else int(b)
+            lo, hi = min(lo, hi), max(lo, hi)
+            out.update(range(lo, hi + 1))
+        else:
+            out.add(maximum if part == "*" else int(part))
+    return out
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+
+def _imap_date(s: str):
+    d, m, y = s.split("-")
+    return datetime(int(y), _MONTHS[m.lower()], int(d)).date()
+
+class _Search:
+    """Critérios do SEARCH -> predicados (AND implícito, OR / NOT / parênteses)."""
+
+    def __init__(self, tokens, messages):
+        self.toks = tokens
+        self.i = 0
+        self.messages = messages
+
+    def next(self):
+        t = self.toks[self.i]
+        self.i += 1
+        return t
+
+    def parse_key(self):
+        kind, val = self.next()
+        if kind == "sym" and val == "(":
+            preds = []
+            while self.toks[self.i] != ("sym", ")"):
+                preds.append(self.parse_key())
+            self.i += 1
+            return lambda m, seq: all(p(m, seq) for p in preds)
+        key = val.upper()
+        if key == "ALL":
+            return lambda m, seq: True
+        if key == "OR":
+            a, b = self.parse_key(), self.parse_key()
+            return lambda m, seq: a(m, seq) or b(m, seq)
+        if key == "NOT":
+            a = self.parse_key()
+            return lambda m, seq: not a(m, seq)
+        if key in ("SUBJECT", "FROM", "TO"):
+            needle = self.next()[1].lower()
+            attr = {"SUBJECT": "subject", "FROM": "from_", "TO": "to"}[key]
+            return lambda m, seq: needle in getattr(m, attr)
+        if key in ("SINCE", "BEFORE", "ON"):
+            d = _imap_date(self.next()[1])
+            if key == "SINCE":
+                return lambda m, seq: m.internal_date.date() >= d
+            if key == "BEFORE":
+                return lambda m, seq: m.internal_date.date() < d
+            return lambda m, seq: m.internal_date.date() == d
+        if key == "UID":
+            spec = self.next()[1]
+            maximum = self.messages[-1].uid if self.messages else 0
+            uids = _parse_set(spec, maximum)
+            return lambda m, seq: m.uid in uids
+        if key in ("SEEN", "UNSEEN"):
+            want = key == "SEEN"
+            return lambda m, seq: ("\\Seen" in m.flags) == want
+        if re.match(r"^[\d*:,]+$", key):
+            seqs = _parse_set(key, len(self.messages))
+            return lambda m, seq: seq in seqs
+        raise ValueError(f"critério não suportado: {key}")
+
+    def run(self):
+        preds = []
+        while self.i < len(self.toks):
+            preds.append(self.parse_key())
+        return [
+            (seq, m) for seq, m in enumerate(self.messages, 1)
+            if all(p(m, seq) for p in preds)
+        ]
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stats.connections += 1
+        self.selected: Optional[Mailbox] = None
+        self.known = 0
+
+    def _send(self, data: bytes):
+        self.server.stats.sent(len(data))
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def _line(self, s: str):
+        self._send(s.encode("utf-8") + b"\r\n")
+
+    def handle(self):
+        self._line("* OK FakeIMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            raw_len = len(line)
+            line = line.rstrip(b"\r\n")
+            # literais do cliente: {n}
+            while True:
+                m = re.search(rb"\{(\d+)\+?\}$", line)
+                if not m:
+                    break
+                n = int(m.group(1))
+                self._line("+ go ahead")
+                lit = self.rfile.read(n)
+                rest = self.rfile.readline()
+                raw_len += n + len(rest)
+                line = line[: m.start()] + b'"' + lit.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"' + rest.rstrip(b"\r\n")
+            parts = line.split(b" ", 2)
+            if len(parts) < 2:
+                continue
+            tag = parts[0].decode()
+            cmd = parts[1].decode().upper()
+            args = parts[2] if len(parts) > 2 else b""
+            uid_mode = False
+            if cmd == "UID":
+                uid_mode = True
+                sub = args.split(b" ", 1)
+                cmd = sub[0].decode().upper()
+                args = sub[1] if len(sub) > 1 else b""
+            self.server.stats.add(("UID " if uid_mode else "") + cmd, raw_len)
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            try:
+                if not getattr(self, "cmd_" + cmd.lower(), None):
+                    self._line(f"{tag} BAD unknown command")
+                    continue
+                if getattr(self, "cmd_" + cmd.lower())(tag, args, uid_mode) == "BYE":
+                    return
+            except (ValueError, IndexError, KeyError) as e:
+                self._line(f"{tag} BAD {e}")
+
+    def cmd_capability(self, tag, args, uid_mode):
+        self._line("* CAPABILITY IMAP4rev1 IDLE UIDPLUS LITERAL+")
+        self._line(f"{tag} OK CAPABILITY completed")
+
+    def cmd_login(self, tag, args, uid_mode):
+        toks = _tokens(args)
+        user, pw = toks[0][1], toks[1][1]
+        if self.server.credentials and self.server.credentials != (user, pw):
+            self._line(f"{tag} NO [AUTHENTICATIONFAILED] invalid credentials")
+            return
+        self._line(f"{tag} OK LOGIN completed")
+
+    def _select(self, tag, args):
+        name = _tokens(args)[0][1]
+        box = self.server.mailboxes.get(name)
+        if box is None:
+            self._line(f"{tag} NO mailbox does not exist")
+            return
+        self.selected = box
+        with box.lock:
+            n = len(box.messages)
+            nxt = box.next_uid
+        self.known = n
+        self._line(f"* {n} EXISTS")
+        self._line("* 0 RECENT")
+        self._line(f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid")
+        self._line(f"* OK [UIDNEXT {nxt}] Predicted next UID")
+        self._line(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    def cmd_select(self, tag, args, uid_mode):
+        self._select(tag, args)
+
+    def cmd_examine(self, tag, args, uid_mode):
+        self._select(tag, args)
+
+    def _exists_update(self):
+        if self.selected is None:
+            return
+        with self.selected.lock:
+            n = len(self.selected.messages)
+        if n != self.known:
+            self.known = n
+            self._line(f"* {n} EXISTS")
+
+    def cmd_noop(self, tag, args, uid_mode):
+        self._exists_update()
+        self._line(f"{tag} OK NOOP completed")
+
+    def cmd_check(self, tag, args, uid_mode):
+        self._line(f"{tag} OK CHECK completed")
+
+    def cmd_search(self, tag, args, uid_mode):
+        toks = _tokens(args)
+        if toks and toks[0][1].upper() == "CHARSET":
+            toks = toks[2:]
+        with self.selected.lock:
+            messages = list(self.selected.messages)
+        hits = _Search(toks, messages).run()
+        nums = [str(m.uid if uid_mode else seq) for seq, m in hits]
+        self._line("* SEARCH" + ("" if not nums else " " + " ".join(nums)))
+        self._line(f"{tag} OK SEARCH completed")
+
+    def cmd_fetch(self, tag, args, uid_mode):
+        spec, items = args.split(b" ", 1)
+        items = items.decode().strip()
+        if items.startswith("(") and items.endswith(")"):
+            items = items[1:-1]
+        with self.selected.lock:
+            messages = list(self.selected.messages)
+        if uid_mode:
+            maximum = messages[-1].uid if messages else 0
+            wanted = _parse_set(spec.decode(), maximum)
+            targets = [(seq, m) for seq, m in enumerate(messages, 1) if m.uid in wanted]
+        else:
+            wanted = _parse_set(spec.decode(), len(messages))
+            targets = [(seq, m) for seq, m in enumerate(messages, 1) if seq in wanted]
+        for seq, m in targets:
+            chunks: list[bytes] = []
+            literal: Optional[bytes] = None
+            label = ""
+            peek = False
+            upper = items.upper()
+            if uid_mode or "UID" in re.findall(r"\bUID\b", upper):
+                chunks.append(f"UID {m.uid}".encode())
+            if "FLAGS" in upper.split():
+                chunks.append(("FLAGS (" + " ".join(sorted(m.flags)) + ")").encode())
+            hf = re.search(r"BODY(\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]", items, re.I)
+            if hf:
+                peek = bool(hf.group(1))
+                names = hf.group(2).split()
+                literal = m.header_fields(names)
+                label = f"BODY[HEADER.FIELDS ({' '.join(n.upper() for n in names)})]"
+            elif re.search(r"BODY\.PEEK\[\]", items, re.I):
+                peek = True
+                literal = m.raw
+                label = "BODY[]"
+            elif re.search(r"BODY\[\]", items, re.I):
+                literal = m.raw
+                label = "BODY[]"
+            elif re.search(r"\bRFC822\b", items, re.I):
+                literal = m.raw
+                label = "RFC822"
+            if literal is not None and not peek:
+                m.flags.add("\\Seen")
+            head = f"* {seq} FETCH (" + " ".join(c.decode() for c in chunks)
+            if literal is not None:
+                head += (" " if chunks else "") + f"{label} {{{len(literal)}}}"
+                self._send(head.encode() + b"\r\n" + literal + b")\r\n")
+            else:
+                self._send(head.encode() + b")\r\n")
+        self._line(f"{tag} OK FETCH completed")
+
+    def cmd_idle(self, tag, args, uid_mode):
+        box = self.selected
+        event = threading.Event()
+        box.listeners.append(event.set)
+        self._line("+ idling")
+        try:
+            self.connection.settimeout(0.05)
+            buf = b""
+            while True:
+                if event.is_set():
+                    event.clear()
+                    self._exists_update()
+                try:
+                    data = self.connection.recv(64)
+                except socket.timeout:
+                    continue
+                if not data:
+                    return "BYE"
+                buf += data
+                if b"DONE" in buf.upper():
+                    break
+        finally:
+            self.connection.settimeout(None)
+            box.listeners.remove(event.set)
+        self._line(f"{tag} OK IDLE terminated")
+
+    def cmd_close(self, tag, args, uid_mode):
+        self.selected = None
+        self._line(f"{tag} OK CLOSE completed")
+
+    def cmd_logout(self, tag, args, uid_mode):
+        self._line("* BYE logging out")
+        self._line(f"{tag} OK LOGOUT completed")
+        return "BYE"
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailboxes: dict, latency: float = 0.0, credentials=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.mailboxes = mailboxes
+        self.latency = latency
+        self.credentials = credentials
+        self.stats = Stats()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
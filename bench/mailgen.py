@@ -0,0 +1,150 @@
+"""
+Gerador de caixas sintéticas para os benchmarks do leitor.
+
+Mistura e-mails de código dos serviços do registro (Disney+, Netflix, Prime, Crunchyroll,
+Max) com ruído — newsletters, recibos e "quase iguais" que contêm o nome do serviço mas
+não são de código — em vários charsets (utf-8, iso-8859-1, windows-1252), com assuntos
+codificados (RFC 2047, B e Q) e corpos em quoted-printable / base64.
+
+É determinístico (semente fixa): a mesma chamada gera sempre a mesma caixa.
+
+    box, target = build_mailbox(5000, service="netflix", position=100, age_days=2)
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from email import charset as email_charset
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import SMTPUTF8
+from email.utils import format_datetime
+from typing import Optional
+
+from fake_imap import Mailbox
+
+TARGET_EMAIL = "cliente.alvo@exemplo.com"
+
+# Assuntos / remetentes / corpos dos e-mails de código (assuntos iguais aos de services.SERVICES)
+CODE_EMAILS = {
+    "disney": [
+        ("Your one-time passcode for Disney+", "Disney+ <disneyplus@trx.mail2.disneyplus.com>",
+         "<p>Use this one-time passcode to log in:</p><h1>{code6}</h1>"),
+        ("Tu código de acceso único para Disney+", "Disney+ <disneyplus@trx.mail2.disneyplus.com>",
+         "<p>Usa este código de acceso único:</p><h1>{code6}</h1><p>Válido por 15 minutos.</p>"),
+    ],
+    "netflix": [
+        ("Netflix: Your sign-in code", "Netflix <info@account.netflix.com>",
+         "<p>Enter this code to sign in</p><td>{code4}</td><p>© Netflix</p>"),
+    ],
+    "prime": [
+        ("Tentativa de login", "Amazon <conta-atualizacao@amazon.com.br>",
+         "<p>Alguém tentou entrar na sua conta.</p><p>Código de verificação: <b>{code6}</b></p>"),
+    ],
+    "crunchyroll": [
+        ("Confirma tu nuevo inicio de sesión", "Crunchyroll <hello@info.crunchyroll.com>",
+         '<p>Confirma que eres tú:</p><a href="https://sso.crunchyroll.com/confirm?t={code6}">Confirmar</a>'),
+    ],
+    "max": [
+        ("Urgente: Tu código de un solo uso", "Max <no-reply@alerts.max.com>",
+         "<p>Tu código de un solo uso es</p><h2>{code6}</h2>"),
+    ],
+}
+
+NOISE_EMAILS = [
+    ("Sua fatura chegou", "Banco <fatura@banco.com.br>", "<p>Valor: R$ {n},90 — vencimento em {n} dias.</p>"),
+    ("Newsletter semanal nº {n}", "Notícias <news@jornal.com>", "<p>As manchetes da semana, edição {n}.</p>"),
+    ("Pedido {n} enviado", "Loja <pedidos@loja.com>", "<p>Seu pedido {n} está a caminho. Código de rastreio BR{n}XX.</p>"),
+    ("Promoção: até {n}% off", "Ofertas <promo@ofertas.com>", "<p>Aproveite! Cupom ÉPOCA{n}.</p>"),
+    # Parecidos com os de código, mas não são (testam o filtro)
+    ("Netflix: novidades desta semana", "Netflix <info@mailer.netflix.com>", "<p>Novos títulos: {n} estreias.</p>"),
+    ("Prime Day: ofertas exclusivas", "Amazon <ofertas@amazon.com.br>", "<p>{n} ofertas relâmpago.</p>"),
+    ("Disney+ | Estreias do mês", "Disney+ <news@disneyplus.com>", "<p>{n} séries novas.</p>"),
+    ("Crunchyroll: nuevos episodios", "Crunchyroll <hello@info.crunchyroll.com>", "<p>{n} episodios.</p>"),
+]
+
+# (charset do corpo/assunto, codificação do assunto)
+CHARSETS = [("utf-8", "q"), ("utf-8", "b"), ("iso-8859-1", "q"), ("windows-1252", "b"), ("utf-8", None)]
+
+OTHER_RECIPIENTS = [f"cliente{i}@exemplo.com" for i in range(50)]
+
+def _subject(text: str, charset: str, encoding: Optional[str]) -> str:
+    if encoding is None or text.isascii():
+        return text
+    cs = email_charset.Charset(charset)
+    cs.header_encoding = email_charset.QP if encoding == "q" else email_charset.BASE64
+    return Header(text, cs).encode()
+
+def make_message(subject: str, sender: str, recipient: str, body_html: str, when: datetime, rnd: random.Random) -> bytes:
+    """E-mail multipart/alternative (texto + HTML) em CRLF, charset e codificação sorteados."""
+    charset, encoding = rnd.choice(CHARSETS)
+    try:
+        body_html.encode(charset)
+        subject.encode(charset)
+    except UnicodeEncodeError:
+        charset = "utf-8"
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = _subject(subject, charset, encoding)
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Date"] = format_datetime(when)
+    msg["Message-ID"] = f"<{rnd.getrandbits(64):x}@bench.local>"
+    plain = body_html.replace("<p>", "").replace("</p>", "\n")
+    msg.attach(MIMEText(plain, "plain", charset))
+    msg.attach(MIMEText(f"<html><body>{body_html}</body></html>", "html", charset))
+    return msg.as_bytes(policy=SMTPUTF8)
+
+def _code_email(service: str, recipient: str, when: datetime, rnd: random.Random) -> bytes:
+    subject, sender, body = rnd.choice(CODE_EMAILS[service])
+    body = body.format(code4=f"{rnd.randrange(10000):04d}", code6=f"{rnd.randrange(10 ** 6):06d}")
+    return make_message(subject, sender, recipient, body, when, rnd)
+
+def build_mailbox(
+    size: int,
+    service: str = "netflix",
+    position: Optional[int] = 0,
+    age_days: float = 0.0,
+    span_days: float = 30.0,
+    code_ratio: float = 0.15,
+    seed: int = 42,
+    uidvalidity: int = 1,
+) -> tuple[Mailbox, Optional[int]]:
+    """
+    Caixa com `size` e-mails em ordem cronológica, espalhados pelos últimos `span_days`.
+
+    - `position`: quantos e-mails chegam DEPOIS do e-mail alvo (0 = é o mais recente;
+      None = a caixa não tem e-mail de código do serviço para TARGET_EMAIL);
+    - `age_days`: idade do e-mail alvo (os que vêm depois dele ficam entre ele e agora);
+    - `code_ratio`: fração de e-mails de código (de todos os serviços) para outros clientes.
+
+    Retorna (caixa, UID do e-mail alvo ou None).
+    """
+    rnd = random.Random(seed)
+    now = datetime.now(tz=timezone.utc)
+    target_index = None if position is None else max(0, size - 1 - position)
+
+    # Datas crescentes; o alvo fica em now - age_days e os posteriores entre ele e agora
+    if target_index is None:
+        dates = sorted(now - timedelta(days=rnd.uniform(0, span_days)) for _ in range(size))
+    else:
+        target_at = now - timedelta(days=age_days)
+        before = sorted(target_at - timedelta(days=rnd.uniform(0, max(0.0, span_days - age_days)))
+                        for _ in range(target_index))
+        after = sorted(target_at + timedelta(days=rnd.uniform(0, age_days)) for _ in range(size - target_index - 1))
+        dates = before + [target_at] + after
+
+    box = Mailbox(uidvalidity=uidvalidity)
+    target_uid = None
+    for i, when in enumerate(dates):
+        if i == target_index:
+            target_uid = box.append(_code_email(service, TARGET_EMAIL, when, rnd), when)
+            continue
+        if rnd.random() < code_ratio:
+            raw = _code_email(rnd.choice(list(CODE_EMAILS)), rnd.choice(OTHER_RECIPIENTS), when, rnd)
+        else:
+            subject, sender, body = rnd.choice(NOISE_EMAILS)
+            n = rnd.randrange(1, 1000)
+            # Ruído também vai para o cliente alvo (o filtro por destinatário não basta)
+            recipient = TARGET_EMAIL if rnd.random() < 0.3 else rnd.choice(OTHER_RECIPIENTS)
+            raw = make_message(subject.format(n=n), sender, recipient, body.format(n=n), when, rnd)
+        box.append(raw, when)
+    return box, target_uid
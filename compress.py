@@ -0,0 +1,79 @@
+"""
+Compressão das respostas do Flask (brotli ou gzip, conforme o Accept-Encoding).
+
+Vale para HTML, JSON, CSS, JS e texto acima de COMPRESS_MIN_BYTES. Respostas em fluxo
+(SSE, arquivos enviados com send_file) e as que já têm Content-Encoding passam direto.
+As demais levam `Vary: Accept-Encoding`, para caches/CDN não trocarem as versões.
+
+    app.after_request(compress.compress_response)
+"""
+import gzip
+import os
+from typing import Optional
+
+import brotli
+from flask import request
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "512"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+CODINGS = ("br", "gzip")
+
+_TYPES = {"text/html", "text/plain", "text/css", "text/javascript", "application/javascript", "application/json"}
+
+def _accepted(header: str) -> set[str]:
+    """Codificações aceitas pelo cliente (as com q=0 ficam de fora)."""
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def choose(accept_encoding: str) -> Optional[str]:
+    """Melhor codificação que o cliente aceita ("br", "gzip") ou None."""
+    accepted = _accepted(accept_encoding)
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def encode(data: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def compress_response(response):
+    """after_request: comprime o corpo quando o cliente aceita e vale a pena."""
+    if (response.mimetype not in _TYPES or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.status_code < 200 or response.status_code in (204, 304) or request.method == "HEAD":
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    coding = choose(request.headers.get("Accept-Encoding", ""))
+    if coding is None:
+        return response
+    body = encode(data, coding)
+    if len(body) >= len(data):
+        return response
+    response.set_data(body)
+    response.headers["Content-Encoding"] = coding
+    etag, weak = response.get_etag()
+    if etag:
+        # A versão comprimida é outra representação: ETag própria
+        response.set_etag(f"{etag}-{coding}", weak)
+    return response
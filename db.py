@@ -0,0 +1,64 @@
+"""
+Conexão com o banco (SQLite local / Postgres Heroku com psycopg3).
+
+O engine só é criado no primeiro uso (`get_engine()`), não no import: o cold start
+do gunicorn e da function da Netlify não paga driver nem conexão antes do primeiro
+pedido que precise do banco. Invocações "quentes" reaproveitam o mesmo engine.
+
+Para o servidor ASGI há `get_async_engine()`: no Postgres, o mesmo psycopg3 em modo
+assíncrono; no SQLite não há driver assíncrono instalado e as consultas vão para
+threads (asyncio.to_thread) com o engine normal.
+"""
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+import env
+
+env.load_env()
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///local.db")
+
+# Ajuste de dialect para psycopg3 quando for Postgres
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+psycopg://", 1)
+elif DATABASE_URL.startswith("postgresql://") and "+psycopg" not in DATABASE_URL:
+    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
+
+# Aplica migrações pendentes no primeiro uso do banco. Em produção, prefira rodar
+# `python migrations.py` no deploy (Procfile "release") e definir AUTO_MIGRATE=0.
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1").lower() not in {"0", "false", "no", ""}
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(DATABASE_URL, future=True)
+                if AUTO_MIGRATE:
+                    import migrations
+                    migrations.migrate(engine)
+                _engine = engine
+    return _engine
+
+_async_engine = None  # sqlalchemy.ext.asyncio.AsyncEngine (importado só no primeiro uso)
+
+def get_async_engine():
+    """Engine asyncio (só Postgres; None no SQLite). As migrações passam antes pelo engine normal."""
+    global _async_engine
+    if not DATABASE_URL.startswith("postgresql+psycopg"):
+        return None
+    if _async_engine is None:
+        if AUTO_MIGRATE:
+            get_engine()
+        with _engine_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import create_async_engine
+                _async_engine = create_async_engine(DATABASE_URL)
+    return _async_engine
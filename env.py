@@ -0,0 +1,20 @@
+"""
+Carrega o .env uma única vez por processo (funciona mesmo se rodar de outra pasta).
+
+Os módulos que leem configuração chamam `load_env()` antes de consultar os.environ;
+as chamadas seguintes não fazem nada.
+"""
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+def load_env() -> None:
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv, find_dotenv
+            load_dotenv(find_dotenv(), override=False)
+            _loaded = True
@@ -0,0 +1,82 @@
+"""
+Extração do código de uso único (ou link de login) dos e-mails de cada serviço.
+
+Em vez de devolver o HTML inteiro do e-mail (dezenas/centenas de KB com pixels de
+rastreio), a busca devolve um resultado compacto: código, link, assunto e data.
+O HTML completo só é mostrado quando o cliente pede.
+"""
+import html
+import re
+from datetime import datetime
+from typing import Optional
+
+import services
+
+# Palavras que costumam vir logo antes do código
+_CODE_HINTS = re.compile(
+    r"c[oó]digo|code|passcode|senha|contrase[nñ]a|otp|verifica",
+    re.IGNORECASE,
+)
+# Links que nunca são o de login (rodapé)
+_LINK_SKIP = re.compile(
+    r"unsubscribe|preferenc|privacy|privacidad|privacidade|terms|termos|terminos|help|ayuda|ajuda|"
+    r"support|notificationsettings|emailsettings|legal|cookie|\.(?:png|jpe?g|gif)(?:\?|$)",
+    re.IGNORECASE,
+)
+
+_STRIP_BLOCKS = re.compile(r"<(style|script|head|title)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAGS = re.compile(r"<[^>]+>")
+_HREFS = re.compile(r"""<a\b[^>]*\bhref\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+def _visible_text(body_html: str) -> str:
+    text = _STRIP_BLOCKS.sub(" ", body_html or "")
+    text = _TAGS.sub(" ", text)
+    return re.sub(r"\s+", " ", html.unescape(text)).strip()
+
+def _find_code(text: str, digits: int) -> Optional[str]:
+    pattern = re.compile(rf"(?<![\d.,/:-])(\d{{{digits}}})(?![\d.,/:-]*\d)")
+    candidates = [m for m in pattern.finditer(text)]
+    if not candidates:
+        return None
+    # Preferência: o primeiro número logo depois de "código"/"code"/...
+    for m in candidates:
+        before = text[max(0, m.start() - 120):m.start()]
+        if _CODE_HINTS.search(before):
+            return m.group(1)
+    # Senão, o primeiro que não pareça um ano (© 2025 etc.)
+    for m in candidates:
+        if not (digits == 4 and re.fullmatch(r"(19|20)\d\d", m.group(1))):
+            return m.group(1)
+    return None
+
+def _find_link(body_html: str, hosts: list[str]) -> Optional[str]:
+    if not hosts:
+        return None
+    for raw in _HREFS.findall(body_html or ""):
+        url = html.unescape(raw).strip()
+        if not url.lower().startswith(("https://", "http://")):
+            continue
+        host = url.split("/", 3)[2].lower()
+        if any(h in host for h in hosts) and not _LINK_SKIP.search(url):
+            return url
+    return None
+
+def extract_login_code(service: str, body_html: str) -> dict:
+    """{"code": ..., "link": ...} (None quando não encontrado)."""
+    rules = services.SERVICES.get(services.canonical(service), {"code_digits": 6, "link_hosts": []})
+    code = _find_code(_visible_text(body_html), rules["code_digits"])
+    # Com código, o link não é necessário (e costuma ser de "não fui eu")
+    link = None if code else _find_link(body_html, rules["link_hosts"])
+    return {"code": code, "link": link}
+
+def compact_result(service: str, subject: str, msg_date: datetime, body_html: str) -> dict:
+    """Resultado compacto (pequeno o bastante para cachear e devolver na API) de um e-mail de código."""
+    found = extract_login_code(service, body_html)
+    return {
+        "service": service,
+        "subject": subject,
+        "date": msg_date.strftime("%d/%m/%Y %H:%M UTC"),
+        "received_at": msg_date.isoformat(),
+        "code": found["code"],
+        "link": found["link"],
+    }
@@ -0,0 +1,226 @@
+"""
+Indexador de e-mails de código (processo separado ou thread em segundo plano).
+
+Mantém um IMAP IDLE aberto na caixa principal (EMAIL_FOLDER) e, a cada e-mail novo, guarda no
+banco o e-mail de código mais recente por (serviço, destinatário). O index_post
+responde a partir desse índice enquanto o indexador estiver ativo (heartbeat
+recente) e só volta para a busca ao vivo quando o índice estiver desatualizado.
+
+Uso (Procfile):  indexer: python indexer.py
+"""
+import json
+import os
+import select
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.engine import Engine
+
+import extract
+import leitor
+import services
+
+# Tempo máximo em IDLE antes de renovar o heartbeat (RFC 2177 pede < 29 min)
+INDEXER_IDLE_SECONDS = float(os.environ.get("INDEXER_IDLE_SECONDS", "60"))
+# Sem heartbeat por mais tempo que isso, o índice é considerado desatualizado
+INDEXER_STALE_SECONDS = float(os.environ.get("INDEXER_STALE_SECONDS", "180"))
+INDEXER_LOOKBACK_DAYS = int(os.environ.get("INDEXER_LOOKBACK_DAYS", "7"))
+
+# -----------------------------------------------------------------------------
+# Leitura (usada pelo app)
+# -----------------------------------------------------------------------------
+def lookup(engine: Engine, service: str, recipient: str, lookback_days: int = 7) -> tuple[bool, Optional[dict]]:
+    """
+    Consulta o índice. Retorna (atualizado, resultado):
+    - atualizado=False: indexador parado/atrasado, faça a busca ao vivo;
+    - atualizado=True e resultado=None: não há e-mail recente para esse destinatário;
+    - resultado: o mesmo dict de leitor.fetch_login_code (compacto + "email_html").
+    """
+    if not leitor.IMAP_MATCH_RECIPIENT:
+        # Sem filtro por destinatário a busca ao vivo não usa a mesma chave do índice
+        return False, None
+    if leitor.mailboxes_for(service, recipient) != [leitor.default_mailbox()]:
+        # O indexador só acompanha a caixa principal; outras rotas vão pela busca ao vivo
+        return False, None
+
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT h.heartbeat_at, i.msg_date, i.email_html, i.result_json
+                FROM login_code_indexer h
+                LEFT JOIN login_code_index i ON i.service = :s AND i.recipient = :r
+                WHERE h.id = 1
+            """).columns(heartbeat_at=DateTime, msg_date=DateTime),
+            {"s": services.canonical(service), "r": (recipient or "").strip().lower()},
+        ).mappings().first()
+
+    now = datetime.utcnow()
+    if not row or not row["heartbeat_at"] or row["heartbeat_at"] < now - timedelta(seconds=INDEXER_STALE_SECONDS):
+        return False, None
+    if not row["msg_date"] or row["msg_date"] < now - timedelta(days=lookback_days):
+        return True, None
+    if row["result_json"]:
+        result = json.loads(row["result_json"])
+    else:
+        # Linha indexada antes da extração existir
+        result = extract.compact_result(services.canonical(service), "", row["msg_date"], row["email_html"])
+    result["email_html"] = row["email_html"]
+    return True, result
+
+# -----------------------------------------------------------------------------
+# Escrita (processo indexador)
+# -----------------------------------------------------------------------------
+def _utc_naive(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _load_state(engine: Engine, uidvalidity: int) -> dict:
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT uidvalidity, last_uid FROM login_code_indexer WHERE id = 1")
+        ).mappings().first()
+    if not row or int(row["uidvalidity"] or 0) != uidvalidity:
+        # Pasta recriada / UIDs renumerados: sincroniza a janela inteira de novo
+        return {"uidvalidity": uidvalidity, "last_uid": 0}
+    return {"uidvalidity": uidvalidity, "last_uid": int(row["last_uid"] or 0)}
+
+def _save_state(engine: Engine, state: dict) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO login_code_indexer (id, uidvalidity, last_uid, heartbeat_at)
+                VALUES (1, :v, :u, :now)
+                ON CONFLICT (id) DO UPDATE SET
+                    uidvalidity = excluded.uidvalidity,
+                    last_uid = excluded.last_uid,
+                    heartbeat_at = excluded.heartbeat_at
+            """),
+            {"v": state["uidvalidity"], "u": state["last_uid"], "now": datetime.utcnow()},
+        )
+
+def _store(engine: Engine, entries: list[dict]) -> None:
+    if not entries:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO login_code_index (service, recipient, msg_uid, msg_date, email_html, result_json, indexed_at)
+                VALUES (:s, :r, :u, :d, :h, :j, :now)
+                ON CONFLICT (service, recipient) DO UPDATE SET
+                    msg_uid = excluded.msg_uid,
+                    msg_date = excluded.msg_date,
+                    email_html = excluded.email_html,
+                    result_json = excluded.result_json,
+                    indexed_at = excluded.indexed_at
+                WHERE excluded.msg_date >= login_code_index.msg_date
+            """),
+            entries,
+        )
+
+def _sync(imap, engine: Engine, state: dict) -> None:
+    """Indexa os e-mails com UID maior que o último visto (dentro da janela)."""
+    since = datetime.now(tz=timezone.utc) - timedelta(days=INDEXER_LOOKBACK_DAYS)
+    criteria = ["SINCE", since.strftime("%d-%b-%Y")]
+    if state["last_uid"]:
+        criteria = ["UID", f"{state['last_uid'] + 1}:*"] + criteria
+    typ, data = imap.uid("SEARCH", *criteria)
+    if typ != "OK":
+        return
+    # "n:*" sempre inclui o último e-mail, mesmo com UID menor que n
+    uids = [u for u in (data[0] or b"").split() if int(u) > state["last_uid"]]
+
+    for start in range(0, len(uids), 100):
+        batch = uids[start:start + 100]
+        headers = leitor._fetch_headers(imap, batch)
+        entries = []
+        now = datetime.utcnow()
+        for uid in batch:
+            head = headers.get(uid)
+            if head is None:
+                continue
+            subject, sender, recipients, msg_date = leitor._header_fields(head)
+            matched = services.classify(subject, sender)
+            if not matched or not recipients or msg_date < since:
+                continue
+            msg = leitor._fetch_message(imap, uid)
+            if msg is None:
+                continue
+            body_html = leitor._html_or_text(msg)
+            email_html = leitor._render_email(subject, msg_date, body_html)
+            for svc in matched:
+                result_json = json.dumps(extract.compact_result(svc, subject, msg_date, body_html))
+                for r in recipients:
+                    entries.append({
+                        "s": svc, "r": r, "u": uid.decode(), "d": _utc_naive(msg_date),
+                        "h": email_html, "j": result_json, "now": now,
+                    })
+        _store(engine, entries)
+        state["last_uid"] = max(int(u) for u in batch)
+        _save_state(engine, state)
+
+def _idle_wait(imap, timeout: float) -> bool:
+    """
+    Envia IDLE e aguarda até `timeout` segundos por novidades na pasta.
+    Retorna True se o servidor avisou algo (EXISTS etc.) antes do timeout.
+    """
+    tag = imap._new_tag()
+    imap.send(tag + b" IDLE\r\n")
+    resp = imap.readline()
+    if not resp.startswith(b"+"):
+        raise RuntimeError(f"Servidor IMAP recusou IDLE: {resp!r}")
+
+    # select() no socket bruto; dados já decifrados pelo SSL ficam em pending()
+    pending = getattr(imap.sock, "pending", lambda: 0)()
+    readable = pending or select.select([imap.sock], [], [], timeout)[0]
+    changed = False
+    if readable:
+        changed = b"EXISTS" in imap.readline()
+
+    imap.send(b"DONE\r\n")
+    while True:
+        line = imap.readline()
+        if not line:
+            raise RuntimeError("Conexão IMAP encerrada durante o IDLE")
+        if line.startswith(tag):
+            break
+        changed = changed or b"EXISTS" in line
+    return changed
+
+def run(engine: Engine, stop: Optional[threading.Event] = None) -> None:
+    """Laço principal: conecta, sincroniza, fica em IDLE; reconecta com backoff em caso de erro."""
+    stop = stop or threading.Event()
+    backoff = 1.0
+    while not stop.is_set():
+        imap = None
+        try:
+            imap = leitor._connect_select(leitor.default_mailbox())
+            state = _load_state(engine, imap.uidvalidity)
+            backoff = 1.0
+            while not stop.is_set():
+                _sync(imap, engine, state)
+                _save_state(engine, state)  # heartbeat
+                _idle_wait(imap, INDEXER_IDLE_SECONDS)
+        except Exception as e:
+            print("ERRO NO INDEXADOR:", repr(e))
+            stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+        finally:
+            if imap is not None:
+                leitor._logout_quietly(imap)
+
+_THREAD: Optional[threading.Thread] = None
+_THREAD_LOCK = threading.Lock()
+
+def start_in_background(engine: Engine) -> threading.Thread:
+    """Roda o indexador numa thread daemon deste processo (uma por processo)."""
+    global _THREAD
+    with _THREAD_LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _THREAD = threading.Thread(target=run, args=(engine,), name="login-code-indexer", daemon=True)
+            _THREAD.start()
+        return _THREAD
+
+if __name__ == "__main__":
+    import db
+    run(db.get_engine())
@@ -0,0 +1,340 @@
+"""
+Jobs assíncronos de busca de código.
+
+POST /api/lookup cria o job e responde na hora com o id; a busca roda numa thread
+do worker e é repetida até o e-mail chegar ou o prazo acabar. Entre uma tentativa e
+outra o job sai do pool (uma thread de agendamento o devolve na hora certa), e jobs
+da mesma conta dividem a tentativa em andamento em vez de repetir a busca IMAP. O estado fica no
+SQLite local (visível para todos os workers do host) e é entregue por long-poll
+(GET /api/lookup/<id>) ou Server-Sent Events (GET /api/lookup/<id>/events).
+
+No servidor ASGI (asgi.py) as mesmas operações têm versões asyncio (`submit_async`,
+`wait_async`, `events_async`): o job vira uma task do loop em vez de uma thread.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterator, NamedTuple, Optional
+
+import localstore
+
+JOBS_THREADS = int(os.environ.get("JOBS_THREADS", "4"))
+# Intervalo entre tentativas enquanto o e-mail não chega
+JOBS_RETRY_SECONDS = float(os.environ.get("JOBS_RETRY_SECONDS", "5"))
+JOBS_DEFAULT_DEADLINE = float(os.environ.get("JOBS_DEFAULT_DEADLINE", "120"))
+JOBS_MAX_DEADLINE = float(os.environ.get("JOBS_MAX_DEADLINE", "300"))
+# Máximo que um long-poll / stream SSE segura a conexão
+JOBS_MAX_WAIT = float(os.environ.get("JOBS_MAX_WAIT", "30"))
+
+_POLL_SECONDS = 0.5
+_SSE_PING_SECONDS = 15.0
+# Jobs terminados ficam consultáveis por este tempo
+_KEEP_SECONDS = 3600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    created_at REAL NOT NULL,
+    deadline REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class _Job(NamedTuple):
+    id: str
+    key: Hashable
+    lookup: Callable[[], Any]
+    deadline: float
+    not_found: Any
+    error: Any
+    on_finish: Optional[Callable[[str], None]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Tentativas agendadas (quando, seq, job): uma thread só espera por todas
+_timers: list = []
+_timers_cond = threading.Condition()
+_timer_pid: Optional[int] = None
+_seq = itertools.count()
+# Tentativa em andamento por chave (neste processo): jobs da mesma conta esperam por ela
+_inflight: dict = {}
+_inflight_lock = threading.Lock()
+_inflight_async: dict = {}
+# Referências às tasks asyncio em andamento (o loop só guarda referências fracas)
+_tasks: set = set()
+
+def _db() -> sqlite3.Connection:
+    return localstore.connect("lookup-jobs", _SCHEMA)
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOBS_THREADS, thread_name_prefix="lookup-job")
+        return _executor
+
+def _set(job_id: str, status: str, result: Any) -> None:
+    _db().execute(
+        "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+        (status, json.dumps(result), time.time(), job_id),
+    )
+
+def _finish(job: _Job, status: str, result: Any) -> None:
+    _set(job.id, status, result)
+    if job.on_finish is not None:
+        try:
+            job.on_finish(status)
+        except Exception as e:
+            print("ERRO NO JOB DE BUSCA:", repr(e))
+
+def _outcome(job: _Job, result: Any, failed: bool) -> Optional[str]:
+    """Status final da tentativa, ou None se ainda há prazo para outra."""
+    if result:
+        return "done"
+    if time.time() + JOBS_RETRY_SECONDS <= job.deadline:
+        return None
+    return "error" if failed else "not_found"
+
+def _final(job: _Job, status: str, result: Any) -> Any:
+    return result if status == "done" else job.error if status == "error" else job.not_found
+
+# -----------------------------------------------------------------------------
+# Jobs em threads: cada tentativa ocupa o pool só enquanto busca
+# -----------------------------------------------------------------------------
+def _later(delay: float, job: _Job) -> None:
+    """Põe `job` de volta no pool daqui a `delay` segundos (sem prender uma thread do pool)."""
+    global _timer_pid
+    with _timers_cond:
+        if _timer_pid != os.getpid():
+            # Depois de um fork o processo filho precisa da própria thread
+            threading.Thread(target=_timer_loop, name="lookup-job-timer", daemon=True).start()
+            _timer_pid = os.getpid()
+        heapq.heappush(_timers, (time.monotonic() + delay, next(_seq), job))
+        _timers_cond.notify()
+
+def _timer_loop() -> None:
+    while True:
+        with _timers_cond:
+            while not _timers or _timers[0][0] > time.monotonic():
+                _timers_cond.wait(_timers[0][0] - time.monotonic() if _timers else None)
+            _, _, job = heapq.heappop(_timers)
+        try:
+            _pool().submit(_attempt, job)
+        except Exception as e:
+            print("ERRO NO JOB DE BUSCA:", repr(e))
+
+def _attempt(job: _Job) -> None:
+    """
+    Uma tentativa do job. Se outro job da mesma chave já está buscando, espera o
+    resultado dele (callback, sem prender a thread) em vez de repetir a busca IMAP.
+    """
+    # Contexto novo a cada tentativa: ContextVars (como o tempo de IMAP do audit) não
+    # passam de um job para o seguinte na mesma thread do pool
+    contextvars.Context().run(_try, job)
+
+def _try(job: _Job) -> None:
+    with _inflight_lock:
+        shared = _inflight.get(job.key)
+        owner = shared is None
+        if owner:
+            shared = Future()
+            _inflight[job.key] = shared
+    if not owner:
+        shared.add_done_callback(lambda f: _settle(job, f))
+        return
+
+    attempt: Future = Future()
+    try:
+        attempt.set_result(job.lookup())
+    except Exception as e:
+        attempt.set_exception(e)
+    with _inflight_lock:
+        del _inflight[job.key]
+    # O próprio job antes dos que esperavam: o registro dele leva o tempo de IMAP da tentativa
+    _settle(job, attempt)
+    if attempt.exception() is None:
+        shared.set_result(attempt.result())
+    else:
+        shared.set_exception(attempt.exception())
+
+def _settle(job: _Job, attempt: Future) -> None:
+    try:
+        result, failed = attempt.result(), False
+    except Exception as e:
+        print("ERRO NO JOB DE BUSCA:", repr(e))
+        result, failed = None, True
+    try:
+        status = _outcome(job, result, failed)
+        if status is None:
+            _later(JOBS_RETRY_SECONDS, job)
+        else:
+            _finish(job, status, _final(job, status, result))
+    except Exception as e:
+        print("ERRO NO JOB DE BUSCA:", repr(e))
+
+# -----------------------------------------------------------------------------
+# Jobs asyncio: uma task por job, tentativas da mesma chave compartilhadas
+# -----------------------------------------------------------------------------
+async def _attempt_async(job: _Job) -> Any:
+    shared = _inflight_async.get(job.key)
+    if shared is not None:
+        try:
+            # shield: job que desiste (cancelado) não cancela a busca dos outros
+            return await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            if shared.cancelled():
+                raise RuntimeError("busca compartilhada interrompida") from None
+            raise
+
+    # A busca roda na task deste job (tempo de IMAP do audit no contexto dela); os demais esperam o Future
+    shared = asyncio.get_running_loop().create_future()
+    shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight_async[job.key] = shared
+    try:
+        result = await job.lookup()
+    except Exception as e:
+        shared.set_exception(e)
+        raise
+    except BaseException:
+        shared.cancel()
+        raise
+    finally:
+        if _inflight_async.get(job.key) is shared:
+            del _inflight_async[job.key]
+    shared.set_result(result)
+    return result
+
+async def _run_async(job: _Job) -> None:
+    while True:
+        try:
+            result, failed = await _attempt_async(job), False
+        except Exception as e:
+            print("ERRO NO JOB DE BUSCA:", repr(e))
+            result, failed = None, True
+        status = _outcome(job, result, failed)
+        if status is not None:
+            break
+        await asyncio.sleep(JOBS_RETRY_SECONDS)
+    await asyncio.to_thread(_finish, job, status, _final(job, status, result))
+
+def _create(deadline_seconds: float) -> tuple[str, float]:
+    now = time.time()
+    deadline = now + max(5.0, min(deadline_seconds, JOBS_MAX_DEADLINE))
+    job_id = secrets.token_urlsafe(18)
+    db = _db()
+    db.execute("DELETE FROM jobs WHERE updated_at < ? AND status != 'pending'", (now - _KEEP_SECONDS,))
+    db.execute(
+        "INSERT INTO jobs (id, status, result, created_at, deadline, updated_at) VALUES (?, 'pending', NULL, ?, ?, ?)",
+        (job_id, now, deadline, now),
+    )
+    return job_id, deadline
+
+def submit(lookup: Callable[[], Any], deadline_seconds: float, not_found: Any, error: Any,
+           key: Hashable = None, on_finish: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Enfileira `lookup` (repetida até achar o e-mail ou vencer o prazo) e devolve o id do job.
+    O resultado (JSON) é o retorno de `lookup`, ou `not_found` / `error` se o prazo acabar.
+    O id é aleatório e funciona como credencial de leitura do resultado.
+
+    Jobs com a mesma `key` (a conta) aproveitam a tentativa que já estiver em andamento
+    no processo. `on_finish(status)` é chamada uma vez, com o status final do job.
+    """
+    job_id, deadline = _create(deadline_seconds)
+    job = _Job(job_id, key if key is not None else job_id, lookup, deadline, not_found, error, on_finish)
+    _pool().submit(_attempt, job)
+    return job_id
+
+async def submit_async(lookup: Callable[[], Awaitable[Any]], deadline_seconds: float, not_found: Any, error: Any,
+                       key: Hashable = None, on_finish: Optional[Callable[[str], None]] = None) -> str:
+    """Como submit, com `lookup` assíncrona rodando como task do loop atual."""
+    job_id, deadline = await asyncio.to_thread(_create, deadline_seconds)
+    job = _Job(job_id, key if key is not None else job_id, lookup, deadline, not_found, error, on_finish)
+    task = asyncio.get_running_loop().create_task(_run_async(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+def get(job_id: str) -> Optional[dict]:
+    row = _db().execute(
+        "SELECT status, result, deadline FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    status, result, deadline = row
+    result = json.loads(result) if result else None
+    if status == "pending" and time.time() > deadline + JOBS_RETRY_SECONDS + 60:
+        # O worker que executava o job morreu/reiniciou
+        status, result = "error", None
+    return {"job_id": job_id, "status": status, "result": result}
+
+def wait(job_id: str, timeout: float) -> Optional[dict]:
+    """Espera até `timeout` segundos o job sair de 'pending'."""
+    end = time.monotonic() + timeout
+    while True:
+        job = get(job_id)
+        if job is None or job["status"] != "pending" or time.monotonic() >= end:
+            return job
+        time.sleep(_POLL_SECONDS)
+
+def events(job_id: str) -> Iterator[str]:
+    """Stream SSE: 'status' enquanto espera, 'result' no fim (o cliente reconecta se o stream fechar antes)."""
+    end = time.monotonic() + JOBS_MAX_WAIT
+    last_ping = time.monotonic()
+    yield "retry: 1000\n\n"
+    while True:
+        job = get(job_id)
+        if job is None:
+            yield "event: gone\ndata: {}\n\n"
+            return
+        if job["status"] != "pending":
+            yield f"event: result\ndata: {json.dumps(job)}\n\n"
+            return
+        now = time.monotonic()
+        if now >= end:
+            yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            return
+        if now - last_ping >= _SSE_PING_SECONDS:
+            yield ": ping\n\n"
+            last_ping = now
+        time.sleep(_POLL_SECONDS)
+
+async def wait_async(job_id: str, timeout: float) -> Optional[dict]:
+    """wait() sem prender uma thread durante a espera."""
+    end = time.monotonic() + timeout
+    while True:
+        job = await asyncio.to_thread(get, job_id)
+        if job is None or job["status"] != "pending" or time.monotonic() >= end:
+            return job
+        await asyncio.sleep(_POLL_SECONDS)
+
+async def events_async(job_id: str) -> AsyncIterator[str]:
+    """events() para asyncio (mesmas mensagens SSE)."""
+    end = time.monotonic() + JOBS_MAX_WAIT
+    last_ping = time.monotonic()
+    yield "retry: 1000\n\n"
+    while True:
+        job = await asyncio.to_thread(get, job_id)
+        if job is None:
+            yield "event: gone\ndata: {}\n\n"
+            return
+        if job["status"] != "pending":
+            yield f"event: result\ndata: {json.dumps(job)}\n\n"
+            return
+        now = time.monotonic()
+        if now >= end:
+            yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            return
+        if now - last_ping >= _SSE_PING_SECONDS:
+            yield ": ping\n\n"
+            last_ping = now
+        await asyncio.sleep(_POLL_SECONDS)
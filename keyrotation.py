@@ -0,0 +1,180 @@
+"""
+Rotação da chave Fernet de `password_enc` com o site no ar.
+
+Com FERNET_KEYS="nova,antiga" o app lê senhas cifradas com qualquer das chaves
+(MultiFernet) e grava sempre com a primeira. Esta rotina recifra o que ainda está
+na chave antiga, em lotes por id:
+
+    flask --app app rotate-keys --batch-size 500 --rate 200
+
+Cada lote é lido fora de transação e gravado numa transação curta, linha a linha
+com `WHERE password_enc = <valor lido>` (uma senha editada no meio do caminho não é
+sobrescrita). O progresso fica em `fernet_rotation` (uma linha por chave nova):
+interrompida, a rotação continua do último id gravado. Ao terminar, tire a chave
+antiga de FERNET_KEYS.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+import account_search
+
+# Linhas por lote e limite de linhas por segundo (0 = sem limite)
+KEY_ROTATION_BATCH = int(os.environ.get("KEY_ROTATION_BATCH", "500"))
+KEY_ROTATION_RATE = float(os.environ.get("KEY_ROTATION_RATE", "200"))
+
+def key_id(key: str) -> str:
+    """Identificador curto (não secreto) de uma chave Fernet."""
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+def _row(conn, kid: str) -> Optional[dict]:
+    row = conn.execute(text("SELECT * FROM fernet_rotation WHERE key_id = :k"), {"k": kid}).mappings().first()
+    return dict(row) if row else None
+
+def status(engine: Engine, key: str) -> dict:
+    """Progresso da rotação para a chave `key` (a primeira de FERNET_KEYS)."""
+    kid = key_id(key)
+    with engine.connect() as conn:
+        row = _row(conn, kid)
+        # Estimativa (estatística do Postgres / contador do SQLite): barata a cada lote
+        total, _ = account_search.count(conn, "", {})
+    if row is None:
+        return {"key_id": kid, "state": "not_started", "total": total}
+    done = row["rotated"] + row["unchanged"] + row["failed"]
+    row["state"] = "finished" if row["finished_at"] else "in_progress"
+    row["total"] = max(total, done)
+    row["percent"] = round(100.0 * done / row["total"], 1) if row["total"] else 100.0
+    return row
+
+def _start(engine: Engine, kid: str) -> dict:
+    with engine.begin() as conn:
+        row = _row(conn, kid)
+        if row is None:
+            now = datetime.utcnow()
+            conn.execute(
+                text("""
+                    INSERT INTO fernet_rotation (key_id, last_id, rotated, unchanged, failed, started_at, updated_at)
+                    VALUES (:k, 0, 0, 0, 0, :now, :now)
+                """),
+                {"k": kid, "now": now},
+            )
+            row = _row(conn, kid)
+    return row
+
+def _plan(rows, primary: Fernet, every: MultiFernet,
+          verifier: Callable[[str, str, str], str], verifier_prefix: str) -> tuple[list[dict], int, int]:
+    """(UPDATEs a fazer, linhas já em dia, linhas que nenhuma chave abre) de um lote."""
+    updates, unchanged, failed = [], 0, 0
+    for r in rows:
+        token = (r["password_enc"] or "").encode()
+        try:
+            plain, current = primary.decrypt(token), True
+        except InvalidToken:
+            try:
+                plain, current = every.decrypt(token), False
+            except InvalidToken:
+                failed += 1
+                continue
+        # Verificador de outra PASSWORD_VERIFIER_KEY (ou de formato antigo): regrava junto
+        stale = not (r["password_verifier"] or "").startswith(verifier_prefix)
+        if current and not stale:
+            unchanged += 1
+            continue
+        updates.append({
+            "i": r["id"],
+            "old": r["password_enc"],
+            "new": r["password_enc"] if current else primary.encrypt(plain).decode(),
+            "v": verifier(r["platform_canonical"], r["email_norm"], plain.decode()) if stale else r["password_verifier"],
+            "rotated": not current,
+        })
+    return updates, unchanged, failed
+
+def rotate(
+    engine: Engine,
+    keys: list[str],
+    verifier: Callable[[str, str, str], str],
+    verifier_prefix: str,
+    batch_size: int = KEY_ROTATION_BATCH,
+    rate: float = KEY_ROTATION_RATE,
+    restart: bool = False,
+    log: Callable[[str], None] = None,
+) -> dict:
+    """
+    Recifra com keys[0] as senhas de streaming_accounts ainda em outra chave de `keys`,
+    retomando do checkpoint (`restart` recomeça do primeiro id). Devolve o status final.
+    """
+    primary = Fernet(keys[0])
+    every = MultiFernet([Fernet(k) for k in keys])
+    kid = key_id(keys[0])
+    if restart:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM fernet_rotation WHERE key_id = :k"), {"k": kid})
+    state = _start(engine, kid)
+    if state["finished_at"]:
+        if log:
+            log(f"Rotação para a chave {kid} já concluída.")
+        return status(engine, keys[0])
+
+    last_id = state["last_id"]
+    while True:
+        started = time.monotonic()
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT id, platform_canonical, email_norm, password_enc, password_verifier FROM streaming_accounts
+                    WHERE id > :last ORDER BY id LIMIT :n
+                """),
+                {"last": last_id, "n": batch_size},
+            ).mappings().all()
+        if not rows:
+            break
+
+        updates, unchanged, failed = _plan(rows, primary, every, verifier, verifier_prefix)
+        rotated = 0
+        with engine.begin() as conn:
+            for u in updates:
+                written = conn.execute(
+                    text("""
+                        UPDATE streaming_accounts SET password_enc = :new, password_verifier = :v
+                        WHERE id = :i AND password_enc = :old
+                    """),
+                    u,
+                ).rowcount
+                if written and u["rotated"]:
+                    rotated += 1
+                else:
+                    # Só o verificador, ou a senha foi regravada (já na chave nova) no meio do lote
+                    unchanged += 1
+            last_id = rows[-1]["id"]
+            conn.execute(
+                text("""
+                    UPDATE fernet_rotation
+                    SET last_id = :last, rotated = rotated + :r, unchanged = unchanged + :u,
+                        failed = failed + :f, updated_at = :now
+                    WHERE key_id = :k
+                """),
+                {"last": last_id, "r": rotated, "u": unchanged, "f": failed, "now": datetime.utcnow(), "k": kid},
+            )
+        if failed:
+            print("ERRO NA ROTAÇÃO DE CHAVE:", f"{failed} senha(s) que nenhuma chave abre (até id {last_id})")
+        if log:
+            s = status(engine, keys[0])
+            log(f"{s['percent']}% – {s['rotated']} recifradas, {s['unchanged']} já em dia, "
+                f"{s['failed']} sem chave (até id {last_id})")
+
+        # Limite de taxa: o banco continua atendendo as buscas com folga
+        if rate > 0:
+            time.sleep(max(0.0, len(rows) / rate - (time.monotonic() - started)))
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE fernet_rotation SET finished_at = :now, updated_at = :now WHERE key_id = :k"),
+            {"now": datetime.utcnow(), "k": kid},
+        )
+    return status(engine, keys[0])
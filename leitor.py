@@ -1,42 +1,150 @@
 import os
+import time
+import atexit
 import imaplib
 import email
 import html
-import unicodedata
+import json
+import re
+import threading
+from contextlib import contextmanager
 from email.header import decode_header, make_header
 from email.message import Message
 from email.utils import getaddresses
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple, Optional, List
 
-from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv(), override=False)
+import env
+env.load_env()
+
+import extract  # noqa: E402
+import localstore  # noqa: E402
+import metrics  # noqa: E402
+import services  # noqa: E402
 
 # -----------------------------------------------------------------------------
 # Compatibilidade de variáveis (.env)
 # Aceita NOVO padrão (EMAIL_HOST/EMAIL_USERNAME/EMAIL_PASSWORD) e ANTIGO (IMAP_HOST/EMAIL/APP_PASSWORD)
+# Lida no primeiro uso (não no import), uma vez por processo.
 # -----------------------------------------------------------------------------
-IMAP_HOST = os.environ.get("EMAIL_HOST") or os.environ.get("IMAP_HOST") or ""
-IMAP_PORT = int(os.environ.get("EMAIL_PORT", "993"))
-IMAP_USER = os.environ.get("EMAIL_USERNAME") or os.environ.get("EMAIL") or ""
-IMAP_PASS = os.environ.get("EMAIL_PASSWORD") or os.environ.get("APP_PASSWORD") or ""
-IMAP_FOLDER = os.environ.get("EMAIL_FOLDER", "INBOX")
+class Mailbox(NamedTuple):
+    """Uma pasta de uma conta IMAP (chave do pool de sessões e do cache local)."""
+    host: str
+    port: int
+    user: str
+    password: str
+    folder: str
+    ssl: bool = True
+
+    @property
+    def key(self) -> str:
+        return f"{self.user}@{self.host}:{self.port}/{self.folder}"
+
+_IMAP_CONFIG: Optional[dict] = None
+_IMAP_ROUTES: Optional[list[dict]] = None
+_IMAP_CONFIG_LOCK = threading.Lock()
+
+def imap_config() -> dict:
+    """Caixa principal (EMAIL_HOST / EMAIL_USERNAME / EMAIL_PASSWORD / EMAIL_FOLDER)."""
+    global _IMAP_CONFIG
+    if _IMAP_CONFIG is None:
+        _IMAP_CONFIG = {
+            "host": os.environ.get("EMAIL_HOST") or os.environ.get("IMAP_HOST") or "",
+            "port": int(os.environ.get("EMAIL_PORT", "993")),
+            "user": os.environ.get("EMAIL_USERNAME") or os.environ.get("EMAIL") or "",
+            "password": os.environ.get("EMAIL_PASSWORD") or os.environ.get("APP_PASSWORD") or "",
+            "folder": os.environ.get("EMAIL_FOLDER", "INBOX"),
+            "ssl": os.environ.get("EMAIL_SSL", "1").lower() not in {"0", "false", "no", ""},
+        }
+    return _IMAP_CONFIG
+
+def default_mailbox() -> Mailbox:
+    cfg = imap_config()
+    return Mailbox(cfg["host"], cfg["port"], cfg["user"], cfg["password"], cfg["folder"], cfg["ssl"])
+
+def _imap_routes() -> list[dict]:
+    """
+    Rotas de IMAP_ROUTES (JSON): lista de {"services", "domains", "host", "port",
+    "user", "password" | "password_env", "ssl", "folders"}. O que faltar vem da caixa
+    principal; sem "services"/"domains" a rota vale para todos.
+    """
+    global _IMAP_ROUTES
+    with _IMAP_CONFIG_LOCK:
+        if _IMAP_ROUTES is None:
+            cfg = imap_config()
+            routes = []
+            for r in json.loads(os.environ.get("IMAP_ROUTES") or "[]"):
+                password = os.environ.get(r["password_env"], "") if r.get("password_env") else r.get("password")
+                base = Mailbox(
+                    r.get("host") or cfg["host"],
+                    int(r.get("port") or cfg["port"]),
+                    r.get("user") or cfg["user"],
+                    password or cfg["password"],
+                    cfg["folder"],
+                    bool(r.get("ssl", cfg["ssl"])),
+                )
+                routes.append({
+                    "services": {services.canonical(x) or x for x in r.get("services") or []},
+                    "domains": {d.strip().lower().lstrip("@") for d in r.get("domains") or []},
+                    "mailboxes": [base._replace(folder=f) for f in r.get("folders") or [cfg["folder"]]],
+                })
+            _IMAP_ROUTES = routes
+        return _IMAP_ROUTES
+
+def mailboxes_for(service: str, target_email: str) -> list[Mailbox]:
+    """Caixas/pastas onde procurar os e-mails do serviço para esse destinatário (em ordem)."""
+    service = services.canonical(service) or service
+    domain = (target_email or "").strip().lower().rpartition("@")[2]
+    found: list[Mailbox] = []
+    for r in _imap_routes():
+        if r["services"] and service not in r["services"]:
+            continue
+        if r["domains"] and domain not in r["domains"]:
+            continue
+        found.extend(m for m in r["mailboxes"] if m not in found)
+    return found or [default_mailbox()]
+
+# Busca em várias caixas: threads do processo e espera máxima por caixa (segundos)
+IMAP_FANOUT_WORKERS = int(os.environ.get("IMAP_FANOUT_WORKERS", "8"))
+IMAP_MAILBOX_TIMEOUT = float(os.environ.get("IMAP_MAILBOX_TIMEOUT", "20"))
+
+# Pool de sessões IMAP (por processo / worker do gunicorn)
+IMAP_POOL_SIZE = int(os.environ.get("IMAP_POOL_SIZE", "2"))
+IMAP_POOL_IDLE_SECONDS = float(os.environ.get("IMAP_POOL_IDLE_SECONDS", "240"))
+IMAP_POOL_WAIT_SECONDS = float(os.environ.get("IMAP_POOL_WAIT_SECONDS", "15"))
+IMAP_TIMEOUT = float(os.environ.get("EMAIL_TIMEOUT", "30"))
+
+# Cache local (SQLite compartilhado entre workers) de cabeçalhos/corpos por UID
+LEITOR_CACHE = os.environ.get("LEITOR_CACHE", "1").lower() not in {"0", "false", "no", ""}
+LEITOR_CACHE_MAX_MESSAGES = int(os.environ.get("LEITOR_CACHE_MAX_MESSAGES", "5000"))
+LEITOR_CACHE_MAX_BODIES = int(os.environ.get("LEITOR_CACHE_MAX_BODIES", "500"))
+LEITOR_CACHE_MAX_AGE_DAYS = float(os.environ.get("LEITOR_CACHE_MAX_AGE_DAYS", "8"))
+
+# Exige que o e-mail tenha sido enviado para o endereço da conta (To/Cc/Delivered-To)
+IMAP_MATCH_RECIPIENT = os.environ.get("EMAIL_MATCH_RECIPIENT", "1").lower() not in {"0", "false", "no", ""}
 
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
-def _normalize_text(s: str) -> str:
-    if not s:
-        return ""
-    nfkd = unicodedata.normalize("NFKD", s)
-    return "".join(ch for ch in nfkd if not unicodedata.combining(ch)).lower()
-
-def _decode_subject(msg: Message) -> str:
-    raw = msg.get("Subject", "") or ""
+def _header_text(raw) -> str:
+    """Cabeçalho decodificado (RFC 2047); aceita também UTF-8 cru (RFC 6532) / latin-1."""
     try:
-        return str(make_header(decode_header(raw)))
+        parts = decode_header(raw)
+        if any(cs == "unknown-8bit" for _, cs in parts):
+            parts = [(_raw_8bit(chunk), "utf-8") if cs == "unknown-8bit" else (chunk, cs) for chunk, cs in parts]
+        return str(make_header(parts))
     except Exception:
-        return raw
+        return str(raw)
+
+def _raw_8bit(chunk: bytes) -> str:
+    try:
+        return chunk.decode("utf-8")
+    except UnicodeDecodeError:
+        return chunk.decode("latin-1")
+
+def _decode_subject(msg: Message) -> str:
+    return _header_text(msg.get("Subject", "") or "")
 
 def _from_bundle(msg: Message) -> str:
     """Junta nomes e e-mails de From/Sender/Return-Path para checar remetente."""
@@ -49,10 +157,7 @@ def _from_bundle(msg: Message) -> str:
             names_emails = getaddresses([val])
             parts = []
             for name, addr in names_emails:
-                try:
-                    name_dec = str(make_header(decode_header(name))) if name else ""
-                except Exception:
-                    name_dec = name or ""
+                name_dec = _header_text(name) if name else ""
                 parts.append(f"{name_dec} {addr}".strip())
             fields.append(" ".join(parts))
         except Exception:
@@ -101,109 +206,832 @@ def _html_or_text(msg: Message) -> str:
 
     return "<em>(sem conteúdo visualizável)</em>"
 
+def _recipients(msg: Message) -> set[str]:
+    """Endereços destinatários (minúsculos) de To/Cc/Delivered-To/X-Original-To."""
+    values = []
+    for h in ("To", "Cc", "Delivered-To", "X-Original-To"):
+        values.extend(msg.get_all(h) or [])
+    return {addr.strip().lower() for _, addr in getaddresses(values) if addr}
+
+class _Filters:
+    """Filtros avulsos de assunto/remetente (mesmo formato de services.SERVICES), compilados num Matcher."""
+
+    def __init__(
+        self,
+        required_subject_substr: Optional[str] = None,
+        required_subject_keywords: Optional[List[str]] = None,
+        required_from_contains: Optional[List[str]] = None,
+        forbidden_subject_keywords: Optional[List[str]] = None,
+    ):
+        self.matcher = services.Matcher({
+            "filters": {
+                # Palavras exigidas no assunto (lista) OU substring única
+                "subject_keywords": required_subject_keywords or ([required_subject_substr] if required_subject_substr else []),
+                "sender_needles": required_from_contains or [],
+                "forbidden_subject_keywords": forbidden_subject_keywords or [],
+            }
+        })
+
+    def matches(self, subject: str, sender: str) -> bool:
+        """`sender` é o texto de _from_bundle (From/Sender/Return-Path)."""
+        return self.matcher.mask(subject, sender) == 1
+
+def _render_email(subject: str, msg_date: datetime, body_html: str) -> str:
+    dt_str = msg_date.strftime("%d/%m/%Y %H:%M UTC")
+    return f"""
+    <div>
+        <p><strong>Assunto:</strong> {subject}</p>
+        <p><strong>Data:</strong> {dt_str}</p>
+        <div style="margin-top:10px;border-top:1px solid #ddd;padding-top:10px">
+            {body_html}
+        </div>
+    </div>
+    """
+
+def _imap_quote(s: str) -> str:
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _ascii_fragment(term: str, min_len: int = 4) -> Optional[str]:
+    """
+    Maior trecho ASCII de um termo, para usar no SEARCH do servidor.
+
+    O SEARCH do IMAP compara sem diferenciar maiúsculas, mas não ignora acentos
+    (e exigiria CHARSET/literais para texto não-ASCII). Usando só o maior trecho
+    ASCII, o resultado do servidor é sempre um superconjunto do filtro local.
+    """
+    pieces = [p.strip() for p in re.split(r"[^\x20-\x7e]+", term or "")]
+    best = max(pieces, key=len, default="")
+    return best if len(best) >= min_len else None
+
+def _imap_or(criteria: list[str]) -> str:
+    # OR é binário no IMAP: OR a OR b c
+    if len(criteria) == 1:
+        return criteria[0]
+    return f"OR {criteria[0]} {_imap_or(criteria[1:])}"
+
+class _Criteria(NamedTuple):
+    """
+    Pré-filtro da busca (superconjunto do filtro local), o mesmo para o SEARCH do
+    servidor (_imap_criteria) e para a consulta ao cache local (_cache_where).
+    """
+    since: datetime
+    subject: list[str]     # trechos ASCII, qualquer um (vazio = sem filtro)
+    sender: list[str]      # idem, no remetente
+    recipient: str         # "" = sem filtro
+    forbidden: list[str]   # termos inteiros que o assunto não pode ter
+
+def _fragments(terms: Optional[List[str]]) -> list[str]:
+    # Um grupo só filtra se todos os termos tiverem um trecho ASCII utilizável;
+    # caso contrário ele fica só no filtro local (nunca perdemos e-mails).
+    terms = [t for t in (terms or []) if t]
+    fragments = [_ascii_fragment(t) for t in terms]
+    return list(dict.fromkeys(fragments)) if terms and all(fragments) else []
+
+def _criteria(
+    since: datetime,
+    subject_terms: Optional[List[str]] = None,
+    from_terms: Optional[List[str]] = None,
+    recipient: Optional[str] = None,
+    forbidden_terms: Optional[List[str]] = None,
+) -> _Criteria:
+    return _Criteria(
+        since=since,
+        subject=_fragments(subject_terms),
+        sender=_fragments(from_terms),
+        recipient=recipient if recipient and recipient.isascii() else "",
+        # NOT só é seguro com o termo inteiro (senão excluiria e-mails válidos)
+        forbidden=[t for t in forbidden_terms or [] if t and t.isascii()],
+    )
+
+def _imap_criteria(c: _Criteria) -> list[str]:
+    """Critérios do SEARCH (SINCE + SUBJECT/FROM/TO combinados com OR)."""
+    criteria = ["SINCE", c.since.strftime("%d-%b-%Y")]
+    for key, fragments in (("SUBJECT", c.subject), ("FROM", c.sender)):
+        if fragments:
+            criteria.append(_imap_or([f"{key} {_imap_quote(f)}" for f in fragments]))
+    if c.recipient:
+        criteria.extend(["TO", _imap_quote(c.recipient)])
+    for term in c.forbidden:
+        criteria.extend(["NOT", "SUBJECT", _imap_quote(term)])
+    return criteria
+
+def _search_criteria(
+    since: datetime,
+    subject_terms: Optional[List[str]] = None,
+    from_terms: Optional[List[str]] = None,
+    recipient: Optional[str] = None,
+    forbidden_terms: Optional[List[str]] = None,
+) -> list[str]:
+    """Monta os critérios do SEARCH a partir dos termos dos filtros."""
+    return _imap_criteria(_criteria(since, subject_terms, from_terms, recipient, forbidden_terms))
+
 def _imap_search_since(imap: imaplib.IMAP4_SSL, since: datetime) -> list[bytes]:
     date_str = since.strftime("%d-%b-%Y")
-    typ, data = imap.search(None, "SINCE", date_str)
+    with metrics.timer("imap_search"):
+        typ, data = imap.uid("SEARCH", "SINCE", date_str)
     if typ != "OK":
         return []
     return data[0].split()
 
-def _connect_select(folder: str) -> imaplib.IMAP4_SSL:
+def _imap_search(imap: imaplib.IMAP4_SSL, criteria: list[str], since: datetime) -> list[bytes]:
+    """UID SEARCH com os critérios; UIDs em ordem crescente."""
+    try:
+        with metrics.timer("imap_search"):
+            typ, data = imap.uid("SEARCH", *criteria)
+    except imaplib.IMAP4.abort:
+        raise
+    except imaplib.IMAP4.error:
+        typ, data = "BAD", None
+    if typ == "OK":
+        return data[0].split()
+    # Servidor recusou algum critério: volta para o filtro só por data
+    return _imap_search_since(imap, since)
+
+# Cabeçalhos suficientes para os filtros (assunto, remetente, data, destinatário)
+_HEADER_FIELDS = "SUBJECT FROM SENDER RETURN-PATH DATE TO CC DELIVERED-TO X-ORIGINAL-TO"
+
+def _sequence_set(ids: list[bytes]) -> str:
+    """Compacta UIDs em um sequence-set IMAP (ex.: 1:5,9,12:13)."""
+    nums = sorted({int(i) for i in ids})
+    ranges = []
+    start = prev = nums[0]
+    for n in nums[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+def _header_batches(ids: list[bytes], first: int = 20, largest: int = 100):
+    """Lotes crescentes: o e-mail certo costuma ser um dos mais recentes."""
+    size = first
+    start = 0
+    while start < len(ids):
+        yield ids[start:start + size]
+        start += size
+        size = min(size * 2, largest)
+
+_HEADERS_ITEMS = f"(UID BODY.PEEK[HEADER.FIELDS ({_HEADER_FIELDS})])"
+
+def _fetch_header_batch(imap: imaplib.IMAP4_SSL, uids: list[bytes]) -> Optional[dict[bytes, Message]]:
+    """Um único UID FETCH só com os cabeçalhos de vários e-mails (sem marcar como lido); None se falhou."""
+    with metrics.timer("imap_fetch_headers"):
+        typ, data = imap.uid("FETCH", _sequence_set(uids), _HEADERS_ITEMS)
+    return _parse_headers(data) if typ == "OK" else None
+
+def _fetch_headers(imap: imaplib.IMAP4_SSL, uids: list[bytes]) -> dict[bytes, Message]:
+    return _fetch_header_batch(imap, uids) or {}
+
+def _parse_headers(data) -> dict[bytes, Message]:
+    """{UID: cabeçalhos} da resposta de um FETCH (formato do imaplib)."""
+    headers = {}
+    for item in data or []:
+        if not isinstance(item, tuple):
+            continue
+        m = re.search(rb"UID (\d+)", item[0])
+        if m:
+            headers[m.group(1)] = email.message_from_bytes(item[1])
+    return headers
+
+def _fetch_message(imap: imaplib.IMAP4_SSL, uid: bytes) -> Optional[Message]:
+    with metrics.timer("imap_fetch_body"):
+        typ, data = imap.uid("FETCH", uid.decode(), "(UID BODY.PEEK[])")
+    return _parse_message(data) if typ == "OK" else None
+
+def _parse_message(data) -> Optional[Message]:
+    for item in data or []:
+        if isinstance(item, tuple):
+            return email.message_from_bytes(item[1])
+    return None
+
+def _require_config(mailbox: Mailbox) -> None:
     missing = []
-    if not IMAP_HOST: missing.append("EMAIL_HOST/IMAP_HOST")
-    if not IMAP_USER: missing.append("EMAIL_USERNAME/EMAIL")
-    if not IMAP_PASS: missing.append("EMAIL_PASSWORD/APP_PASSWORD")
+    if not mailbox.host: missing.append("EMAIL_HOST/IMAP_HOST")
+    if not mailbox.user: missing.append("EMAIL_USERNAME/EMAIL")
+    if not mailbox.password: missing.append("EMAIL_PASSWORD/APP_PASSWORD")
     if missing:
         raise RuntimeError("Configuração IMAP ausente: " + ", ".join(missing))
-    imap = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
-    imap.login(IMAP_USER, IMAP_PASS)
-    imap.select(folder)
+
+def _connect_select(mailbox: Mailbox) -> imaplib.IMAP4_SSL:
+    _require_config(mailbox)
+    with metrics.timer("imap_connect"):
+        if mailbox.ssl:
+            imap = imaplib.IMAP4_SSL(mailbox.host, mailbox.port, timeout=IMAP_TIMEOUT)
+        else:
+            imap = imaplib.IMAP4(mailbox.host, mailbox.port, timeout=IMAP_TIMEOUT)
+    try:
+        with metrics.timer("imap_login"):
+            imap.login(mailbox.user, mailbox.password)
+        with metrics.timer("imap_select"):
+            typ, _ = imap.select(_imap_quote(mailbox.folder))
+        if typ != "OK":
+            raise RuntimeError(f"Não foi possível selecionar a pasta IMAP {mailbox.key!r}")
+        # UIDs só são estáveis enquanto o UIDVALIDITY da pasta não muda
+        _, data = imap.response("UIDVALIDITY")
+        try:
+            imap.uidvalidity = int(data[0])
+        except (TypeError, ValueError, IndexError):
+            imap.uidvalidity = 0
+    except Exception:
+        _logout_quietly(imap)
+        raise
     return imap
 
+def _logout_quietly(imap: imaplib.IMAP4_SSL) -> None:
+    try:
+        imap.logout()
+    except Exception:
+        pass
+
+# -----------------------------------------------------------------------------
+# Pool de conexões IMAP
+# Evita handshake TLS + LOGIN + SELECT a cada busca. As sessões ficam com a
+# pasta já selecionada; antes de reutilizar, um NOOP confirma que a conexão
+# está viva (e atualiza o estado da caixa, para o SEARCH enxergar e-mails novos).
+# -----------------------------------------------------------------------------
+class _ImapPool:
+    def __init__(self, mailbox: Mailbox, max_size: int, idle_timeout: float):
+        self.mailbox = mailbox
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self._idle: list[tuple[imaplib.IMAP4_SSL, float]] = []  # (sessão, devolvida em)
+        self._open = 0  # sessões abertas (ociosas + emprestadas) ou sendo abertas
+        self._cond = threading.Condition()
+
+    def _pop_expired(self) -> list[imaplib.IMAP4_SSL]:
+        """Remove (com o lock adquirido) as sessões ociosas há mais tempo que o limite."""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [imap for imap, ts in self._idle if ts < cutoff]
+        if expired:
+            self._idle = [(imap, ts) for imap, ts in self._idle if ts >= cutoff]
+            self._open -= len(expired)
+            self._cond.notify(len(expired))
+        return expired
+
+    def acquire(self, wait: float) -> imaplib.IMAP4_SSL:
+        deadline = time.monotonic() + wait
+        imap = None
+        with self._cond:
+            while True:
+                expired = self._pop_expired()
+                if self._idle:
+                    imap, _ = self._idle.pop()  # LIFO: a sessão usada mais recentemente
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError("Pool IMAP esgotado: todas as sessões estão em uso.")
+                self._cond.wait(remaining)
+        for old in expired:
+            _logout_quietly(old)
+
+        if imap is not None:
+            try:
+                typ, _ = imap.noop()
+                if typ == "OK":
+                    return imap
+            except Exception:
+                pass
+            _logout_quietly(imap)
+
+        # Vaga reservada (self._open já contabiliza): abre uma sessão nova
+        try:
+            return _connect_select(self.mailbox)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, imap: imaplib.IMAP4_SSL, broken: bool = False) -> None:
+        if broken:
+            _logout_quietly(imap)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((imap, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        imap = self.acquire(IMAP_POOL_WAIT_SECONDS)
+        try:
+            yield imap
+        except BaseException:
+            # Estado da sessão é incerto após erro no meio de um comando: descarta
+            self.release(imap, broken=True)
+            raise
+        else:
+            self.release(imap)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify(len(idle))
+        for imap, _ in idle:
+            _logout_quietly(imap)
+
+_POOLS: dict[Mailbox, _ImapPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+def _pool(mailbox: Mailbox) -> _ImapPool:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(mailbox)
+        if pool is None:
+            pool = _POOLS[mailbox] = _ImapPool(mailbox, IMAP_POOL_SIZE, IMAP_POOL_IDLE_SECONDS)
+        return pool
+
+@atexit.register
+def _close_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.close_all()
+
+# -----------------------------------------------------------------------------
+# Cache local de e-mails por UID
+# Checkpoint (UIDVALIDITY, maior UID visto) por pasta: cada busca só baixa os
+# cabeçalhos do que chegou depois do checkpoint. Cabeçalhos já decodificados e
+# corpos extraídos ficam no SQLite local, com limite de quantidade e idade.
+# Se o UIDVALIDITY da pasta mudar, tudo o que estava em cache dela é descartado.
+# -----------------------------------------------------------------------------
+_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mailbox_state (
+    source TEXT PRIMARY KEY,
+    uidvalidity INTEGER NOT NULL,
+    last_uid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS message_headers (
+    source TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    msg_date REAL NOT NULL,
+    PRIMARY KEY (source, uid)
+);
+CREATE TABLE IF NOT EXISTS message_bodies (
+    source TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    body_html TEXT NOT NULL,
+    cached_at REAL NOT NULL,
+    PRIMARY KEY (source, uid)
+);
+"""
+
+def _cache():
+    return localstore.connect("leitor", _CACHE_SCHEMA)
+
+def _header_fields(head: Message) -> tuple[str, str, set[str], datetime]:
+    """(assunto, remetente, destinatários, data) de um e-mail já com cabeçalhos parseados."""
+    return _decode_subject(head), _from_bundle(head), _recipients(head), _message_date(head)
+
+def _invalidate_cache(db, source: str) -> None:
+    with localstore.transaction(db):
+        for table in ("mailbox_state", "message_headers", "message_bodies"):
+            db.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+
+def _evict_cache(db, source: str) -> None:
+    cutoff = time.time() - LEITOR_CACHE_MAX_AGE_DAYS * 86400
+    with localstore.transaction(db):
+        db.execute(
+            """DELETE FROM message_headers WHERE source = ? AND (msg_date < ? OR uid <= COALESCE(
+                   (SELECT uid FROM message_headers WHERE source = ? ORDER BY uid DESC LIMIT 1 OFFSET ?), -1))""",
+            (source, cutoff, source, LEITOR_CACHE_MAX_MESSAGES),
+        )
+        db.execute(
+            """DELETE FROM message_bodies WHERE source = ? AND (cached_at < ? OR uid <= COALESCE(
+                   (SELECT uid FROM message_bodies WHERE source = ? ORDER BY uid DESC LIMIT 1 OFFSET ?), -1))""",
+            (source, cutoff, source, LEITOR_CACHE_MAX_BODIES),
+        )
+
+def _checkpoint(source: str, uidvalidity: int) -> tuple[bool, int]:
+    """(checkpoint válido?, último UID visto); descarta o cache da pasta se o UIDVALIDITY mudou."""
+    db = _cache()
+    row = db.execute("SELECT uidvalidity, last_uid FROM mailbox_state WHERE source = ?", (source,)).fetchone()
+    if row and row[0] == uidvalidity:
+        return True, row[1]
+    if row:
+        _invalidate_cache(db, source)
+    return False, 0
+
+def _sync_criteria(since: datetime, last_uid: int) -> list[str]:
+    criteria = ["SINCE", since.strftime("%d-%b-%Y")]
+    if last_uid:
+        criteria = ["UID", f"{last_uid + 1}:*"] + criteria
+    return criteria
+
+def _header_row(source: str, uid: bytes, head: Message) -> tuple:
+    subject, sender, recipients, msg_date = _header_fields(head)
+    return (source, int(uid), subject, sender, " ".join(sorted(recipients)), msg_date.timestamp())
+
+def _cached_uids(source: str, above: int) -> set[int]:
+    rows = _cache().execute(
+        "SELECT uid FROM message_headers WHERE source = ? AND uid > ?", (source, above)
+    ).fetchall()
+    return {r[0] for r in rows}
+
+def _sync_plan(uids: list[bytes], cached: set[int], limit: int) -> list[bytes]:
+    """UIDs novos ainda fora do cache: os `limit` mais recentes, do mais novo para o mais antigo."""
+    return [u for u in uids if int(u) not in cached][-limit:][::-1]
+
+def _sync_checkpoint(last_uid: int, uids: list[bytes], stored: set[int]) -> int:
+    """
+    Novo checkpoint: o maior UID da sequência contínua (em ordem crescente, a partir
+    do checkpoint atual) cujos cabeçalhos já estão no cache. Um UID que ficou de fora
+    (além do `limit` ou num FETCH que falhou) segura o checkpoint abaixo dele, para
+    ser buscado na próxima sincronização.
+    """
+    for u in sorted(int(u) for u in uids):
+        if u not in stored:
+            break
+        last_uid = u
+    return last_uid
+
+def _sync_headers(imap: imaplib.IMAP4_SSL, source: str, since: datetime, limit: int) -> None:
+    """Atualiza o cache com os cabeçalhos dos e-mails que chegaram depois do checkpoint."""
+    valid, last_uid = _checkpoint(source, imap.uidvalidity)
+    # "n:*" sempre inclui o último e-mail, mesmo com UID menor que n
+    uids = [u for u in _imap_search(imap, _sync_criteria(since, last_uid), since) if int(u) > last_uid]
+    stored = _cached_uids(source, last_uid) if valid else set()
+
+    rows = []
+    for batch in _header_batches(_sync_plan(uids, stored, limit), first=100):
+        headers = _fetch_header_batch(imap, batch)
+        if headers is None:
+            continue
+        # UID ausente num FETCH OK foi apagado entre o SEARCH e o FETCH: conta como visto
+        stored.update(int(u) for u in batch)
+        rows.extend(_header_row(source, uid, head) for uid, head in headers.items())
+
+    new_last = _sync_checkpoint(last_uid, uids, stored)
+    if valid and not rows and new_last == last_uid:
+        return
+    _store_headers(source, imap.uidvalidity, new_last, rows)
+
+def _store_headers(source: str, uidvalidity: int, new_last: int, rows: list[tuple]) -> None:
+    db = _cache()
+    with localstore.transaction(db):
+        db.executemany("INSERT OR REPLACE INTO message_headers VALUES (?, ?, ?, ?, ?, ?)", rows)
+        # Outro worker pode ter avançado o checkpoint ao mesmo tempo: fica com o maior
+        db.execute(
+            """INSERT INTO mailbox_state (source, uidvalidity, last_uid) VALUES (?, ?, ?)
+               ON CONFLICT (source) DO UPDATE SET
+                   last_uid = CASE WHEN uidvalidity = excluded.uidvalidity
+                                   THEN max(last_uid, excluded.last_uid) ELSE excluded.last_uid END,
+                   uidvalidity = excluded.uidvalidity""",
+            (source, uidvalidity, new_last),
+        )
+    if rows:
+        _evict_cache(db, source)
+
+def _like(fragment: str) -> str:
+    return "%" + fragment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _cache_where(c: _Criteria) -> tuple[str, list]:
+    """Os critérios do SEARCH em SQL sobre message_headers (LIKE, como o SEARCH, ignora maiúsculas ASCII)."""
+    clauses, params = ["msg_date >= ?"], [c.since.timestamp()]
+    for column, fragments in (("subject", c.subject), ("sender", c.sender)):
+        if fragments:
+            clauses.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for _ in fragments) + ")")
+            params.extend(_like(f) for f in fragments)
+    if c.recipient:
+        # Destinatários gravados separados por espaço
+        clauses.append("instr(' ' || recipients || ' ', ?) > 0")
+        params.append(f" {c.recipient.lower()} ")
+    for term in c.forbidden:
+        clauses.append("subject NOT LIKE ? ESCAPE '\\'")
+        params.append(_like(term))
+    return " AND ".join(clauses), params
+
+def _cached_candidates(source: str, criteria: _Criteria, limit: int):
+    """Cabeçalhos em cache que passam pelos critérios, mais recentes (maior UID) primeiro."""
+    where, params = _cache_where(criteria)
+    rows = _cache().execute(
+        f"""SELECT uid, subject, sender, recipients, msg_date FROM message_headers
+            WHERE source = ? AND {where} ORDER BY uid DESC LIMIT ?""",
+        [source, *params, limit],
+    ).fetchall()
+    for uid, subject, sender, recipients, msg_date in rows:
+        yield (
+            str(uid).encode(), subject, sender, set(recipients.split()),
+            datetime.fromtimestamp(msg_date, tz=timezone.utc),
+        )
+
+def _scan_candidates(imap: imaplib.IMAP4_SSL, criteria: list[str], since: datetime, limit: int):
+    """Sem cache: SEARCH filtrado no servidor + cabeçalhos em lotes, mais recentes primeiro."""
+    uids = _imap_search(imap, criteria, since)[-limit:][::-1]
+    for batch in _header_batches(uids):
+        headers = _fetch_headers(imap, batch)
+        for uid in batch:
+            head = headers.get(uid)
+            if head is not None:
+                yield (uid, *_header_fields(head))
+
+def _cached_body(source: str, uid: bytes) -> Optional[str]:
+    row = _cache().execute(
+        "SELECT body_html FROM message_bodies WHERE source = ? AND uid = ?", (source, int(uid))
+    ).fetchone()
+    return row[0] if row else None
+
+def _store_body(source: str, uid: bytes, body_html: str) -> None:
+    _cache().execute(
+        "INSERT OR REPLACE INTO message_bodies VALUES (?, ?, ?, ?)",
+        (source, int(uid), body_html, time.time()),
+    )
+
+def _body_html(msg: Message) -> str:
+    with metrics.timer("mime_parse"):
+        return _html_or_text(msg)
+
+def _email_body(imap: imaplib.IMAP4_SSL, source: str, uid: bytes) -> Optional[str]:
+    """Corpo extraído (HTML) do e-mail, do cache local ou via UID FETCH BODY.PEEK[]."""
+    if LEITOR_CACHE:
+        body_html = _cached_body(source, uid)
+        if body_html is not None:
+            return body_html
+    msg = _fetch_message(imap, uid)
+    if msg is None:
+        return None
+    body_html = _body_html(msg)
+    if LEITOR_CACHE:
+        _store_body(source, uid, body_html)
+    return body_html
+
 # -----------------------------------------------------------------------------
 # Função principal
 # -----------------------------------------------------------------------------
-def fetch_login_code_email_html(
-    service: str,
-    target_email: str,
-    lookback_days: int = 7,
-    max_scan: int = 200,
-    required_subject_substr: Optional[str] = None,
-    required_subject_keywords: Optional[List[str]] = None,
-    required_from_contains: Optional[List[str]] = None,      # << NOVO
-    forbidden_subject_keywords: Optional[List[str]] = None,  # << NOVO
-) -> Optional[str]:
+def _since(lookback_days: int) -> datetime:
+    return datetime.now(tz=timezone.utc) - timedelta(days=lookback_days)
+
+def _recipient(target_email: str) -> str:
+    return (target_email or "").strip().lower() if IMAP_MATCH_RECIPIENT else ""
+
+def _scan_criteria(matcher: services.Matcher, wanted: list[str], since: datetime, recipient: str) -> _Criteria:
+    """Pré-filtro da busca (superconjunto do filtro local), para o SEARCH ou para o cache."""
+    rules = [matcher.rules[n] for n in wanted]
+    return _criteria(
+        since,
+        subject_terms=[k for r in rules for k in r.get("subject_keywords") or []],
+        # FROM/NOT combinam com E: só valem sozinhos quando há um filtro
+        from_terms=rules[0].get("sender_needles") if len(rules) == 1 else None,
+        recipient=recipient or None,
+        forbidden_terms=rules[0].get("forbidden_subject_keywords") if len(rules) == 1 else None,
+    )
+
+def _candidate_names(
+    matcher: services.Matcher,
+    pending: set[str],
+    recipient: str,
+    since: datetime,
+    subject: str,
+    sender: str,
+    recipients: set[str],
+    msg_date: datetime,
+) -> list[str]:
+    """Filtros ainda pendentes que o e-mail satisfaz, sem baixar o corpo."""
+    # 0-2) Assunto e remetente (todos os filtros numa passada)
+    names = [n for n in matcher.classify(subject, sender) if n in pending]
+    if not names:
+        return []
+    # 3) Destinatário deve ser o e-mail da conta
+    if recipient and recipient not in recipients:
+        return []
+    # 4) Janela de tempo
+    if msg_date < since:
+        return []
+    return names
+
+class _Scan:
     """
-    Retorna HTML do primeiro e-mail que casar com os filtros informados.
+    Estado de uma passada por uma pasta (critérios, filtros pendentes, achados). É o
+    mesmo no leitor síncrono e no leitor_async: só o I/O (IMAP, cache) muda.
     """
-    since = datetime.now(tz=timezone.utc) - timedelta(days=lookback_days)
 
-    kw_norm = [_normalize_text(k) for k in (required_subject_keywords or []) if k]
-    forbid_norm = [_normalize_text(k) for k in (forbidden_subject_keywords or []) if k]
-    from_needles = [_normalize_text(k) for k in (required_from_contains or []) if k]
+    def __init__(self, matcher: services.Matcher, wanted: list[str], target_email: str, lookback_days: int):
+        self.matcher = matcher
+        self.wanted = wanted
+        self.since = _since(lookback_days)
+        self.recipient = _recipient(target_email)
+        self.criteria = _scan_criteria(matcher, wanted, self.since, self.recipient)
+        self.pending = set(wanted)
+        self.found: dict[str, tuple[str, datetime, str]] = {}
+        self.scanned = 0
 
-    imap = _connect_select(IMAP_FOLDER)
-    try:
-        ids = _imap_search_since(imap, since)
-        if not ids:
-            return None
+    def match(self, candidate: tuple) -> list[str]:
+        """0-4) Filtros pendentes que o candidato (uid, assunto, remetente, destinatários, data) satisfaz."""
+        _, subject, sender, recipients, msg_date = candidate
+        self.scanned += 1
+        return _candidate_names(self.matcher, self.pending, self.recipient, self.since,
+                                subject, sender, recipients, msg_date)
 
-        ids = ids[-max_scan:][::-1]  # mais recentes primeiro
+    def add(self, names: list[str], candidate: tuple, body_html: str) -> bool:
+        """Guarda o e-mail para `names`; True quando não falta mais nenhum filtro."""
+        _, subject, _, _, msg_date = candidate
+        for n in names:
+            self.found[n] = (subject, msg_date, body_html)
+        self.pending.difference_update(names)
+        return not self.pending
 
-        for msg_id in ids:
-            typ, data = imap.fetch(msg_id, "(RFC822)")
-            if typ != "OK" or not data or not isinstance(data[0], tuple):
+    def result(self) -> dict[str, tuple[str, datetime, str]]:
+        service = self.wanted[0] if len(self.wanted) == 1 else "multi"
+        metrics.observe("allcodes_lookup_messages_scanned", self.scanned, service=service)
+        return self.found
+
+def _scan_mailbox(
+    mailbox: Mailbox,
+    target_email: str,
+    lookback_days: int,
+    max_scan: int,
+    matcher: services.Matcher,
+    wanted: list[str],
+    stop: Optional[threading.Event] = None,
+) -> dict[str, tuple[str, datetime, str]]:
+    """
+    {nome: (assunto, data, corpo HTML)} do e-mail mais recente de cada filtro em
+    `wanted`, numa única passada pela pasta (para quando todos forem achados ou
+    quando `stop` for sinalizado).
+    """
+    scan = _Scan(matcher, wanted, target_email, lookback_days)
+    source = mailbox.key
+    with _pool(mailbox).session() as imap:
+        # Nos dois modos só os candidatos (mesmos critérios) contam para o max_scan; o filtro
+        # local (_Scan.match) confirma (normalização de acentos, destinatário exato etc.).
+        if LEITOR_CACHE:
+            # Só o que chegou depois do checkpoint sai do servidor (o cache espelha a pasta); o resto vem do cache
+            _sync_headers(imap, source, scan.since, LEITOR_CACHE_MAX_MESSAGES)
+            candidates = _cached_candidates(source, scan.criteria, max_scan)
+        else:
+            candidates = _scan_candidates(imap, _imap_criteria(scan.criteria), scan.since, max_scan)
+
+        for candidate in candidates:
+            # Outra caixa já respondeu (busca em várias caixas)
+            if stop is not None and stop.is_set():
+                break
+            names = scan.match(candidate)
+            if not names:
                 continue
+            # 5) Conteúdo (só do e-mail escolhido; BODY.PEEK[] não marca como lido)
+            body_html = _email_body(imap, source, candidate[0])
+            if body_html is not None and scan.add(names, candidate, body_html):
+                break
+    return scan.result()
 
-            msg: Message = email.message_from_bytes(data[0][1])
+class _Merge:
+    """
+    Resultados de várias caixas buscadas ao mesmo tempo: cada filtro fica com o
+    primeiro e-mail que chegar; erros só contam se nenhuma caixa responder.
+    Usado pelo fan-out em threads e pelo do leitor_async.
+    """
 
-            subject = _decode_subject(msg)
-            subject_norm = _normalize_text(subject)
+    def __init__(self, plan: dict[Mailbox, list[str]]):
+        self.pending = {n for wanted in plan.values() for n in wanted}
+        self.found: dict[str, tuple[str, datetime, str]] = {}
+        self.errors: list[Exception] = []
+        self.answered = 0
+        self.deadline = time.monotonic() + IMAP_MAILBOX_TIMEOUT
 
-            # 0) Bloqueios explícitos no assunto (ex.: "netflix")
-            if forbid_norm and any(k in subject_norm for k in forbid_norm):
-                continue
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
 
-            # 1) Palavras exigidas no assunto (lista) OU substring única
-            if kw_norm:
-                if not any(k in subject_norm for k in kw_norm):
-                    continue
-            elif required_subject_substr:
-                if _normalize_text(required_subject_substr) not in subject_norm:
-                    continue
+    def timed_out(self, mailboxes) -> None:
+        print("ERRO IMAP: tempo esgotado em", ", ".join(m.key for m in mailboxes))
 
-            # 2) Remetente deve conter certos termos? (ex.: "amazon", "primevideo")
-            if from_needles:
-                from_bundle = _from_bundle(msg)
-                from_norm = _normalize_text(from_bundle)
-                if not any(k in from_norm for k in from_needles):
-                    continue
+    def add(self, mailbox: Mailbox, outcome: Callable[[], dict]) -> None:
+        """Junta o resultado de uma caixa (`outcome()` devolve ou levanta o erro dela)."""
+        try:
+            result = outcome()
+        except Exception as e:
+            print("ERRO IMAP", mailbox.key + ":", repr(e))
+            self.errors.append(e)
+            return
+        self.answered += 1
+        for n, item in result.items():
+            if n in self.pending:
+                self.found[n] = item
+                self.pending.discard(n)
 
-            # 3) Janela de tempo
-            if _message_date(msg) < since:
-                continue
+    def result(self) -> dict[str, tuple[str, datetime, str]]:
+        if not self.found and not self.answered:
+            if self.errors:
+                raise self.errors[0]
+            raise TimeoutError("Nenhuma caixa IMAP respondeu a tempo.")
+        return self.found
 
-            # 4) Conteúdo
-            body_html = _html_or_text(msg)
-            dt_str = _message_date(msg).strftime("%d/%m/%Y %H:%M UTC")
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
 
-            return f"""
-            <div>
-                <p><strong>Assunto:</strong> {subject}</p>
-                <p><strong>Data:</strong> {dt_str}</p>
-                <div style="margin-top:10px;border-top:1px solid #ddd;padding-top:10px">
-                    {body_html}
-                </div>
-            </div>
-            """
+def _fanout() -> ThreadPoolExecutor:
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=IMAP_FANOUT_WORKERS, thread_name_prefix="imap-fanout")
+        return _fanout_executor
 
-        return None
+def _find_login_emails(
+    target_email: str,
+    lookback_days: int,
+    max_scan: int,
+    matcher: services.Matcher,
+    plan: dict[Mailbox, list[str]],
+) -> dict[str, tuple[str, datetime, str]]:
+    """
+    Procura os filtros de `plan` ({caixa: nomes}) em todas as caixas ao mesmo tempo.
+    Cada nome fica com o primeiro e-mail encontrado em qualquer caixa; assim que
+    todos aparecem as outras buscas são interrompidas. Caixa que passar de
+    IMAP_MAILBOX_TIMEOUT é abandonada. Erros só sobem se nenhuma caixa responder.
+    """
+    if len(plan) == 1:
+        (mailbox, wanted), = plan.items()
+        return _scan_mailbox(mailbox, target_email, lookback_days, max_scan, matcher, wanted)
+
+    stop = threading.Event()
+    futures = {
+        _fanout().submit(_scan_mailbox, mailbox, target_email, lookback_days, max_scan, matcher, wanted, stop): mailbox
+        for mailbox, wanted in plan.items()
+    }
+    merged = _Merge(plan)
+    not_done = set(futures)
+    try:
+        while not_done and merged.pending:
+            done, not_done = wait(not_done, timeout=merged.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                merged.timed_out(futures[f] for f in not_done)
+                break
+            for fut in done:
+                merged.add(futures[fut], fut.result)
     finally:
-        try:
-            imap.close()
-        except Exception:
-            pass
-        try:
-            imap.logout()
-        except Exception:
-            pass
+        stop.set()
+        for fut in not_done:
+            fut.cancel()
+    return merged.result()
+
+def fetch_login_code_email_html(
+    service: str,
+    target_email: str,
+    lookback_days: int = 7,
+    max_scan: int = 200,
+    required_subject_substr: Optional[str] = None,
+    required_subject_keywords: Optional[List[str]] = None,
+    required_from_contains: Optional[List[str]] = None,      # << NOVO
+    forbidden_subject_keywords: Optional[List[str]] = None,  # << NOVO
+) -> Optional[str]:
+    """
+    Retorna HTML do primeiro e-mail que casar com os filtros informados
+    (sem filtros: os do serviço no registro services.SERVICES).
+    """
+    if required_subject_substr or required_subject_keywords or required_from_contains or forbidden_subject_keywords:
+        matcher = _Filters(
+            required_subject_substr=required_subject_substr,
+            required_subject_keywords=required_subject_keywords,
+            required_from_contains=required_from_contains,
+            forbidden_subject_keywords=forbidden_subject_keywords,
+        ).matcher
+        name = "filters"
+    else:
+        matcher, name = services.MATCHER, services.canonical(service)
+        if name is None:
+            return None
+    plan = {m: [name] for m in mailboxes_for(service, target_email)}
+    found = _find_login_emails(target_email, lookback_days, max_scan, matcher, plan)
+    return _render_email(*found[name]) if name in found else None
+
+def _codes_plan(target_email: str, wanted: List[str]) -> dict[Mailbox, list[str]]:
+    """{caixa: serviços canônicos} para buscar `wanted` (sem serviços válidos: vazio)."""
+    plan: dict[Mailbox, list[str]] = {}
+    for name in dict.fromkeys(services.canonical(s) for s in wanted):
+        if name:
+            for m in mailboxes_for(name, target_email):
+                plan.setdefault(m, []).append(name)
+    return plan
+
+def _compact_results(found: dict[str, tuple[str, datetime, str]]) -> dict[str, dict]:
+    results = {}
+    for name, (subject, msg_date, body_html) in found.items():
+        result = extract.compact_result(name, subject, msg_date, body_html)
+        result["email_html"] = _render_email(subject, msg_date, body_html)
+        results[name] = result
+    return results
+
+def fetch_login_codes(target_email: str, wanted: List[str], lookback_days: int = 7, max_scan: int = 200) -> dict[str, dict]:
+    """
+    {serviço: resultado compacto} dos e-mails de código mais recentes de vários
+    serviços, numa única passada pela caixa. Cada resultado traz código / link,
+    assunto e data; o e-mail completo vem em "email_html", para ser guardado e
+    mostrado só sob demanda.
+    """
+    plan = _codes_plan(target_email, wanted)
+    if not plan:
+        return {}
+    return _compact_results(_find_login_emails(target_email, lookback_days, max_scan, services.MATCHER, plan))
+
+def fetch_login_code(service: str, target_email: str, lookback_days: int = 7, max_scan: int = 200) -> Optional[dict]:
+    """Resultado compacto (ver fetch_login_codes) de um serviço, ou None."""
+    return fetch_login_codes(target_email, [service], lookback_days, max_scan).get(services.canonical(service))
@@ -0,0 +1,376 @@
+"""
+Busca do e-mail de código em asyncio (mesmo resultado do leitor.py).
+
+Um cliente IMAP próprio, sem dependências, sobre asyncio streams (TLS opcional):
+só os comandos que a busca usa (LOGIN, SELECT, UID SEARCH, UID FETCH, NOOP,
+LOGOUT). As respostas vêm no mesmo formato do imaplib, então os parsers, filtros,
+o estado da busca (leitor._Scan, leitor._Merge) e o cache local de cabeçalhos/corpos
+são os do leitor.py: aqui fica só o I/O. O acesso ao SQLite local roda em threads
+(asyncio.to_thread) para não travar o loop.
+
+Enquanto espera o servidor IMAP, a busca não ocupa thread nem worker: um processo
+ASGI (asgi.py) mantém centenas de buscas em andamento.
+
+    result = await leitor_async.fetch_login_code("netflix", "cliente@exemplo.com")
+"""
+import asyncio
+import os
+import re
+import ssl
+import time
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
+
+import leitor
+import metrics
+import services
+from leitor import Mailbox
+
+# Sessões IMAP abertas por caixa em cada processo (o controle de admissão limita o host)
+IMAP_ASYNC_POOL_SIZE = int(os.environ.get("IMAP_ASYNC_POOL_SIZE", "8"))
+
+_LITERAL = re.compile(rb"\{(\d+)\}$")
+_UNTAGGED = re.compile(rb"\* (?:(?P<num>\d+) )?(?P<type>[A-Z-]+)(?: (?P<data>.*))?$", re.S)
+_UIDVALIDITY = re.compile(rb"\[UIDVALIDITY (\d+)\]")
+_READ_LIMIT = 1 << 20
+
+class ImapError(Exception):
+    """Resposta NO/BAD do servidor ou conexão encerrada no meio de um comando."""
+
+# -----------------------------------------------------------------------------
+# Cliente IMAP
+# -----------------------------------------------------------------------------
+class _AsyncImap:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._tag = 0
+        self.uidvalidity = 0
+
+    @classmethod
+    async def connect(cls, mailbox: Mailbox) -> "_AsyncImap":
+        with metrics.timer("imap_connect"):
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    mailbox.host, mailbox.port,
+                    ssl=ssl.create_default_context() if mailbox.ssl else None,
+                    limit=_READ_LIMIT,
+                ),
+                leitor.IMAP_TIMEOUT,
+            )
+        imap = cls(reader, writer)
+        try:
+            greeting = await imap._readline()
+            if not greeting.startswith((b"* OK", b"* PREAUTH")):
+                raise ImapError(f"saudação inesperada: {greeting[:80]!r}")
+        except BaseException:
+            imap.close()
+            raise
+        return imap
+
+    async def _readline(self) -> bytes:
+        line = await asyncio.wait_for(self._reader.readline(), leitor.IMAP_TIMEOUT)
+        if not line:
+            raise ImapError("conexão encerrada pelo servidor")
+        return line.rstrip(b"\r\n")
+
+    async def _response(self) -> list:
+        """Uma resposta completa: linhas com literais viram (prefixo, literal), como no imaplib."""
+        line = await self._readline()
+        parts: list = []
+        while True:
+            m = _LITERAL.search(line)
+            if not m:
+                parts.append(line)
+                return parts
+            literal = await asyncio.wait_for(self._reader.readexactly(int(m.group(1))), leitor.IMAP_TIMEOUT)
+            parts.append((line, literal))
+            line = await self._readline()
+
+    async def command(self, name: str, *args: str) -> tuple[str, dict[str, list]]:
+        """Envia o comando e devolve (OK/NO/BAD, {tipo: dados das respostas não marcadas})."""
+        self._tag += 1
+        tag = f"A{self._tag:04d}".encode()
+        self._writer.write(b" ".join([tag, name.encode()] + [a.encode() for a in args]) + b"\r\n")
+        await self._writer.drain()
+        untagged: dict[str, list] = {}
+        while True:
+            parts = await self._response()
+            first = parts[0][0] if isinstance(parts[0], tuple) else parts[0]
+            if first.startswith(tag + b" "):
+                status = first[len(tag) + 1:].split(b" ", 1)[0].decode()
+                return status, untagged
+            m = _UNTAGGED.match(first)
+            if not m:
+                continue
+            typ = m.group("type").decode()
+            data = m.group("data") or b""
+            if m.group("num"):
+                data = m.group("num") + (b" " + data if data else b"")
+            items = untagged.setdefault(typ, [])
+            if isinstance(parts[0], tuple):
+                items.append((data, parts[0][1]))
+            else:
+                items.append(data)
+            for extra in parts[1:]:
+                items.append(extra)
+
+    async def login_select(self, mailbox: Mailbox) -> None:
+        with metrics.timer("imap_login"):
+            typ, _ = await self.command("LOGIN", leitor._imap_quote(mailbox.user), leitor._imap_quote(mailbox.password))
+        if typ != "OK":
+            raise ImapError("LOGIN recusado")
+        with metrics.timer("imap_select"):
+            typ, untagged = await self.command("SELECT", leitor._imap_quote(mailbox.folder))
+        if typ != "OK":
+            raise RuntimeError(f"Não foi possível selecionar a pasta IMAP {mailbox.key!r}")
+        # UIDs só são estáveis enquanto o UIDVALIDITY da pasta não muda
+        for item in untagged.get("OK", []):
+            m = _UIDVALIDITY.search(item if isinstance(item, bytes) else item[0])
+            if m:
+                self.uidvalidity = int(m.group(1))
+
+    async def uid(self, command: str, *args: str) -> tuple[str, list]:
+        """Como imaplib.IMAP4.uid: (status, dados) no formato do imaplib."""
+        typ, untagged = await self.command("UID", command, *args)
+        if typ == "BAD":
+            raise ImapError(f"UID {command} recusado pelo servidor")
+        return typ, untagged.get(command, [b""] if command == "SEARCH" else [])
+
+    async def noop(self) -> str:
+        typ, _ = await self.command("NOOP")
+        return typ
+
+    async def logout(self) -> None:
+        try:
+            await asyncio.wait_for(self.command("LOGOUT"), 2)
+        except Exception:
+            pass
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self._writer.close()
+        except Exception:
+            pass
+
+# -----------------------------------------------------------------------------
+# Pool de sessões (por caixa e por event loop)
+# -----------------------------------------------------------------------------
+class _AsyncPool:
+    def __init__(self, mailbox: Mailbox):
+        self.mailbox = mailbox
+        self._idle: list[tuple[_AsyncImap, float]] = []
+        self._slots = asyncio.Semaphore(max(1, IMAP_ASYNC_POOL_SIZE))
+
+    async def _acquire(self) -> _AsyncImap:
+        cutoff = time.monotonic() - leitor.IMAP_POOL_IDLE_SECONDS
+        while self._idle:
+            imap, ts = self._idle.pop()  # LIFO: a sessão usada mais recentemente
+            if ts < cutoff:
+                await imap.logout()
+                continue
+            try:
+                if await imap.noop() == "OK":
+                    return imap
+            except Exception:
+                pass
+            imap.close()
+        leitor._require_config(self.mailbox)
+        imap = await _AsyncImap.connect(self.mailbox)
+        try:
+            await imap.login_select(self.mailbox)
+        except BaseException:
+            await imap.logout()
+            raise
+        return imap
+
+    @asynccontextmanager
+    async def session(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), leitor.IMAP_POOL_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Pool IMAP esgotado: todas as sessões estão em uso.") from None
+        try:
+            imap = await self._acquire()
+            try:
+                yield imap
+            except BaseException:
+                # Estado da sessão é incerto após erro (ou cancelamento) no meio de um comando: descarta
+                imap.close()
+                raise
+            self._idle.append((imap, time.monotonic()))
+        finally:
+            self._slots.release()
+
+# Sessões asyncio só valem no loop em que foram abertas
+_POOLS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[Mailbox, _AsyncPool]]" = weakref.WeakKeyDictionary()
+
+def _pool(mailbox: Mailbox) -> _AsyncPool:
+    pools = _POOLS.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(mailbox)
+    if pool is None:
+        pool = pools[mailbox] = _AsyncPool(mailbox)
+    return pool
+
+async def close_pools() -> None:
+    """Encerra as sessões ociosas do loop atual (ao desligar o servidor ASGI)."""
+    pools = _POOLS.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        idle, pool._idle = pool._idle, []
+        for imap, _ in idle:
+            await imap.logout()
+
+# -----------------------------------------------------------------------------
+# Busca (mesmos passos de leitor._scan_mailbox)
+# -----------------------------------------------------------------------------
+async def _search(imap: _AsyncImap, criteria: list[str], since: datetime) -> list[bytes]:
+    """UID SEARCH com os critérios; se o servidor recusar algum, só por data (como o leitor)."""
+    try:
+        with metrics.timer("imap_search"):
+            typ, data = await imap.uid("SEARCH", *criteria)
+    except ImapError:
+        typ, data = "BAD", None
+    if typ != "OK":
+        with metrics.timer("imap_search"):
+            typ, data = await imap.uid("SEARCH", "SINCE", since.strftime("%d-%b-%Y"))
+        if typ != "OK":
+            return []
+    return (data[0] or b"").split()
+
+async def _fetch_header_batch(imap: _AsyncImap, uids: list[bytes]) -> Optional[dict]:
+    with metrics.timer("imap_fetch_headers"):
+        typ, data = await imap.uid("FETCH", leitor._sequence_set(uids), leitor._HEADERS_ITEMS)
+    return leitor._parse_headers(data) if typ == "OK" else None
+
+async def _fetch_headers(imap: _AsyncImap, uids: list[bytes]) -> dict:
+    return await _fetch_header_batch(imap, uids) or {}
+
+async def _sync_headers(imap: _AsyncImap, source: str, since: datetime, limit: int) -> None:
+    valid, last_uid = await asyncio.to_thread(leitor._checkpoint, source, imap.uidvalidity)
+    # "n:*" sempre inclui o último e-mail, mesmo com UID menor que n
+    uids = [u for u in await _search(imap, leitor._sync_criteria(since, last_uid), since) if int(u) > last_uid]
+    stored = await asyncio.to_thread(leitor._cached_uids, source, last_uid) if valid else set()
+
+    rows = []
+    for batch in leitor._header_batches(leitor._sync_plan(uids, stored, limit), first=100):
+        headers = await _fetch_header_batch(imap, batch)
+        if headers is None:
+            continue
+        stored.update(int(u) for u in batch)
+        rows.extend(leitor._header_row(source, uid, head) for uid, head in headers.items())
+
+    new_last = leitor._sync_checkpoint(last_uid, uids, stored)
+    if valid and not rows and new_last == last_uid:
+        return
+    await asyncio.to_thread(leitor._store_headers, source, imap.uidvalidity, new_last, rows)
+
+async def _scan_candidates(imap: _AsyncImap, criteria: list[str], since: datetime, limit: int) -> list[tuple]:
+    uids = (await _search(imap, criteria, since))[-limit:][::-1]
+    candidates = []
+    for batch in leitor._header_batches(uids):
+        headers = await _fetch_headers(imap, batch)
+        for uid in batch:
+            head = headers.get(uid)
+            if head is not None:
+                candidates.append((uid, *leitor._header_fields(head)))
+    return candidates
+
+async def _email_body(imap: _AsyncImap, source: str, uid: bytes) -> Optional[str]:
+    if leitor.LEITOR_CACHE:
+        body_html = await asyncio.to_thread(leitor._cached_body, source, uid)
+        if body_html is not None:
+            return body_html
+    with metrics.timer("imap_fetch_body"):
+        typ, data = await imap.uid("FETCH", uid.decode(), "(UID BODY.PEEK[])")
+    msg = leitor._parse_message(data) if typ == "OK" else None
+    if msg is None:
+        return None
+    body_html = leitor._body_html(msg)
+    if leitor.LEITOR_CACHE:
+        await asyncio.to_thread(leitor._store_body, source, uid, body_html)
+    return body_html
+
+async def _scan_mailbox(
+    mailbox: Mailbox,
+    target_email: str,
+    lookback_days: int,
+    max_scan: int,
+    matcher: services.Matcher,
+    wanted: list[str],
+) -> dict[str, tuple[str, datetime, str]]:
+    """Como leitor._scan_mailbox (mesmo leitor._Scan), com o IMAP em asyncio."""
+    scan = leitor._Scan(matcher, wanted, target_email, lookback_days)
+    source = mailbox.key
+    async with _pool(mailbox).session() as imap:
+        if leitor.LEITOR_CACHE:
+            await _sync_headers(imap, source, scan.since, leitor.LEITOR_CACHE_MAX_MESSAGES)
+            candidates = await asyncio.to_thread(lambda: list(leitor._cached_candidates(source, scan.criteria, max_scan)))
+        else:
+            candidates = await _scan_candidates(imap, leitor._imap_criteria(scan.criteria), scan.since, max_scan)
+
+        for candidate in candidates:
+            names = scan.match(candidate)
+            if not names:
+                continue
+            body_html = await _email_body(imap, source, candidate[0])
+            if body_html is not None and scan.add(names, candidate, body_html):
+                break
+    return scan.result()
+
+async def _find_login_emails(
+    target_email: str,
+    lookback_days: int,
+    max_scan: int,
+    matcher: services.Matcher,
+    plan: dict[Mailbox, list[str]],
+) -> dict[str, tuple[str, datetime, str]]:
+    """Como leitor._find_login_emails: todas as caixas ao mesmo tempo, primeiro e-mail de cada filtro."""
+    if len(plan) == 1:
+        (mailbox, wanted), = plan.items()
+        return await _scan_mailbox(mailbox, target_email, lookback_days, max_scan, matcher, wanted)
+
+    tasks = {
+        asyncio.ensure_future(_scan_mailbox(mailbox, target_email, lookback_days, max_scan, matcher, wanted)): mailbox
+        for mailbox, wanted in plan.items()
+    }
+    merged = leitor._Merge(plan)
+    not_done = set(tasks)
+    try:
+        while not_done and merged.pending:
+            done, not_done = await asyncio.wait(not_done, timeout=merged.remaining(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                merged.timed_out(tasks[t] for t in not_done)
+                break
+            for task in done:
+                merged.add(tasks[task], task.result)
+    finally:
+        # As demais caixas são interrompidas (a sessão cancelada é descartada do pool)
+        for task in not_done:
+            task.cancel()
+    return merged.result()
+
+async def fetch_login_code_email_html(
+    service: str, target_email: str, lookback_days: int = 7, max_scan: int = 200
+) -> Optional[str]:
+    """HTML do e-mail de código mais recente do serviço (filtros de services.SERVICES), ou None."""
+    name = services.canonical(service)
+    if name is None:
+        return None
+    plan = {m: [name] for m in leitor.mailboxes_for(service, target_email)}
+    found = await _find_login_emails(target_email, lookback_days, max_scan, services.MATCHER, plan)
+    return leitor._render_email(*found[name]) if name in found else None
+
+async def fetch_login_codes(target_email: str, wanted: List[str], lookback_days: int = 7, max_scan: int = 200) -> dict[str, dict]:
+    """Como leitor.fetch_login_codes."""
+    plan = leitor._codes_plan(target_email, wanted)
+    if not plan:
+        return {}
+    found = await _find_login_emails(target_email, lookback_days, max_scan, services.MATCHER, plan)
+    return leitor._compact_results(found)
+
+async def fetch_login_code(service: str, target_email: str, lookback_days: int = 7, max_scan: int = 200) -> Optional[dict]:
+    """Como leitor.fetch_login_code."""
+    return (await fetch_login_codes(target_email, [service], lookback_days, max_scan)).get(services.canonical(service))
@@ -0,0 +1,50 @@
+"""
+Armazenamento local em SQLite (modo WAL), compartilhado entre os workers do
+gunicorn no mesmo host. Cada thread usa sua própria conexão.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+LOCAL_STORE_DIR = os.environ.get("LOCAL_STORE_DIR") or tempfile.gettempdir()
+
+_local = threading.local()
+
+def path(name: str) -> str:
+    return os.path.join(LOCAL_STORE_DIR, f"allcodes-{name}.sqlite3")
+
+def connect(name: str, schema: str = "") -> sqlite3.Connection:
+    """
+    Conexão (por thread e por processo) ao banco local `name`, criando o
+    schema na primeira abertura. Autocommit; para várias escritas atômicas use
+    `transaction(conn)`.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != os.getpid():
+        # Após fork (gunicorn --preload) não reaproveita conexões do processo pai
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(name)
+    if conn is None:
+        os.makedirs(LOCAL_STORE_DIR, exist_ok=True)
+        conn = sqlite3.connect(path(name), timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            conn.executescript(schema)
+        conns[name] = conn
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK em caso de erro)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
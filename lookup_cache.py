@@ -0,0 +1,226 @@
+"""
+Cache de resultados da busca de códigos, compartilhado entre os workers do host.
+
+Chave: (serviço canônico, e-mail da conta). Além do TTL curto, faz "single-flight":
+se vários pedidos iguais chegam juntos (cliente apertando "Buscar" várias vezes,
+contas compartilhadas), só um faz a busca IMAP e os demais esperam o resultado.
+
+Os valores são guardados em JSON (o resultado compacto da busca). O HTML completo
+do e-mail fica à parte (`keep_email`), só para quem pedir para vê-lo.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+import localstore
+import services
+
+LOOKUP_CACHE_TTL = float(os.environ.get("LOOKUP_CACHE_TTL", "30"))
+# "Não achei" fica pouco tempo: só o suficiente para entregar aos pedidos que esperavam
+LOOKUP_CACHE_MISS_TTL = float(os.environ.get("LOOKUP_CACHE_MISS_TTL", "3"))
+# Tempo máximo que um pedido espera pela busca de outro antes de buscar ele mesmo
+LOOKUP_CACHE_WAIT_SECONDS = float(os.environ.get("LOOKUP_CACHE_WAIT_SECONDS", "45"))
+# Por quanto tempo o link "ver e-mail completo" continua válido
+LOOKUP_EMAIL_TTL = float(os.environ.get("LOOKUP_EMAIL_TTL", "900"))
+
+_POLL_SECONDS = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS emails (
+    token TEXT PRIMARY KEY,
+    html TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_MISSING = object()
+
+def _db() -> sqlite3.Connection:
+    return localstore.connect("lookup-cache", _SCHEMA)
+
+def _key(service: str, target_email: str) -> str:
+    return f"{services.canonical(service) or service}|{(target_email or '').strip().lower()}"
+
+def _count(db: sqlite3.Connection, name: str) -> None:
+    db.execute(
+        "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+def _cached(db: sqlite3.Connection, key: str):
+    row = db.execute(
+        "SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, time.time())
+    ).fetchone()
+    if row is None:
+        return _MISSING
+    try:
+        return json.loads(row[0]) if row[0] is not None else None
+    except ValueError:
+        # Valor gravado por uma versão anterior (HTML puro): trata como ausente
+        return _MISSING
+
+def _try_lease(db: sqlite3.Connection, key: str, owner: str) -> bool:
+    now = time.time()
+    with localstore.transaction(db):
+        db.execute("DELETE FROM inflight WHERE key = ? AND expires_at <= ?", (key, now))
+        cur = db.execute(
+            "INSERT OR IGNORE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, owner, now + LOOKUP_CACHE_WAIT_SECONDS),
+        )
+        return cur.rowcount == 1
+
+def _finish(db: sqlite3.Connection, key: str, owner: str, value) -> None:
+    now = time.time()
+    ttl = LOOKUP_CACHE_TTL if value is not None else LOOKUP_CACHE_MISS_TTL
+    with localstore.transaction(db):
+        db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        db.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value) if value is not None else None, now + ttl),
+        )
+        db.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+def _release(db: sqlite3.Connection, key: str, owner: str) -> None:
+    db.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+def get_or_compute(service: str, target_email: str, compute: Callable[[], Any]) -> Any:
+    """
+    Resultado em cache para (serviço, e-mail) ou executa `compute()` uma única vez
+    entre todos os pedidos concorrentes iguais. O valor precisa ser serializável em
+    JSON; exceções de `compute` não são cacheadas.
+    """
+    key = _key(service, target_email)
+    owner = f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex}"
+    try:
+        db = _db()
+        value = _cached(db, key)
+        if value is not _MISSING:
+            _count(db, "hits")
+            return value
+
+        waited = False
+        deadline = time.monotonic() + LOOKUP_CACHE_WAIT_SECONDS
+        # Sem lease: outro pedido já está buscando, espera o resultado dele. Se ele
+        # falhar (lease liberado sem resultado), o próximo _try_lease assume a busca.
+        while not _try_lease(db, key, owner):
+            if not waited:
+                _count(db, "coalesced")
+                waited = True
+            time.sleep(_POLL_SECONDS)
+            value = _cached(db, key)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                break
+        _count(db, "misses")
+    except sqlite3.Error as e:
+        print("ERRO NO CACHE DE BUSCAS:", repr(e))
+        return compute()
+
+    try:
+        value = compute()
+    except BaseException:
+        _release(db, key, owner)
+        raise
+    try:
+        _finish(db, key, owner, value)
+    except sqlite3.Error as e:
+        print("ERRO NO CACHE DE BUSCAS:", repr(e))
+    return value
+
+def _in_thread(step: Callable, *args):
+    # Conexões do localstore são por thread: cada passo abre (ou reusa) a da thread que o executa
+    return asyncio.to_thread(lambda: step(_db(), *args))
+
+async def get_or_compute_async(service: str, target_email: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    get_or_compute para asyncio: o SQLite roda em threads e a espera pela busca de
+    outro pedido não prende o loop.
+    """
+    key = _key(service, target_email)
+    owner = f"{os.getpid()}:async:{uuid.uuid4().hex}"
+    try:
+        value = await _in_thread(_cached, key)
+        if value is not _MISSING:
+            await _in_thread(_count, "hits")
+            return value
+
+        waited = False
+        deadline = time.monotonic() + LOOKUP_CACHE_WAIT_SECONDS
+        while not await _in_thread(_try_lease, key, owner):
+            if not waited:
+                await _in_thread(_count, "coalesced")
+                waited = True
+            await asyncio.sleep(_POLL_SECONDS)
+            value = await _in_thread(_cached, key)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                break
+        await _in_thread(_count, "misses")
+    except sqlite3.Error as e:
+        print("ERRO NO CACHE DE BUSCAS:", repr(e))
+        return await compute()
+
+    try:
+        value = await compute()
+    except BaseException:
+        await _in_thread(_release, key, owner)
+        raise
+    try:
+        await _in_thread(_finish, key, owner, value)
+    except sqlite3.Error as e:
+        print("ERRO NO CACHE DE BUSCAS:", repr(e))
+    return value
+
+def keep_email(email_html: str) -> str:
+    """
+    Guarda o HTML completo de um e-mail por LOOKUP_EMAIL_TTL segundos e devolve o
+    token para buscá-lo depois (`kept_email`). O token é o hash do conteúdo: o
+    mesmo e-mail pedido várias vezes ocupa uma linha só.
+    """
+    token = hashlib.sha256(email_html.encode("utf-8", "replace")).hexdigest()[:32]
+    now = time.time()
+    db = _db()
+    # Já guardado: só renova o prazo (não regrava o HTML)
+    cur = db.execute("UPDATE emails SET expires_at = ? WHERE token = ?", (now + LOOKUP_EMAIL_TTL, token))
+    if cur.rowcount == 0:
+        with localstore.transaction(db):
+            db.execute("DELETE FROM emails WHERE expires_at <= ?", (now,))
+            db.execute(
+                "INSERT OR REPLACE INTO emails (token, html, expires_at) VALUES (?, ?, ?)",
+                (token, email_html, now + LOOKUP_EMAIL_TTL),
+            )
+    return token
+
+def kept_email(token: str) -> Optional[str]:
+    """HTML guardado por `keep_email` (None se expirou ou não existe)."""
+    row = _db().execute(
+        "SELECT html FROM emails WHERE token = ? AND expires_at > ?", (token, time.time())
+    ).fetchone()
+    return row[0] if row else None
+
+def stats() -> dict:
+    """Contadores acumulados (todos os workers): hits, misses, coalesced."""
+    rows = dict(_db().execute("SELECT name, value FROM counters").fetchall())
+    return {name: int(rows.get(name, 0)) for name in ("hits", "misses", "coalesced")}
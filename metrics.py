@@ -0,0 +1,149 @@
+"""
+Métricas da busca (histogramas no formato Prometheus).
+
+Cada processo acumula em memória (um lock e alguns somatórios por observação) e,
+no máximo a cada METRICS_FLUSH_SECONDS, soma os incrementos no SQLite local
+compartilhado pelos workers do mesmo host (localstore). O /metrics do app lê
+esse total, então qualquer worker responde pelo conjunto.
+
+Uso:
+    with metrics.timer("imap_search"):
+        ...
+    metrics.observe("allcodes_lookup_seconds", 0.42, service="netflix", result="hit")
+"""
+import atexit
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Optional
+
+import localstore
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in {"0", "false", "no", ""}
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "10"))
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+# nome: (ajuda, buckets)
+HISTOGRAMS: dict[str, tuple[str, tuple]] = {
+    "allcodes_stage_seconds": ("Duração de cada etapa da busca (banco, decifrar, IMAP, MIME, template).", TIME_BUCKETS),
+    "allcodes_lookup_seconds": ("Duração total da busca pública, por serviço e resultado.", TIME_BUCKETS),
+    "allcodes_lookup_messages_scanned": ("E-mails examinados por busca ao vivo na caixa.", COUNT_BUCKETS),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_values (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, bucket)
+);
+"""
+
+# (nome, labels) -> [contagem por bucket..., +Inf, soma]; só os incrementos desde o último flush
+_pending: dict[tuple[str, str], list[float]] = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_pid = os.getpid()
+
+def _db():
+    return localstore.connect("metrics", _SCHEMA)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: dict) -> str:
+    """Labels no formato do Prometheus (ordenados), já escapados."""
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+def observe(name: str, value: float, **labels) -> None:
+    global _pid
+    if not METRICS_ENABLED:
+        return
+    buckets = HISTOGRAMS[name][1]
+    key = (name, _labels(labels))
+    with _lock:
+        if _pid != os.getpid():
+            # Processo filho (fork do gunicorn): o que veio do pai não é dele
+            _pending.clear()
+            _pid = os.getpid()
+        slots = _pending.get(key)
+        if slots is None:
+            slots = _pending[key] = [0.0] * (len(buckets) + 2)
+        slots[bisect_left(buckets, value)] += 1
+        slots[-1] += value
+    if time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS:
+        flush()
+
+@contextmanager
+def timer(stage: str, **labels):
+    """Mede o bloco em allcodes_stage_seconds{stage=...} (também quando ele levanta erro)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("allcodes_stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+def flush() -> None:
+    """Soma os incrementos deste processo no banco local compartilhado."""
+    global _last_flush
+    with _lock:
+        if _pid != os.getpid():
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    rows = []
+    for (name, labels), slots in pending.items():
+        bounds = [repr(float(b)) for b in HISTOGRAMS[name][1]] + ["+Inf", "sum"]
+        rows.extend((name, labels, b, v) for b, v in zip(bounds, slots) if v)
+    try:
+        db = _db()
+        with localstore.transaction(db):
+            db.executemany(
+                """INSERT INTO metric_values (name, labels, bucket, value) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (name, labels, bucket) DO UPDATE SET value = value + excluded.value""",
+                rows,
+            )
+    except Exception as e:
+        print("ERRO AO GRAVAR MÉTRICAS:", repr(e))
+
+atexit.register(flush)
+
+def render(counters: Optional[dict[str, tuple[str, dict[str, float]]]] = None) -> str:
+    """
+    Texto no formato de exposição do Prometheus com os histogramas de todos os
+    workers. `counters` acrescenta contadores já agregados: {nome: (ajuda, {labels: valor})}.
+    """
+    flush()
+    data: dict[tuple[str, str], dict[str, float]] = {}
+    for name, labels, bucket, value in _db().execute(
+        "SELECT name, labels, bucket, value FROM metric_values ORDER BY name, labels"
+    ):
+        data.setdefault((name, labels), {})[bucket] = value
+
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (n, labels), values in data.items():
+            if n != name:
+                continue
+            sep = "," if labels else ""
+            cumulative = 0.0
+            for b in [repr(float(b)) for b in buckets] + ["+Inf"]:
+                cumulative += values.get(b, 0.0)
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{b}"}} {int(cumulative)}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {values.get('sum', 0.0):.6f}")
+            lines.append(f"{name}_count{suffix} {int(cumulative)}")
+    for name, (help_text, values) in (counters or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for labels, value in values.items():
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
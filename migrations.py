@@ -0,0 +1,341 @@
+"""
+Migrações versionadas do schema.
+
+Cada migração tem um número e roda uma única vez; as aplicadas ficam em
+`schema_migrations`. Rode no deploy:
+
+    python migrations.py            # ou: flask --app app migrate
+
+Com AUTO_MIGRATE=1 (padrão, bom para dev local) o `db.get_engine()` também aplica o
+que faltar no primeiro uso do banco; com o schema em dia isso custa um único
+SELECT. As migrações são idempotentes (IF NOT EXISTS / coluna só se faltar), então
+bases criadas antes deste arquivo — pelo antigo ensure_schema() — são apenas
+registradas.
+"""
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+import account_search
+
+# Chave do pg_advisory_lock: só um processo migra por vez
+_PG_LOCK_KEY = 0x616C6C636F646573  # "allcodes"
+# Linhas por lote nos backfills
+_BACKFILL_BATCH = 1000
+
+def _ensure_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ... ADD COLUMN para bases criadas antes da coluna existir."""
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+# -----------------------------------------------------------------------------
+# Migrações (nunca altere uma já publicada; acrescente uma nova no fim)
+# -----------------------------------------------------------------------------
+def _m1_streaming_accounts(conn: Connection) -> None:
+    id_col = "INTEGER PRIMARY KEY AUTOINCREMENT" if conn.dialect.name == "sqlite" else "BIGSERIAL PRIMARY KEY"
+    conn.execute(text(f"""
+    CREATE TABLE IF NOT EXISTS streaming_accounts (
+        id {id_col},
+        platform TEXT NOT NULL,
+        email TEXT NOT NULL,
+        password_enc TEXT NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP NOT NULL,
+        CONSTRAINT uq_platform_email UNIQUE (platform, email)
+    )
+    """))
+
+def _m2_login_code_index(conn: Connection) -> None:
+    # Índice de e-mails de código mantido pelo indexer.py (IMAP IDLE)
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS login_code_index (
+        service TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        msg_uid TEXT NOT NULL,
+        msg_date TIMESTAMP NOT NULL,
+        email_html TEXT NOT NULL,
+        indexed_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (service, recipient)
+    )
+    """))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS login_code_indexer (
+        id INTEGER PRIMARY KEY,
+        uidvalidity BIGINT,
+        last_uid BIGINT,
+        heartbeat_at TIMESTAMP
+    )
+    """))
+
+def _m3_login_code_result(conn: Connection) -> None:
+    _ensure_column(conn, "login_code_index", "result_json", "TEXT")
+
+def _m4_password_verifier(conn: Connection) -> None:
+    _ensure_column(conn, "streaming_accounts", "password_verifier", "TEXT")
+
+def _m5_account_search(conn: Connection) -> None:
+    # email_norm + índices de busca do admin (trigramas no Postgres, FTS5 no SQLite)
+    account_search.ensure_schema(conn)
+
+def _m6_fernet_rotation(conn: Connection) -> None:
+    # Checkpoint da rotação de chave (keyrotation.py), uma linha por chave nova
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS fernet_rotation (
+        key_id TEXT PRIMARY KEY,
+        last_id BIGINT NOT NULL,
+        rotated BIGINT NOT NULL,
+        unchanged BIGINT NOT NULL,
+        failed BIGINT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP
+    )
+    """))
+
+def _m7_lookup_audit(conn: Connection) -> None:
+    # Registro das buscas públicas (audit.py) e totais por hora para o painel
+    id_col = "INTEGER PRIMARY KEY AUTOINCREMENT" if conn.dialect.name == "sqlite" else "BIGSERIAL PRIMARY KEY"
+    conn.execute(text(f"""
+    CREATE TABLE IF NOT EXISTS lookup_events (
+        id {id_col},
+        at TIMESTAMP NOT NULL,
+        service TEXT NOT NULL,
+        email TEXT NOT NULL,
+        outcome TEXT NOT NULL,
+        total_ms INTEGER NOT NULL,
+        imap_ms INTEGER,
+        client_ip TEXT
+    )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_lookup_events_email_at ON lookup_events (email, at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_lookup_events_at ON lookup_events (at)"))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS lookup_rollup (
+        bucket TIMESTAMP NOT NULL,
+        service TEXT NOT NULL,
+        outcome TEXT NOT NULL,
+        n BIGINT NOT NULL,
+        total_ms BIGINT NOT NULL,
+        imap_ms BIGINT NOT NULL,
+        imap_n BIGINT NOT NULL,
+        PRIMARY KEY (bucket, service, outcome)
+    )
+    """))
+
+def _m8_account_changes(conn: Connection) -> None:
+    # Geração das contas: cada gravação em streaming_accounts soma 1 (account_filter.py)
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS account_changes (
+        id INTEGER PRIMARY KEY,
+        generation BIGINT NOT NULL,
+        changed_at TIMESTAMP NOT NULL
+    )
+    """))
+    if conn.execute(text("SELECT 1 FROM account_changes WHERE id = 1")).first() is None:
+        conn.execute(
+            text("INSERT INTO account_changes (id, generation, changed_at) VALUES (1, 0, :now)"),
+            {"now": datetime.utcnow()},
+        )
+
+class DuplicateAccounts(RuntimeError):
+    """A migração 9 achou contas que viram a mesma chave: nada é apagado, o índice único fica para depois."""
+
+    def __init__(self, groups: list[tuple[str, str, int]]):
+        self.groups = groups
+        shown = "; ".join(f"{p} {e} ({n} linhas)" for p, e, n in groups[:20])
+        more = f" e mais {len(groups) - 20}" if len(groups) > 20 else ""
+        super().__init__(
+            f"{len(groups)} conta(s) duplicada(s) por (platform_canonical, email_norm): {shown}{more}. "
+            "Revise e junte com `flask --app app merge-duplicate-accounts` (lista; --apply junta) "
+            "e rode a migração de novo."
+        )
+
+def _backfill_canonical(conn: Connection) -> int:
+    """Preenche um lote de linhas sem platform_canonical; devolve quantas foram preenchidas."""
+    rows = conn.execute(
+        text("""
+            SELECT id, platform, email FROM streaming_accounts
+            WHERE platform_canonical IS NULL ORDER BY id LIMIT :n
+        """),
+        {"n": _BACKFILL_BATCH},
+    ).mappings().all()
+    updates = []
+    for r in rows:
+        platform, email = account_search.account_key(r["platform"], r["email"])
+        updates.append({"i": r["id"], "p": platform, "e": email})
+    if updates:
+        conn.execute(text("UPDATE streaming_accounts SET platform_canonical = :p, email_norm = :e WHERE id = :i"), updates)
+    return len(updates)
+
+def backfill_canonical(engine: Engine) -> None:
+    """Backfill da migração 9, um lote por transação; retoma de onde parou (só linhas ainda NULL)."""
+    with engine.begin() as conn:
+        _ensure_column(conn, "streaming_accounts", "platform_canonical", "TEXT")
+    while True:
+        with engine.begin() as conn:
+            if not _backfill_canonical(conn):
+                return
+
+def duplicate_accounts(conn: Connection) -> list[tuple[str, str, int]]:
+    """(platform_canonical, email_norm, linhas) de cada chave com mais de uma conta."""
+    return [tuple(r) for r in conn.execute(text("""
+        SELECT platform_canonical, email_norm, count(*) FROM streaming_accounts
+        WHERE platform_canonical IS NOT NULL
+        GROUP BY platform_canonical, email_norm HAVING count(*) > 1
+        ORDER BY platform_canonical, email_norm
+    """))]
+
+def merge_duplicate_accounts(engine: Engine, log: Callable[[str], None], apply: bool = False) -> int:
+    """
+    Junta as contas duplicadas da migração 9: fica a mais recente, com as observações
+    das demais. Cada linha removida vai inteira para `log` (com a senha cifrada, para
+    poder restaurar). Sem `apply` só lista. Devolve quantas linhas foram (ou seriam) removidas.
+    """
+    backfill_canonical(engine)
+    with _migration_lock(engine):
+        with engine.connect() as conn:
+            groups = duplicate_accounts(conn)
+        dropped = 0
+        for platform, email, _ in groups:
+            # Uma transação por conta: uma falha no meio não perde as já juntadas
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    text("""
+                        SELECT id, platform, email, password_enc, notes, created_at FROM streaming_accounts
+                        WHERE platform_canonical = :p AND email_norm = :e
+                        ORDER BY created_at DESC, id DESC
+                    """),
+                    {"p": platform, "e": email},
+                ).mappings().all()
+                keep, drop = rows[0], rows[1:]
+                for r in drop:
+                    log(json.dumps({
+                        "dropped_id": r["id"], "kept_id": keep["id"], "platform": r["platform"],
+                        "email": r["email"], "created_at": str(r["created_at"]),
+                        "password_enc": r["password_enc"], "notes": r["notes"],
+                    }, ensure_ascii=False))
+                dropped += len(drop)
+                if not apply:
+                    continue
+                notes = []
+                for r in rows:
+                    if r["notes"] and r["notes"] not in notes:
+                        notes.append(r["notes"])
+                conn.execute(text("UPDATE streaming_accounts SET notes = :n WHERE id = :i"),
+                             {"n": " | ".join(notes) or None, "i": keep["id"]})
+                conn.execute(text("DELETE FROM streaming_accounts WHERE id = :i"), [{"i": r["id"]} for r in drop])
+                # Contas removidas: os filtros de contas dos workers são reconstruídos
+                _bump_generation(conn)
+    return dropped
+
+def _bump_generation(conn: Connection) -> None:
+    conn.execute(text("UPDATE account_changes SET generation = generation + 1, changed_at = :now WHERE id = 1"),
+                 {"now": datetime.utcnow()})
+
+def _m9_platform_canonical(engine: Engine) -> None:
+    # Chave única normalizada: a busca pública vira uma consulta por índice, sem OR de aliases.
+    # Fora da transação única: cada lote do backfill é uma transação (tabela grande não
+    # fica travada, e uma falha no meio retoma do lote seguinte)
+    backfill_canonical(engine)
+    with engine.begin() as conn:
+        # Linhas gravadas durante o backfill (versão anterior do app ainda no ar)
+        while _backfill_canonical(conn):
+            pass
+        # "amazon" / "prime", "hbomax" / "max", "Cliente@x.com" / "cliente@x.com" viram a
+        # mesma chave. A migração não apaga contas: recusa, e quem junta é o admin
+        groups = duplicate_accounts(conn)
+        if groups:
+            raise DuplicateAccounts(groups)
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_streaming_accounts_canonical "
+            "ON streaming_accounts (platform_canonical, email_norm)"
+        ))
+        # Chaves novas: os filtros de contas dos workers em execução são reconstruídos
+        _bump_generation(conn)
+
+MIGRATIONS: list[tuple[int, str, Callable]] = [
+    (1, "streaming_accounts", _m1_streaming_accounts),
+    (2, "login_code_index", _m2_login_code_index),
+    (3, "login_code_index.result_json", _m3_login_code_result),
+    (4, "streaming_accounts.password_verifier", _m4_password_verifier),
+    (5, "account_search", _m5_account_search),
+    (6, "fernet_rotation", _m6_fernet_rotation),
+    (7, "lookup_events", _m7_lookup_audit),
+    (8, "account_changes", _m8_account_changes),
+    (9, "streaming_accounts.platform_canonical", _m9_platform_canonical),
+]
+LATEST = MIGRATIONS[-1][0]
+# Recebem o engine e abrem as próprias transações (backfill em lotes); as demais
+# recebem a conexão de uma transação só delas
+_OWN_TRANSACTIONS = {9}
+
+# -----------------------------------------------------------------------------
+# Execução
+# -----------------------------------------------------------------------------
+def current_version(engine: Engine) -> int:
+    """Maior versão aplicada (0 se a tabela de controle ainda não existe)."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT max(version) FROM schema_migrations")).scalar() or 0
+    except Exception:
+        return 0
+
+@contextmanager
+def _migration_lock(engine: Engine):
+    """Só um processo migra por vez (Postgres): advisory lock de sessão, numa conexão só dele."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _PG_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _PG_LOCK_KEY})
+
+def migrate(engine: Engine, log: Callable[[str], None] = None) -> list[int]:
+    """Aplica as migrações pendentes (cada uma na sua transação) e devolve as versões aplicadas."""
+    if current_version(engine) >= LATEST:
+        return []
+
+    applied_now = []
+    with _migration_lock(engine):
+        with engine.begin() as conn:
+            conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+            """))
+            # Relê sob o lock: outro processo pode ter migrado enquanto esperávamos
+            done = {v for (v,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            if version in _OWN_TRANSACTIONS:
+                step(engine)
+            with engine.begin() as conn:
+                if version not in _OWN_TRANSACTIONS:
+                    step(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :ts)"),
+                    {"v": version, "n": name, "ts": datetime.utcnow()},
+                )
+            applied_now.append(version)
+            if log:
+                log(f"migração {version} aplicada: {name}")
+    return applied_now
+
+if __name__ == "__main__":
+    import sqlalchemy
+
+    import db
+
+    # Engine próprio (sem AUTO_MIGRATE) para relatar o que foi aplicado
+    applied = migrate(sqlalchemy.create_engine(db.DATABASE_URL, future=True), log=print)
+    print(f"Schema na versão {LATEST}" + ("" if applied else " (nada a aplicar)"))
@@ -0,0 +1,176 @@
+"""
+Registro dos serviços de streaming: nome canônico, aliases, assuntos e remetentes
+dos e-mails de código e regras de extração.
+
+Tudo que depende do serviço (validação do formulário, aliases de plataforma no
+banco, filtros do leitor IMAP, indexador, extração do código) lê daqui. Para
+adicionar uma plataforma basta uma entrada em SERVICES.
+
+Os filtros de todos os serviços são compilados uma única vez em um `Matcher`: uma
+regex combinada para o assunto e outra para o remetente, de modo que cada e-mail é
+classificado para todos os serviços em uma só passada, com custo que não cresce
+com o número de serviços.
+"""
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+# Campos de cada serviço:
+# - label: nome exibido
+# - aliases: nomes antigos/alternativos aceitos no formulário e no banco
+# - subject_keywords: o assunto precisa conter UM destes trechos
+# - sender_needles: se informado, o remetente (From/Sender/Return-Path) precisa conter um destes
+# - forbidden_subject_keywords: assunto com algum destes é descartado
+# - code_digits: tamanho do código de uso único
+# - link_hosts: domínios aceitos para o link de login/confirmação (quando não há código)
+SERVICES: dict[str, dict] = {
+    "disney": {
+        "label": "Disney+",
+        "aliases": [],
+        "subject_keywords": ["Your one-time passcode for Disney+", "Tu código de acceso único para Disney+"],
+        "sender_needles": [],
+        "forbidden_subject_keywords": [],
+        "code_digits": 6,
+        "link_hosts": [],
+    },
+    "netflix": {
+        "label": "Netflix",
+        "aliases": [],
+        "subject_keywords": ["Netflix: Your sign-in code"],
+        "sender_needles": [],
+        "forbidden_subject_keywords": [],
+        "code_digits": 4,
+        "link_hosts": ["netflix.com"],
+    },
+    "prime": {
+        "label": "Prime Video",
+        "aliases": ["amazon", "amazon prime"],
+        "subject_keywords": ["Tentativa de login"],
+        "sender_needles": [],
+        "forbidden_subject_keywords": [],
+        "code_digits": 6,
+        "link_hosts": ["amazon."],
+    },
+    "crunchyroll": {
+        "label": "Crunchyroll",
+        "aliases": [],
+        "subject_keywords": ["Confirma tu nuevo inicio"],
+        "sender_needles": [],
+        "forbidden_subject_keywords": [],
+        "code_digits": 6,
+        "link_hosts": ["crunchyroll.com"],
+    },
+    "max": {
+        "label": "Max (HBO Max)",
+        "aliases": ["hbomax", "hbo max"],
+        "subject_keywords": ["Urgente: Tu código de un solo uso"],
+        "sender_needles": [],
+        "forbidden_subject_keywords": [],
+        "code_digits": 6,
+        "link_hosts": ["max.com", "hbomax.com"],
+    },
+}
+
+_ALIASES = {alias: name for name, svc in SERVICES.items() for alias in [name] + svc["aliases"]}
+
+def normalize_text(s: str) -> str:
+    """Minúsculas e sem acentos (comparação de assuntos/remetentes)."""
+    if not s:
+        return ""
+    nfkd = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in nfkd if not unicodedata.combining(ch)).lower()
+
+def canonical(service: str) -> Optional[str]:
+    """Nome canônico do serviço (aceita aliases) ou None se desconhecido."""
+    return _ALIASES.get((service or "").strip().lower())
+
+def options() -> list[tuple[str, str]]:
+    """(valor, rótulo) para os <select> de serviço."""
+    return [(name, svc["label"]) for name, svc in SERVICES.items()]
+
+# -----------------------------------------------------------------------------
+# Matcher combinado
+# -----------------------------------------------------------------------------
+class _NeedleSet:
+    """
+    Uma regex com todos os trechos; `scan(text)` devolve a máscara OR dos trechos
+    presentes. A regex é um lookahead em cada posição com as alternativas da mais
+    longa para a mais curta; trechos contidos em outro trecho encontrado entram pela
+    máscara do maior (calculada na compilação).
+    """
+
+    def __init__(self, masks: dict[str, int]):
+        needles = sorted((n for n in masks if n), key=len, reverse=True)
+        self.regex = re.compile("(?=(" + "|".join(re.escape(n) for n in needles) + "))") if needles else None
+        self.masks = {}
+        for n in needles:
+            mask = 0
+            for other in needles:
+                if other in n:
+                    mask |= masks[other]
+            self.masks[n] = mask
+
+    def scan(self, text: str) -> int:
+        if self.regex is None or not text:
+            return 0
+        mask = 0
+        for found in set(self.regex.findall(text)):
+            mask |= self.masks[found]
+        return mask
+
+class Matcher:
+    """
+    Classificador de e-mails para vários conjuntos de filtros de uma vez. Cada
+    filtro ganha um bit; o resultado de `classify` são os nomes cujos filtros o
+    e-mail satisfaz.
+    """
+
+    def __init__(self, rules: dict[str, dict]):
+        self.rules = rules
+        self.names = list(rules)
+        subject, forbidden, sender = {}, {}, {}
+        self.need_subject = self.need_sender = 0
+        for i, name in enumerate(self.names):
+            bit = 1 << i
+            r = rules[name]
+            for k in r.get("subject_keywords") or []:
+                subject[normalize_text(k)] = subject.get(normalize_text(k), 0) | bit
+                self.need_subject |= bit
+            for k in r.get("forbidden_subject_keywords") or []:
+                forbidden[normalize_text(k)] = forbidden.get(normalize_text(k), 0) | bit
+            for k in r.get("sender_needles") or []:
+                sender[normalize_text(k)] = sender.get(normalize_text(k), 0) | bit
+                self.need_sender |= bit
+        self.all = (1 << len(self.names)) - 1
+        self._subject = _NeedleSet(subject)
+        self._forbidden = _NeedleSet(forbidden)
+        self._sender = _NeedleSet(sender)
+
+    def mask(self, subject: str, sender: str) -> int:
+        """Bit i ligado = e-mail satisfaz o filtro self.names[i]."""
+        subject_norm = normalize_text(subject)
+        ok = self.all
+        # 1) Assunto: algum trecho exigido (quem não exige nada passa)
+        ok &= self._subject.scan(subject_norm) | (self.all & ~self.need_subject)
+        # 0) Bloqueios explícitos no assunto
+        if self._forbidden.regex is not None:
+            ok &= ~self._forbidden.scan(subject_norm)
+        # 2) Remetente (só normaliza se algum candidato ainda exigir)
+        if ok & self.need_sender:
+            ok &= self._sender.scan(normalize_text(sender)) | (self.all & ~self.need_sender)
+        return ok
+
+    def classify(self, subject: str, sender: str) -> list[str]:
+        """Nomes cujos filtros o e-mail (assunto / texto do remetente) satisfaz."""
+        ok = self.mask(subject, sender)
+        return [name for i, name in enumerate(self.names) if ok >> i & 1]
+
+MATCHER = Matcher(SERVICES)
+
+def classify(subject: str, sender: str, only: Optional[Iterable[str]] = None) -> list[str]:
+    """Serviços (canônicos) para os quais o e-mail é de código; `only` restringe a alguns."""
+    found = MATCHER.classify(subject, sender)
+    if only is None:
+        return found
+    wanted = {canonical(s) for s in only}
+    return [s for s in found if s in wanted]
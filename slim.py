@@ -0,0 +1,118 @@
+"""
+Emagrecimento do HTML dos e-mails antes de guardá-lo para o link "ver e-mail completo".
+
+E-mails de serviço trazem muito peso que o cliente não vê: imagens embutidas em
+base64 (`data:`), pixels de rastreio, scripts (que o navegador nem executa, pela CSP),
+comentários/condicionais do Outlook, preheaders escondidos e CSS repetido. Tudo isso
+sai; o que aparece na tela (textos, links, imagens remotas, estilos) fica igual.
+Acima de EMAIL_MAX_BYTES o HTML é cortado numa fronteira de tag, com um aviso.
+
+    body_html = slim.slim_html(body_html)
+"""
+import html
+import os
+import re
+from typing import Optional
+
+# 0 desliga o emagrecimento; o teto vale para o HTML já emagrecido (0 = sem teto)
+EMAIL_SLIM = os.environ.get("EMAIL_SLIM", "1") != "0"
+EMAIL_MAX_BYTES = int(os.environ.get("EMAIL_MAX_BYTES", "131072"))
+
+_TRUNCATED = "<p><em>(e-mail muito grande; o restante foi omitido)</em></p>"
+
+# Blocos inteiros que não aparecem (ou não rodam) no e-mail mostrado
+_DROP_BLOCKS = re.compile(r"<(script|noscript|title|iframe|object)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_DROP_TAGS = re.compile(r"<(?:meta|link|base|embed)\b[^>]*>", re.IGNORECASE)
+_COMMENTS = re.compile(r"<!--.*?-->|<!\[endif\]>", re.DOTALL)
+_OPEN_TAGS = re.compile(r"<[a-z][^>]*>", re.IGNORECASE)
+_EVENT_ATTRS = re.compile(r"""\s+on[a-z]+\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>]+)""", re.IGNORECASE)
+
+_IMG = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+_ATTR = r"""\b{}\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))"""
+_SRC = re.compile(_ATTR.format("src"), re.IGNORECASE)
+_ALT = re.compile(_ATTR.format("alt"), re.IGNORECASE)
+_WIDTH = re.compile(_ATTR.format("width"), re.IGNORECASE)
+_HEIGHT = re.compile(_ATTR.format("height"), re.IGNORECASE)
+_STYLE = re.compile(_ATTR.format("style"), re.IGNORECASE)
+_HIDDEN = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden|max-height\s*:\s*0(?:px)?\s*(?:;|$)", re.IGNORECASE)
+_TINY = re.compile(r"(?:width|height)\s*:\s*[01](?:px)?\s*(?:;|$)", re.IGNORECASE)
+_TRACKER_URL = re.compile(r"/(?:open|track|pixel|beacon|wf/open)\b|[?&](?:open|track)=|\.gif\?", re.IGNORECASE)
+
+# Preheader e afins: elemento escondido sem outro do mesmo tipo dentro
+_HIDDEN_BLOCK = re.compile(
+    r"<(div|span|p|td|table)\b[^>]*\bstyle\s*=\s*(\"|')[^\"']*"
+    r"(?:display\s*:\s*none|mso-hide\s*:\s*all)[^\"']*\2[^>]*>(?:(?!<\1\b).)*?</\1\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+_DATA_URL = re.compile(r"url\(\s*['\"]?data:[^)]*\)", re.IGNORECASE)
+
+_STYLE_BLOCK = re.compile(r"<style\b([^>]*)>(.*?)</style\s*>", re.IGNORECASE | re.DOTALL)
+_CSS_COMMENTS = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_SPACES = re.compile(r"\s*([{};,>])\s*")
+_SPACES = re.compile(r"[ \t\r\f\v]*\n\s*|[ \t\r\f\v]{2,}")
+
+def _attr(pattern: re.Pattern, tag: str) -> str:
+    m = pattern.search(tag)
+    return next((g for g in m.groups() if g is not None), "") if m else ""
+
+def _is_invisible_img(tag: str) -> bool:
+    """Pixel de rastreio: 0/1 px, escondido ou com URL típica de rastreador."""
+    if _attr(_WIDTH, tag).strip() in ("0", "1", "0px", "1px") or _attr(_HEIGHT, tag).strip() in ("0", "1", "0px", "1px"):
+        return True
+    style = _attr(_STYLE, tag)
+    if _HIDDEN.search(style) or _TINY.search(style):
+        return True
+    return bool(_TRACKER_URL.search(_attr(_SRC, tag)))
+
+def _img(m: re.Match) -> str:
+    tag = m.group(0)
+    src = _attr(_SRC, tag).strip().lower()
+    if src.startswith("data:"):
+        # Imagem embutida: fica só o texto alternativo (como num cliente que bloqueia imagens)
+        alt = _attr(_ALT, tag)
+        return html.escape(html.unescape(alt)) if alt else ""
+    # cid: aponta para anexo do e-mail, que a página não tem como mostrar
+    if src.startswith("cid:") or _is_invisible_img(tag):
+        return ""
+    return tag
+
+def _styles(body_html: str) -> str:
+    """CSS sem comentários nem espaços sobrando; blocos <style> repetidos saem."""
+    seen = set()
+
+    def one(m: re.Match) -> str:
+        css = _CSS_SPACES.sub(r"\1", _CSS_COMMENTS.sub("", m.group(2))).strip()
+        css = _DATA_URL.sub("none", css)
+        if not css or css in seen:
+            return ""
+        seen.add(css)
+        return f"<style{m.group(1)}>{css}</style>"
+
+    return _STYLE_BLOCK.sub(one, body_html)
+
+def _truncate(body_html: str, max_bytes: int) -> str:
+    raw = body_html.encode("utf-8")
+    if max_bytes <= 0 or len(raw) <= max_bytes:
+        return body_html
+    cut = raw[:max_bytes].decode("utf-8", errors="ignore")
+    # Não deixa tag pela metade
+    if cut.rfind("<") > cut.rfind(">"):
+        cut = cut[:cut.rfind("<")]
+    return cut + _TRUNCATED
+
+def slim_html(body_html: str, max_bytes: Optional[int] = None) -> str:
+    """HTML do e-mail sem o que não aparece na tela, com no máximo `max_bytes` (padrão EMAIL_MAX_BYTES)."""
+    if not EMAIL_SLIM or not body_html:
+        return body_html
+    out = _COMMENTS.sub("", body_html)
+    out = _DROP_BLOCKS.sub("", out)
+    out = _DROP_TAGS.sub("", out)
+    out = _OPEN_TAGS.sub(lambda m: _EVENT_ATTRS.sub("", m.group(0)), out)
+    out = _HIDDEN_BLOCK.sub("", out)
+    out = _IMG.sub(_img, out)
+    out = _DATA_URL.sub("none", out)
+    out = _styles(out)
+    if "<pre" not in out.lower():
+        # Fora de <pre>, quebras e espaços repetidos não mudam o que aparece
+        out = _SPACES.sub(lambda m: "\n" if "\n" in m.group(0) else " ", out)
+    return _truncate(out.strip(), EMAIL_MAX_BYTES if max_bytes is None else max_bytes)
@@ -0,0 +1,113 @@
+/* Busca assíncrona: envia o formulário para /api/lookup e recebe o resultado
+   por Server-Sent Events (ou long-poll). Se algo falhar, cai no POST normal. */
+(function () {
+  var form = document.getElementById('codeForm');
+  if (!form || !window.fetch || !window.FormData || !window.JSON) return;
+
+  var loading = document.getElementById('loadingMessage');
+  var target = document.getElementById('asyncResult');
+
+  function escapeHtml(s) {
+    var div = document.createElement('div');
+    div.textContent = s == null ? '' : String(s);
+    return div.innerHTML;
+  }
+
+  function clearResults() {
+    var old = document.querySelectorAll('[data-result]');
+    for (var i = 0; i < old.length; i++) old[i].parentNode.removeChild(old[i]);
+    target.innerHTML = '';
+  }
+
+  function showError(msg) {
+    loading.style.display = 'none';
+    target.innerHTML = '<div class="result-box error"><strong>' + escapeHtml(msg) + '</strong></div>';
+  }
+
+  function showResult(html) {
+    var service = form.querySelector('[name=service]').value;
+    loading.style.display = 'none';
+    target.innerHTML =
+      '<div class="result-box success"><h3>' + escapeHtml(form.getAttribute('data-label-result')) + '</h3>' +
+      '<div id="emailContent"><strong>' + escapeHtml(form.getAttribute('data-label-service')) + ': ' +
+      escapeHtml(service) + '</strong> <br><br>' + html + '</div></div>';
+  }
+
+  function showCompact(res) {
+    var label = function (name) { return escapeHtml(form.getAttribute('data-label-' + name)); };
+    var service = form.querySelector('[name=service]').value;
+    var emailUrl = form.getAttribute('data-email-url').replace('__TOKEN__', encodeURIComponent(res.email_token));
+    var html = '<div class="result-box success"><h3>' + label('result') + ' – ' + escapeHtml(service) + '</h3>';
+    if (res.code) {
+      html += '<div>' + label('code') + '</div><div class="login-code">' + escapeHtml(res.code) + '</div>';
+    } else if (!res.link) {
+      html += '<div class="muted">' + label('no-code') + '</div>';
+    }
+    html += '<div class="login-code-actions">';
+    if (res.link) {
+      html += '<a class="btn" href="' + escapeHtml(res.link) + '" target="_blank" rel="noopener noreferrer">' +
+        label('open-link') + '</a>';
+    }
+    html += '<a class="btn-outline" href="' + escapeHtml(emailUrl) + '" target="_blank" rel="noopener">' +
+      label('full-email') + '</a></div>';
+    html += '<p class="login-code-meta muted">' + escapeHtml(res.subject) + '<br>' + label('received') + ': ' +
+      escapeHtml(res.date) + '</p></div>';
+    loading.style.display = 'none';
+    target.innerHTML = html;
+  }
+
+  function fallback() {
+    // POST clássico (submit() não dispara o evento "submit" de novo)
+    form.submit();
+  }
+
+  function done(job) {
+    var res = job && job.result;
+    if (!res) return fallback();
+    // "html": mensagens prontas (sem e-mail recente / erro de IMAP)
+    res.html ? showResult(res.html) : showCompact(res);
+  }
+
+  function poll(url) {
+    fetch(url + '?wait=25', { credentials: 'same-origin' })
+      .then(function (r) { return r.json(); })
+      .then(function (job) { job.status === 'pending' ? poll(url) : done(job); })
+      .catch(fallback);
+  }
+
+  function listen(job) {
+    if (!window.EventSource) return poll(job.poll_url);
+    var es = new EventSource(job.events_url);
+    es.addEventListener('result', function (e) {
+      es.close();
+      done(JSON.parse(e.data));
+    });
+    es.addEventListener('gone', function () {
+      es.close();
+      fallback();
+    });
+    es.onerror = function () {
+      // Fim normal do stream: o navegador reconecta sozinho. Só desiste se fechou de vez.
+      if (es.readyState === EventSource.CLOSED) fallback();
+    };
+  }
+
+  form.addEventListener('submit', function (ev) {
+    ev.preventDefault();
+    clearResults();
+    loading.style.display = 'block';
+    fetch(form.getAttribute('data-api'), {
+      method: 'POST',
+      body: new FormData(form),
+      credentials: 'same-origin'
+    })
+      .then(function (r) {
+        return r.json().then(function (body) { return { status: r.status, body: body }; });
+      })
+      .then(function (res) {
+        if (res.status !== 202) return showError(res.body.error);
+        listen(res.body);
+      })
+      .catch(fallback);
+  });
+})();
@@ -0,0 +1,114 @@
+"""
+Configuração comum dos testes: banco SQLite e armazenamento local em pastas
+temporárias, definidos antes de importar os módulos do app (que leem o ambiente
+no import). Caixas IMAP falsas vêm de bench/fake_imap.py.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+_TMP = tempfile.mkdtemp(prefix="allcodes-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_TMP, 'app.db')}",
+    LOCAL_STORE_DIR=os.path.join(_TMP, "store"),
+    SECRET_KEY="test-secret",
+    FERNET_KEY="ZmDfcTF7_60GrrY167zsiPd67pEvs0aGOv2oasOM1Pg=",
+    PASSWORD_VERIFIER_KEY="test-verifier-key",
+    ADMIN_PASSWORD="adm",
+    AUDIT_ENABLED="0",
+    METRICS_ENABLED="0",
+)
+
+from fake_imap import FakeImapServer, Mailbox as FakeMailbox  # noqa: E402
+
+def make_email(subject: str, sender: str, to: str, body: str, when: datetime = None) -> bytes:
+    m = EmailMessage()
+    m["Subject"] = subject
+    m["From"] = sender
+    m["To"] = to
+    m["Date"] = format_datetime(when or datetime.now(tz=timezone.utc))
+    m.set_content(body)
+    m.add_alternative(f"<p>{body}</p>", subtype="html")
+    return m.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+@pytest.fixture
+def imap_server():
+    """Servidor IMAP falso com uma pasta INBOX vazia: (servidor, pasta)."""
+    box = FakeMailbox()
+    srv = FakeImapServer({"INBOX": box}).start()
+    yield srv, box
+    srv.stop()
+
+@pytest.fixture
+def clean_store():
+    """Cache local do leitor vazio (as conexões SQLite são por thread)."""
+    import localstore
+    conns = getattr(localstore._local, "conns", None) or {}
+    for conn in conns.values():
+        conn.close()
+    localstore._local.conns = {}
+    for name in os.listdir(localstore.LOCAL_STORE_DIR) if os.path.isdir(localstore.LOCAL_STORE_DIR) else []:
+        os.remove(os.path.join(localstore.LOCAL_STORE_DIR, name))
+    yield
+
+@pytest.fixture
+def accounts():
+    """Engine do banco do app (migrado) com streaming_accounts vazia."""
+    from sqlalchemy import text
+    import db
+    engine = db.get_engine()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM streaming_accounts"))
+    yield engine
+
+@pytest.fixture
+def admin_client(accounts):
+    """Cliente de teste do Flask com a sessão de admin."""
+    import app as web
+    client = web.app.test_client()
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+    return client
+
+def asgi_call(asgi_app, method: str, path: str, chunks=(b"",), headers=()) -> tuple[int, dict, bytes]:
+    """Um pedido HTTP direto na aplicação ASGI; o corpo chega em `chunks` (como no uvicorn)."""
+    import asyncio
+
+    async def run():
+        messages = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1}
+                    for i, c in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        path_only, _, query = path.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": path_only, "raw_path": path_only.encode(), "root_path": "",
+            "query_string": query.encode(), "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        }
+        await asyncio.wait_for(asgi_app(scope, receive, send), 30)
+        start = next(m for m in sent if m["type"] == "http.response.start")
+        body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+        return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+    return asyncio.run(run())
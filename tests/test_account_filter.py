@@ -0,0 +1,75 @@
+"""Filtro de contas: recusa só em memória, com a janela da conferência da geração limitada."""
+import asyncio
+import os
+import time
+
+import pytest
+from sqlalchemy import event, text
+
+import account_filter
+import app as web
+import asgi
+import db
+
+@pytest.fixture
+def fresh_filter(accounts, monkeypatch):
+    # Sem a thread de conferência: o teste decide quando o filtro é reconstruído
+    monkeypatch.setattr(account_filter, "_thread_pid", os.getpid())
+    monkeypatch.setattr(account_filter, "ACCOUNT_FILTER", True)
+    monkeypatch.setattr(account_filter, "_bloom", None)
+    monkeypatch.setattr(account_filter, "_generation", None)
+    account_filter._misses.clear()
+    account_filter._refresh()
+    yield accounts
+    account_filter._misses.clear()
+
+def _insert_elsewhere(engine, platform: str, email: str) -> None:
+    """Conta gravada por outro worker: soma a geração, mas este processo não vê o added()."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO streaming_accounts
+                (platform, platform_canonical, email, email_norm, password_enc, notes, created_at)
+            VALUES (:p, :p, :e, :e, 'x', '', CURRENT_TIMESTAMP)
+        """), {"p": platform, "e": email})
+        account_filter.changed(conn)
+
+def test_rejected_lookup_does_not_touch_the_database(fresh_filter):
+    connects = []
+
+    def connected(conn):
+        connects.append(conn)
+
+    event.listen(fresh_filter, "engine_connect", connected)
+    try:
+        assert web._find_account("netflix", "ninguem@exemplo.com") is None
+        # asgi.py: SQLite sem driver assíncrono, a consulta iria para uma thread
+        assert asyncio.run(asgi._find_account("netflix", "outro@exemplo.com")) is None
+    finally:
+        event.remove(fresh_filter, "engine_connect", connected)
+    assert fresh_filter is db.get_engine()
+    assert connects == []
+    assert account_filter.stats()["rejected"] >= 2
+
+def test_other_worker_account_is_found_after_the_next_check(fresh_filter):
+    _insert_elsewhere(fresh_filter, "netflix", "nova@exemplo.com")
+    # Janela aceita: até a próxima conferência da thread o filtro em memória não tem a conta
+    assert not account_filter.may_exist("netflix", "nova@exemplo.com")
+
+    account_filter._refresh()
+    assert account_filter.may_exist("netflix", "nova@exemplo.com")
+    assert not account_filter.may_exist("netflix", "outra@exemplo.com")
+
+def test_old_generation_check_stops_rejecting(fresh_filter, monkeypatch):
+    generation = account_filter.generation()
+    account_filter.remember_miss("netflix", "ausente@exemplo.com", generation)
+    assert not account_filter.may_exist("netflix", "ausente@exemplo.com")
+
+    stale = account_filter.stats()["stale"]
+    monkeypatch.setattr(account_filter, "_checked_at",
+                        time.monotonic() - account_filter.ACCOUNT_FILTER_MAX_AGE_SECONDS - 1)
+    assert account_filter.may_exist("netflix", "ausente@exemplo.com")
+    assert account_filter.may_exist("netflix", "ninguem@exemplo.com")
+    assert account_filter.stats()["stale"] == stale + 2
+
+    account_filter._refresh()
+    assert not account_filter.may_exist("netflix", "ninguem@exemplo.com")
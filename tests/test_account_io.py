@@ -0,0 +1,84 @@
+"""Importação de contas: upload pelo Flask (formulário e corpo cru) e pela entrada ASGI."""
+import io
+import json
+
+import pytest
+from sqlalchemy import text
+from werkzeug.wsgi import LimitedStream
+
+import account_io
+from conftest import asgi_call
+
+CSV = (
+    "platform,email,password,notes\r\n"
+    "netflix,a@exemplo.com,senha1,vip\r\n"
+    "hbomax,B@Exemplo.com,senha2,\r\n"
+    "orkut,c@exemplo.com,senha3,\r\n"
+    "disney,sem-arroba,senha4,\r\n"
+).encode("utf-8-sig")
+
+class _ReadOnly:
+    """Só read(n), como o wsgi.input de alguns servidores."""
+
+    def __init__(self, data: bytes):
+        self._buf = io.BytesIO(data)
+
+    def read(self, n: int = -1) -> bytes:
+        return self._buf.read(min(n, 7) if n and n > 0 else n)
+
+@pytest.mark.parametrize("make", [
+    io.BytesIO,
+    lambda data: LimitedStream(io.BytesIO(data), len(data)),
+    _ReadOnly,
+], ids=["bytesio", "limited", "read-only"])
+def test_read_records_accepts_any_binary_stream(make):
+    records = list(account_io._read_records(make(CSV), "csv"))
+    assert [r["email"] for _, r in records] == ["a@exemplo.com", "B@Exemplo.com", "c@exemplo.com", "sem-arroba"]
+    assert [line for line, _ in records] == [2, 3, 4, 5]
+
+def _saved(engine) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT platform_canonical, email_norm, notes FROM streaming_accounts")).all()
+    return {(p, e): n for p, e, n in rows}
+
+def _check_report(report: dict, engine) -> None:
+    assert report["written"] == 2
+    assert report["error_count"] == 2
+    assert [line for line, _ in report["errors"]] == [4, 5]
+    assert _saved(engine) == {("netflix", "a@exemplo.com"): "vip", ("max", "b@exemplo.com"): ""}
+
+def test_import_form_upload(admin_client, accounts):
+    resp = admin_client.post(
+        "/accounts/import", data={"file": (io.BytesIO(CSV), "contas.csv")},
+        headers={"Accept": "application/json"}, content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    _check_report(resp.get_json(), accounts)
+
+def test_import_raw_body(admin_client, accounts):
+    resp = admin_client.post("/accounts/import?format=csv", data=CSV, content_type="text/csv",
+                             headers={"Accept": "application/json"})
+    assert resp.status_code == 200
+    _check_report(resp.get_json(), accounts)
+
+def test_import_jsonl_upserts(admin_client, accounts):
+    lines = [{"platform": "netflix", "email": "a@exemplo.com", "password": "x", "notes": "1"},
+             {"platform": "netflix", "email": "A@EXEMPLO.COM", "password": "y", "notes": "2"}]
+    body = "\n".join(json.dumps(r) for r in lines).encode()
+    resp = admin_client.post("/accounts/import", data=body, content_type="application/x-ndjson",
+                             headers={"Accept": "application/json"})
+    assert resp.get_json()["written"] == 1
+    assert _saved(accounts) == {("netflix", "a@exemplo.com"): "2"}
+
+@pytest.mark.parametrize("length", [True, False], ids=["content-length", "chunked"])
+def test_import_through_asgi(admin_client, accounts, length):
+    import asgi
+    cookie = admin_client.get_cookie("session").value
+    # Corpo em várias mensagens http.request, como o uvicorn entrega
+    chunks = [CSV[i:i + 16] for i in range(0, len(CSV), 16)]
+    headers = [("content-type", "text/csv"), ("accept", "application/json"), ("cookie", f"session={cookie}")]
+    if length:
+        headers.append(("content-length", str(len(CSV))))
+    status, _, body = asgi_call(asgi.app, "POST", "/accounts/import?format=csv", chunks, headers)
+    assert status == 200
+    _check_report(json.loads(body), accounts)
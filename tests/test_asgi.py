@@ -0,0 +1,25 @@
+"""Entrada ASGI: rotas assíncronas da busca e o resto do Flask pelo a2wsgi."""
+import json
+
+import asgi
+from conftest import asgi_call
+
+FORM = [("content-type", "application/x-www-form-urlencoded")]
+
+def test_native_route_reads_the_form():
+    status, headers, body = asgi_call(asgi.app, "POST", "/api/lookup",
+                                      [b"service=orkut&email=a%40b.com", b"&password=x"], FORM)
+    assert status == 400
+    assert headers["content-type"] == "application/json"
+    assert "error" in json.loads(body)
+
+def test_native_route_refuses_large_body():
+    status, _, _ = asgi_call(asgi.app, "POST", "/api/lookup", [b"x" * (40 << 10)] * 2, FORM)
+    assert status == 413
+
+def test_other_routes_go_to_flask():
+    status, headers, body = asgi_call(asgi.app, "GET", "/api/lookup-nao-existe/x/y")
+    assert status == 404
+    status, headers, body = asgi_call(asgi.app, "GET", "/admin/login")
+    assert status == 200
+    assert headers["content-type"].startswith("text/html")
@@ -0,0 +1,79 @@
+"""Tempo de IMAP do audit: vai no registro da própria busca e não vaza para a seguinte."""
+import asyncio
+import time
+
+import pytest
+
+import audit
+import jobs
+
+@pytest.fixture
+def events(monkeypatch):
+    captured = []
+
+    class _Queue:
+        def put_nowait(self, event):
+            captured.append(event)
+
+    monkeypatch.setattr(audit, "AUDIT_ENABLED", True)
+    monkeypatch.setattr(audit, "_ensure_writer", lambda: _Queue())
+    return captured
+
+@pytest.fixture
+def one_thread(monkeypatch, clean_store):
+    monkeypatch.setattr(jobs, "JOBS_THREADS", 1)
+    monkeypatch.setattr(jobs, "_executor", None)
+    yield
+    jobs._pool().shutdown(wait=False)
+
+def _imap_ms(event):
+    return event[5]
+
+def _record(outcome):
+    def on_finish(status):
+        audit.record("netflix", "a@b.com", outcome, 0.1)
+    return on_finish
+
+def _with_imap(result):
+    def lookup():
+        with audit.imap_timer():
+            time.sleep(0.01)
+        return result
+    return lookup
+
+def _submit(lookup, on_finish=None):
+    return jobs.submit(lookup, deadline_seconds=5, not_found=None, error=None, on_finish=on_finish)
+
+def test_request_scope_discards_unrecorded_imap_time(events):
+    token = audit.start()
+    with audit.imap_timer():
+        pass
+    audit.end(token)
+    audit.record("netflix", "a@b.com", "hit", 0.1)
+    assert _imap_ms(events[0]) is None
+
+def test_imap_time_stays_with_its_job(events, one_thread):
+    # Mesma thread do pool: o tempo do primeiro job (que não registra nada) não vai para o segundo
+    first = _submit(_with_imap({"code": "1"}))
+    assert jobs.wait(first, 2)["status"] == "done"
+    second = _submit(lambda: {"code": "2"}, on_finish=_record("second"))
+    assert jobs.wait(second, 2)["status"] == "done"
+    third = _submit(_with_imap({"code": "3"}), on_finish=_record("third"))
+    assert jobs.wait(third, 2)["status"] == "done"
+
+    by_outcome = {e[3]: e for e in events}
+    assert _imap_ms(by_outcome["second"]) is None
+    assert _imap_ms(by_outcome["third"]) >= 10
+
+def test_async_job_records_its_imap_time(events, clean_store):
+    async def lookup():
+        with audit.imap_timer():
+            await asyncio.sleep(0.01)
+        return {"code": "1"}
+
+    async def run():
+        job_id = await jobs.submit_async(lookup, 5, None, None, on_finish=_record("hit"))
+        return await jobs.wait_async(job_id, 2)
+
+    assert asyncio.run(run())["status"] == "done"
+    assert _imap_ms(events[0]) >= 10
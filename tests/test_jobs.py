@@ -0,0 +1,79 @@
+"""Jobs de busca: espera entre tentativas fora do pool e tentativa compartilhada por conta."""
+import threading
+import time
+
+import pytest
+
+import jobs
+
+@pytest.fixture
+def pool(monkeypatch, clean_store):
+    monkeypatch.setattr(jobs, "JOBS_THREADS", 2)
+    monkeypatch.setattr(jobs, "JOBS_RETRY_SECONDS", 0.05)
+    monkeypatch.setattr(jobs, "_executor", None)
+    yield
+    jobs._pool().shutdown(wait=False)
+
+def _submit(lookup, key=None, finished=None):
+    return jobs.submit(lookup, deadline_seconds=5, not_found={"html": "nada"}, error={"html": "erro"},
+                       key=key, on_finish=finished)
+
+def test_retry_wait_does_not_hold_the_pool(pool):
+    calls = []
+    quick_done = []
+
+    def slow_mail():
+        calls.append(time.monotonic())
+        return {"code": "1234"} if len(calls) >= 4 else None
+
+    waiting = _submit(slow_mail)
+    blocker = threading.Event()
+    # A outra thread do pool fica ocupada: sobra só a que o primeiro job largou entre tentativas
+    busy = _submit(lambda: blocker.wait(3) and {"code": "0000"})
+    time.sleep(0.02)
+    quick = _submit(lambda: {"code": "9999"}, finished=lambda status: quick_done.append(time.monotonic()))
+    assert jobs.wait(quick, 1)["result"] == {"code": "9999"}
+    assert jobs.wait(waiting, 3)["result"] == {"code": "1234"}
+    assert len(calls) == 4
+    assert quick_done[0] < calls[1]
+    blocker.set()
+    assert jobs.wait(busy, 2)["status"] == "done"
+
+def test_jobs_of_the_same_account_share_the_attempt(pool):
+    release = threading.Event()
+    calls = []
+    statuses = []
+
+    def scan():
+        calls.append(1)
+        release.wait(2)
+        return {"code": "4321"}
+
+    first = _submit(scan, key=("netflix", "a@b.com"), finished=statuses.append)
+    time.sleep(0.05)
+    second = _submit(scan, key=("netflix", "a@b.com"), finished=statuses.append)
+    release.set()
+    assert jobs.wait(first, 2)["result"] == {"code": "4321"}
+    assert jobs.wait(second, 2)["result"] == {"code": "4321"}
+    assert statuses == ["done", "done"]
+    assert len(calls) == 1
+
+def test_failed_lookup_ends_with_error_at_deadline(pool, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_RETRY_SECONDS", 5)
+
+    def broken():
+        raise OSError("imap down")
+
+    job_id = _submit(broken)
+    assert jobs.wait(job_id, 2) == {"job_id": job_id, "status": "error", "result": {"html": "erro"}}
+
+def test_api_lookup_creates_the_job_and_polls_it(pool, admin_client, monkeypatch):
+    import app as web
+    monkeypatch.setattr(web, "_lookup_code", lambda service, email: {"code": "2468"})
+    admin_client.post("/accounts", data={"platform": "netflix", "email": "api@exemplo.com", "password": "senha123"})
+
+    resp = admin_client.post("/api/lookup", json={"service": "netflix", "email": "api@exemplo.com", "senha": "senha123"})
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
+    polled = admin_client.get(f"/api/lookup/{job_id}?wait=5").get_json()
+    assert (polled["status"], polled["result"]) == ("done", {"code": "2468"})
@@ -0,0 +1,60 @@
+"""leitor_async encontra o mesmo que o leitor síncrono (uma caixa e várias)."""
+import asyncio
+
+import pytest
+
+import leitor
+import leitor_async
+import services
+from conftest import FakeImapServer, FakeMailbox, make_email
+
+TARGET = "cliente@exemplo.com"
+
+def _mailbox(srv) -> leitor.Mailbox:
+    return leitor.Mailbox("127.0.0.1", srv.port, "u", "p", "INBOX", ssl=False)
+
+def _both(target, *args):
+    sync = leitor._find_login_emails(target, *args)
+    leitor._close_pools()
+    async_ = asyncio.run(leitor_async._find_login_emails(target, *args))
+    return sync, async_
+
+@pytest.fixture
+def two_servers():
+    boxes = [FakeMailbox(), FakeMailbox()]
+    servers = [FakeImapServer({"INBOX": b}).start() for b in boxes]
+    yield servers, boxes
+    for srv in servers:
+        srv.stop()
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_single_mailbox_same_result(imap_server, clean_store, monkeypatch, cache):
+    srv, box = imap_server
+    monkeypatch.setattr(leitor, "LEITOR_CACHE", cache)
+    box.append(make_email("Netflix: Your sign-in code", "Netflix <info@account.netflix.com>", TARGET, "Code 1111"))
+    box.append(make_email("Promo", "promo@x.com", TARGET, "noise"))
+    plan = {_mailbox(srv): ["netflix", "disney"]}
+
+    sync, async_ = _both(TARGET, 7, 50, services.MATCHER, plan)
+    assert set(sync) == set(async_) == {"netflix"}
+    assert sync["netflix"][0] == async_["netflix"][0] == "Netflix: Your sign-in code"
+
+def test_fanout_merges_mailboxes_and_ignores_a_broken_one(two_servers, clean_store):
+    (a, b), (box_a, box_b) = two_servers
+    box_a.append(make_email("Netflix: Your sign-in code", "Netflix <info@account.netflix.com>", TARGET, "Code 2222"))
+    box_b.append(make_email("Netflix: Your sign-in code", "Netflix <info@account.netflix.com>", TARGET, "Code 3333"))
+    box_b.append(make_email("Tu código de acceso único para Disney+", "Disney+ <disneyplus@trx.mail2.disneyplus.com>",
+                            TARGET, "Código 4444"))
+    broken = leitor.Mailbox("127.0.0.1", 1, "u", "p", "INBOX", ssl=False)
+    plan = {_mailbox(a): ["netflix"], _mailbox(b): ["netflix", "disney"], broken: ["netflix"]}
+
+    sync, async_ = _both(TARGET, 7, 50, services.MATCHER, plan)
+    assert set(sync) == set(async_) == {"netflix", "disney"}
+    assert "4444" in sync["disney"][2] and "4444" in async_["disney"][2]
+
+def test_fanout_raises_when_no_mailbox_answers(clean_store):
+    broken = {leitor.Mailbox("127.0.0.1", port, "u", "p", "INBOX", ssl=False): ["netflix"] for port in (1, 2)}
+    with pytest.raises(OSError):
+        leitor._find_login_emails(TARGET, 7, 50, services.MATCHER, broken)
+    with pytest.raises(OSError):
+        asyncio.run(leitor_async._find_login_emails(TARGET, 7, 50, services.MATCHER, broken))
@@ -0,0 +1,114 @@
+"""Cache local do leitor: checkpoint por UID e mesmos candidatos com e sem cache."""
+import pytest
+
+import leitor
+import services
+
+from conftest import make_email
+
+TARGET = "cliente@exemplo.com"
+
+class _FlakyImap:
+    """Sessão IMAP real em que os FETCH de número listado em `fail` respondem NO."""
+
+    def __init__(self, imap, fail=()):
+        self.imap = imap
+        self.fail = set(fail)
+        self.fetches = 0
+        self.uidvalidity = imap.uidvalidity
+
+    def uid(self, command, *args):
+        if command == "FETCH":
+            self.fetches += 1
+            if self.fetches in self.fail:
+                return "NO", [None]
+        return self.imap.uid(command, *args)
+
+def _mailbox(srv) -> leitor.Mailbox:
+    return leitor.Mailbox("127.0.0.1", srv.port, "u", "p", "INBOX", ssl=False)
+
+def _state(source: str) -> tuple[int, set[int]]:
+    db = leitor._cache()
+    row = db.execute("SELECT last_uid FROM mailbox_state WHERE source = ?", (source,)).fetchone()
+    return (row[0] if row else None), leitor._cached_uids(source, 0)
+
+def _fill(box, n: int) -> None:
+    for i in range(n):
+        box.append(make_email(f"Newsletter {i}", "news@x.com", TARGET, "noise"))
+
+def test_failed_fetch_keeps_checkpoint_below_missing_uids(imap_server, clean_store):
+    srv, box = imap_server
+    _fill(box, 150)
+    mailbox = _mailbox(srv)
+    since = leitor._since(7)
+    imap = leitor._connect_select(mailbox)
+    try:
+        # Lote 1 = 100 mais recentes (51..150) falha; lote 2 = 1..50 é gravado
+        leitor._sync_headers(_FlakyImap(imap, fail={1}), mailbox.key, since, 200)
+        last_uid, cached = _state(mailbox.key)
+        assert cached == set(range(1, 51))
+        assert last_uid == 50
+
+        # Na próxima sincronização só os que faltam saem do servidor
+        flaky = _FlakyImap(imap)
+        leitor._sync_headers(flaky, mailbox.key, since, 200)
+        last_uid, cached = _state(mailbox.key)
+        assert cached == set(range(1, 151))
+        assert last_uid == 150
+        assert flaky.fetches == 1
+    finally:
+        leitor._logout_quietly(imap)
+
+def test_limit_does_not_skip_older_messages(imap_server, clean_store):
+    srv, box = imap_server
+    _fill(box, 30)
+    mailbox = _mailbox(srv)
+    since = leitor._since(7)
+    imap = leitor._connect_select(mailbox)
+    try:
+        leitor._sync_headers(imap, mailbox.key, since, 10)
+        assert _state(mailbox.key) == (0, set(range(21, 31)))
+        leitor._sync_headers(imap, mailbox.key, since, 10)
+        assert _state(mailbox.key) == (0, set(range(11, 31)))
+        leitor._sync_headers(imap, mailbox.key, since, 10)
+        assert _state(mailbox.key) == (30, set(range(1, 31)))
+    finally:
+        leitor._logout_quietly(imap)
+
+def test_sync_checkpoint_treats_expunged_uid_as_seen():
+    # FETCH OK sem o UID 3 (apagado): não segura o checkpoint; o UID 5 (FETCH falhou) segura
+    assert leitor._sync_checkpoint(0, [b"1", b"2", b"3", b"4"], {1, 2, 3, 4}) == 4
+    assert leitor._sync_checkpoint(2, [b"3", b"4", b"5", b"6"], {3, 4, 6}) == 4
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_cache_and_server_return_the_same_code_email(imap_server, clean_store, monkeypatch, cache):
+    srv, box = imap_server
+    box.append(make_email("Netflix: Your sign-in code", "Netflix <info@account.netflix.com>", TARGET, "Code 4321"))
+    # Mais ruído para o mesmo destinatário do que o max_scan
+    for i in range(40):
+        box.append(make_email(f"Promo {i}", "promo@x.com", TARGET, "noise"))
+    monkeypatch.setattr(leitor, "LEITOR_CACHE", cache)
+
+    found = leitor._scan_mailbox(_mailbox(srv), TARGET, 7, 20, services.MATCHER, ["netflix"])
+    assert found["netflix"][0] == "Netflix: Your sign-in code"
+
+def test_cache_where_applies_search_criteria(clean_store):
+    since = leitor._since(7)
+    criteria = leitor._criteria(
+        since, subject_terms=["Tu código de acceso"], from_terms=["disney"],
+        recipient=TARGET, forbidden_terms=["100%_off"],
+    )
+    db = leitor._cache()
+    rows = [
+        ("s", 1, "Tu CÓDIGO de acceso único", "Disney+ <d@disneyplus.com>", TARGET),
+        ("s", 2, "Tu código de acceso único", "Disney+ <d@disneyplus.com>", "outro@exemplo.com"),
+        ("s", 3, "Tu código de acceso 100%_off", "Disney+ <d@disneyplus.com>", TARGET),
+        ("s", 4, "Newsletter", "Disney+ <d@disneyplus.com>", TARGET),
+        ("s", 5, "Tu código de acceso único", "promo@x.com", f"a@b.com {TARGET}"),
+    ]
+    db.executemany(
+        "INSERT INTO message_headers VALUES (?, ?, ?, ?, ?, ?)",
+        [r + (since.timestamp() + 60,) for r in rows],
+    )
+    uids = [int(c[0]) for c in leitor._cached_candidates("s", criteria, 10)]
+    assert uids == [1]
@@ -0,0 +1,115 @@
+"""Migração 9: backfill em lotes retomável e contas duplicadas recusadas, não apagadas."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import account_search
+import migrations
+
+T0 = datetime(2024, 1, 1)
+
+@pytest.fixture
+def engine_v8(tmp_path, monkeypatch):
+    """Banco novo no schema anterior à migração 9."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}", future=True)
+    with monkeypatch.context() as m:
+        m.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:8])
+        m.setattr(migrations, "LATEST", 8)
+        migrations.migrate(engine)
+    yield engine
+    engine.dispose()
+
+def _insert(engine, rows) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO streaming_accounts (platform, email, password_enc, notes, created_at)
+                VALUES (:p, :e, :pw, :n, :t)
+            """),
+            [{"p": p, "e": e, "pw": pw, "n": n, "t": t} for p, e, pw, n, t in rows],
+        )
+
+def _accounts(engine) -> list[tuple]:
+    with engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(text(
+            "SELECT id, platform, email, password_enc, notes FROM streaming_accounts ORDER BY id"
+        ))]
+
+def _has_unique_index(engine) -> bool:
+    return "uq_streaming_accounts_canonical" in {i["name"] for i in inspect(engine).get_indexes("streaming_accounts")}
+
+def test_duplicates_block_the_unique_index_until_merged(engine_v8):
+    _insert(engine_v8, [
+        ("hbomax", "Cliente@x.com", "senha-antiga", "conta 1", T0),
+        ("max", "cliente@x.com", "senha-nova", "conta 2", T0 + timedelta(days=1)),
+        ("netflix", "outro@x.com", "s", None, T0),
+    ])
+    before = _accounts(engine_v8)
+
+    with pytest.raises(migrations.DuplicateAccounts) as exc:
+        migrations.migrate(engine_v8)
+    assert exc.value.groups == [("max", "cliente@x.com", 2)]
+    assert "merge-duplicate-accounts" in str(exc.value)
+    assert _accounts(engine_v8) == before
+    assert not _has_unique_index(engine_v8)
+    assert migrations.current_version(engine_v8) == 8
+
+    # Sem --apply só lista
+    listed = []
+    assert migrations.merge_duplicate_accounts(engine_v8, log=listed.append) == 1
+    assert _accounts(engine_v8) == before
+
+    logged = []
+    assert migrations.merge_duplicate_accounts(engine_v8, log=logged.append, apply=True) == 1
+    assert logged == listed
+    dropped = json.loads(logged[0])
+    assert (dropped["dropped_id"], dropped["platform"], dropped["email"], dropped["password_enc"]) == (
+        before[0][0], "hbomax", "Cliente@x.com", "senha-antiga")
+    assert dropped["kept_id"] == before[1][0]
+    assert dropped["created_at"].startswith("2024-01-01")
+    assert _accounts(engine_v8) == [
+        (before[1][0], "max", "cliente@x.com", "senha-nova", "conta 2 | conta 1"),
+        before[2],
+    ]
+
+    assert migrations.migrate(engine_v8) == [9]
+    assert _has_unique_index(engine_v8)
+    assert migrations.current_version(engine_v8) == 9
+
+def test_backfill_commits_each_batch_and_resumes(engine_v8, monkeypatch):
+    _insert(engine_v8, [("amazon", f"c{i}@X.com", "s", None, T0) for i in range(7)])
+    monkeypatch.setattr(migrations, "_BACKFILL_BATCH", 2)
+    real_key = account_search.account_key
+    calls = []
+
+    def failing_key(platform, email):
+        calls.append(email)
+        if len(calls) == 5:
+            raise RuntimeError("queda no meio do backfill")
+        return real_key(platform, email)
+
+    monkeypatch.setattr(account_search, "account_key", failing_key)
+    with pytest.raises(RuntimeError):
+        migrations.migrate(engine_v8)
+    with engine_v8.connect() as conn:
+        filled = conn.execute(text(
+            "SELECT id FROM streaming_accounts WHERE platform_canonical IS NOT NULL ORDER BY id"
+        )).scalars().all()
+    # Os dois lotes completos ficaram gravados; o terceiro voltou atrás
+    assert len(filled) == 4
+    assert migrations.current_version(engine_v8) == 8
+
+    def counting_key(platform, email):
+        calls.append(email)
+        return real_key(platform, email)
+
+    calls.clear()
+    monkeypatch.setattr(account_search, "account_key", counting_key)
+    assert migrations.migrate(engine_v8) == [9]
+    # A segunda execução só leu as linhas que faltavam
+    assert len(calls) == 3
+    with engine_v8.connect() as conn:
+        keys = conn.execute(text("SELECT DISTINCT platform_canonical FROM streaming_accounts")).scalars().all()
+    assert keys == ["prime"]
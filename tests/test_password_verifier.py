@@ -0,0 +1,67 @@
+"""Verificador de senha: chave obrigatória, sal por conta e regravação dos antigos."""
+import os
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+import app as web
+from conftest import ROOT
+
+def _insert(engine, platform: str, email: str, password: str, verifier: str = None) -> int:
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            INSERT INTO streaming_accounts
+                (platform, platform_canonical, email, email_norm, password_enc, password_verifier, notes, created_at)
+            VALUES (:p, :p, :e, :e, :pw, :pv, '', CURRENT_TIMESTAMP)
+            RETURNING id
+        """), {"p": platform, "e": email, "pw": web.enc(password), "pv": verifier}).scalar()
+
+def _account(engine, acc_id: int) -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(
+            text("SELECT id, platform, email, password_enc, password_verifier FROM streaming_accounts WHERE id = :i"),
+            {"i": acc_id},
+        ).mappings().one())
+
+def test_same_password_gives_different_verifiers_per_account():
+    a = web.password_verifier("netflix", "a@exemplo.com", "senha123")
+    b = web.password_verifier("netflix", "b@exemplo.com", "senha123")
+    c = web.password_verifier("disney", "a@exemplo.com", "senha123")
+    assert len({a, b, c}) == 3
+    # Aliases e maiúsculas: mesma conta, mesmo verificador
+    assert web.password_verifier("hbomax", "A@Exemplo.com", "x") == web.password_verifier("max", "a@exemplo.com", "x")
+
+def test_legacy_verifier_is_rewritten_on_correct_login(accounts):
+    acc_id = _insert(accounts, "netflix", "a@exemplo.com", "senha123", verifier="v1$deadbeef$00")
+    assert not web.check_password(_account(accounts, acc_id), "errada")
+    assert web.check_password(_account(accounts, acc_id), "senha123")
+
+    account = _account(accounts, acc_id)
+    assert account["password_verifier"] == web.password_verifier("netflix", "a@exemplo.com", "senha123")
+    assert web.check_password(account, "senha123")
+    assert not web.check_password(account, "errada")
+
+def test_app_does_not_start_without_verifier_key():
+    env = {k: v for k, v in os.environ.items() if k != "PASSWORD_VERIFIER_KEY"}
+    proc = subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=60)
+    assert proc.returncode != 0
+    assert "PASSWORD_VERIFIER_KEY" in proc.stderr
+
+def test_admin_edit_keeps_verifier_in_step_with_email(accounts, admin_client):
+    acc_id = _insert(accounts, "netflix", "a@exemplo.com", "senha123",
+                     verifier=web.password_verifier("netflix", "a@exemplo.com", "senha123"))
+
+    admin_client.post(f"/accounts/{acc_id}/edit", data={"email": "a@exemplo.com", "notes": "vip"})
+    assert _account(accounts, acc_id)["password_verifier"].startswith("v2$")
+
+    # Outro e-mail (outro sal): o verificador antigo sai e o próximo login correto regrava
+    admin_client.post(f"/accounts/{acc_id}/edit", data={"email": "b@exemplo.com"})
+    assert _account(accounts, acc_id)["password_verifier"] is None
+    assert web.check_password(_account(accounts, acc_id), "senha123")
+
+    admin_client.post(f"/accounts/{acc_id}/edit", data={"email": "b@exemplo.com", "password": "nova"})
+    account = _account(accounts, acc_id)
+    assert account["password_verifier"] == web.password_verifier("netflix", "b@exemplo.com", "nova")
+    assert web.check_password(account, "nova")